@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# Times the analysis scripts on synthetic IRMA runs of increasing size and records throughput and peak memory
+# Usage: python3 benchmark.py [--sizes 10 100 1000 10000] [--scripts contaminationAnalysis indelSummary] [options] (see -h)
+# Note: the synthetic runs take about 1 MB per sample with the default settings, so the 10,000 sample run needs ~10 GB of disk
+import sys, os, argparse, subprocess, threading, shutil, time, glob
+import generateIrmaRun
+
+
+
+
+##############################################################################
+#                                INITIALIZE                                  #
+##############################################################################
+
+repoDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+scriptsDir = os.path.join(repoDir, 'QuasispeciesAnalysis', 'Scripts')
+
+# How each script is started. All of them are run from inside the run folder.
+# 'runDirArg' scripts get the run folder as argument; 'answer' is fed to scripts that ask before proceeding.
+# 'output' tells which samples a script processed: a file pattern written in each sample folder ({sample} is the sample name),
+# or for scripts writing one table for the whole run, the table and its sample column
+benchmarkScripts = {
+    'contaminationAnalysis': {'path': os.path.join(repoDir, 'ContaminationAnalysis', 'contaminationAnalysis.py'), 'runDirArg': False, 'answer': None,
+                              'output': '{sample}_contaminationReport.txt'},
+    'H3N2_mutationFinder': {'path': os.path.join(scriptsDir, 'H3N2_mutationFinder.py'), 'runDirArg': False, 'answer': 'y\n',
+                            'output': os.path.join('mutations', '{sample}_mutations_*.txt')},
+    'consensusFromAllAlleles': {'path': os.path.join(scriptsDir, 'consensusFromAllAlleles.py'), 'runDirArg': True, 'answer': None,
+                                'output': '*_consensus.fa'},
+    'allSamplesToDataFrame': {'path': os.path.join(scriptsDir, 'allSamplesToDataFrame.py'), 'runDirArg': True, 'answer': None,
+                              'output': ('variantsWithMajor.txt', 'Sample')},
+    'phasesToFasta': {'path': os.path.join(scriptsDir, 'phasesToFasta.py'), 'runDirArg': False, 'answer': 'y\n',
+                      'output': os.path.join('minority', '{sample}_*_phasesToFasta.log')},
+    'indelSummary': {'path': os.path.join(scriptsDir, 'indelSummary.py'), 'runDirArg': True, 'answer': None,
+                     'output': ('indelSummary.txt', 'Sample')},
+}
+
+resultColumns = ['Script', 'Samples', 'Processed', 'Cache', 'Seconds', 'SamplesPerSecond', 'PeakRSS_MB', 'ExitStatus']
+
+
+
+
+##############################################################################
+#                                 FUNCTIONS                                  #
+##############################################################################
+
+def prepareRun(workDir, nSamples, generatorArgs, regenerate):
+    '''Returns the path of a synthetic run with nSamples samples. Runs from earlier benchmarks are reused'''
+    runDir = os.path.join(workDir, 'run_' + str(nSamples))
+    doneFile = os.path.join(runDir, '.generated')
+    settings = ' '.join([key + '=' + str(value) for key, value in sorted(generatorArgs.items())])
+
+    if not regenerate and os.path.exists(doneFile):
+        infile = open(doneFile, 'r')
+        oldSettings = infile.read().strip()
+        infile.close()
+        if oldSettings == settings:
+            return runDir
+
+    if os.path.exists(runDir):
+        shutil.rmtree(runDir)
+    print('Generating ' + str(nSamples) + ' samples in ' + runDir)
+    start = time.perf_counter()
+    generateIrmaRun.generateRun(runDir, nSamples, **generatorArgs)
+    print('Done in ' + str(round(time.perf_counter() - start, 1)) + ' s')
+
+    outfile = open(doneFile, 'w')
+    outfile.write(settings + '\n')
+    outfile.close()
+    return runDir
+
+
+
+def clearCaches(runDir):
+    '''Removes the .irmaCache sidecars so the next script has to parse the text tables'''
+    for sample in os.listdir(runDir):
+        cacheDir = os.path.join(runDir, sample, 'tables', '.irmaCache')
+        if os.path.isdir(cacheDir):
+            shutil.rmtree(cacheDir)
+
+
+
+def copyRun(runDir, copyDir):
+    '''Fresh copy of a run for one script, so files a script rewrites (e.g. the consensus files) are never input to the next one'''
+    if os.path.exists(copyDir):
+        shutil.rmtree(copyDir)
+    shutil.copytree(runDir, copyDir, ignore=shutil.ignore_patterns('.irmaCache'))
+
+
+
+def fileClock(runDir):
+    '''Current time as the file system stamps it (it can lag time.time() a little), read from a marker file'''
+    marker = os.path.join(runDir, '.benchmarkStart')
+    open(marker, 'w').close()
+    return os.path.getmtime(marker)
+
+
+
+def processedSamples(name, runDir, samples, startTime):
+    '''Number of samples the script wrote output for since startTime (from fileClock)'''
+    output = benchmarkScripts[name]['output']
+    if isinstance(output, tuple):
+        filename, column = output
+        filename = os.path.join(runDir, filename)
+        if not os.path.exists(filename) or os.path.getmtime(filename) < startTime:
+            return 0
+        infile = open(filename, 'r')
+        columnNo = infile.readline().rstrip('\n').split('\t').index(column)
+        found = set([line.split('\t')[columnNo] for line in infile if line.strip() != ''])
+        infile.close()
+        return len(found & set(samples))
+
+    processed = 0
+    for sample in samples:
+        pattern = os.path.join(runDir, glob.escape(sample), output.replace('{sample}', glob.escape(sample)))
+        if any([os.path.getmtime(filename) >= startTime for filename in glob.glob(pattern)]):
+            processed += 1
+    return processed
+
+
+
+def runScript(name, runDir, timeout, logFile):
+    '''Runs one script on a run folder. Returns wall time in seconds, peak RSS in MB and the exit status'''
+    script = benchmarkScripts[name]
+    command = [sys.executable, script['path']]
+    if script['runDirArg']:
+        command.append(runDir)
+
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=runDir, stdin=subprocess.PIPE, stdout=logFile, stderr=subprocess.STDOUT)
+    timer = threading.Timer(timeout, process.kill) if timeout > 0 else None
+    if timer is not None:
+        timer.start()
+    if script['answer'] is not None:
+        process.stdin.write(script['answer'].encode())
+    process.stdin.close()
+
+    # wait4 gives the resource usage of this child only, unlike getrusage(RUSAGE_CHILDREN)
+    pid, status, usage = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status) #Keeps Popen from waiting for it again
+    if timer is not None:
+        timer.cancel()
+
+    return seconds, usage.ru_maxrss / 1024, process.returncode
+
+
+
+def writeResult(outfile, row):
+    outfile.write('\t'.join([str(value) for value in row]) + '\n')
+    outfile.flush()
+
+
+
+
+##############################################################################
+#                                   MAIN                                     #
+##############################################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the analysis scripts on synthetic IRMA runs of increasing size.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000], help='Number of samples in each run (default: 10 100 1000 10000)')
+    parser.add_argument('--scripts', nargs='+', default=list(benchmarkScripts), choices=list(benchmarkScripts), help='Scripts to time (default: all)')
+    parser.add_argument('--workDir', default='benchmarkRuns', help='Folder for the synthetic runs and script logs (default: benchmarkRuns)')
+    parser.add_argument('-o', '--outfile', default='benchmarkResults.tsv', help='Table with the timings (default: benchmarkResults.tsv)')
+    parser.add_argument('--warm', action='store_true', help='Also time a second run of each script with the table cache in place')
+    parser.add_argument('--timeout', type=float, default=0, help='Kill a script after this many seconds. 0 means no limit (default: 0)')
+    parser.add_argument('--regenerate', action='store_true', help='Make new synthetic runs even if matching ones exist')
+    parser.add_argument('--depth', type=int, default=2000)
+    parser.add_argument('--variantDensity', type=float, default=0.01)
+    parser.add_argument('--indelRate', type=float, default=0.002)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    generatorArgs = {'depth': args.depth, 'variantDensity': args.variantDensity, 'indelRate': args.indelRate, 'seed': args.seed}
+    workDir = os.path.abspath(args.workDir)
+    os.makedirs(workDir, exist_ok=True)
+
+    outfile = open(args.outfile, 'w')
+    writeResult(outfile, resultColumns)
+    print('\t'.join(resultColumns))
+
+    for nSamples in sorted(args.sizes):
+        runDir = prepareRun(workDir, nSamples, generatorArgs, args.regenerate)
+        samples = sorted([entry for entry in os.listdir(runDir) if os.path.isdir(os.path.join(runDir, entry, 'tables'))])
+
+        for name in args.scripts:
+            scriptRunDir = os.path.join(workDir, 'run_' + str(nSamples) + '_' + name)
+            copyRun(runDir, scriptRunDir)
+            logFile = open(os.path.join(workDir, name + '_' + str(nSamples) + '.log'), 'w')
+            rounds = ['cold', 'warm'] if args.warm else ['cold']
+            for cache in rounds:
+                if cache == 'cold':
+                    clearCaches(scriptRunDir)
+                startTime = fileClock(scriptRunDir)
+                seconds, peakRSS, status = runScript(name, scriptRunDir, args.timeout, logFile)
+                processed = processedSamples(name, scriptRunDir, samples, startTime)
+                row = [name, nSamples, processed, cache, round(seconds, 3), round(processed / seconds, 2), round(peakRSS, 1), status]
+                writeResult(outfile, row)
+                print('\t'.join([str(value) for value in row]))
+            logFile.close()
+            shutil.rmtree(scriptRunDir)
+
+    outfile.close()
+    print('Results written to ' + args.outfile)
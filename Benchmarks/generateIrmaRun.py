@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# Makes a synthetic IRMA run folder, so the scripts can be timed on any number of samples
+# Usage: python3 generateIrmaRun.py <run directory> [-n samples] [options] (see -h)
+import sys, os, argparse, random, json
+
+
+
+
+##############################################################################
+#                                INITIALIZE                                  #
+##############################################################################
+
+# Full segment lengths (same as phasesToFasta.py). The genes are placed where the H3N2 annotation has them
+segmentLengths = {'PB2': 2341, 'PB1': 2341, 'PA': 2233, 'HA_H3': 1778, 'NP': 1565, 'NA_N2': 1413, 'MP': 1027, 'NS': 890}
+annotationFile = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common', 'annotations', 'H3N2.json')
+infile = open(annotationFile, 'r')
+annotatedGenes = json.load(infile)['segments']
+infile.close()
+
+# Records put in the secondary data of samples with secondary reads
+secondaryRecords = ['A_HA_H1', 'A_NA_N1', 'B_HA', 'B_NA']
+
+bases = 'ACGT'
+stopCodons = ['TAA', 'TAG', 'TGA']
+
+variantsHeader = ('Reference_Name\tPosition\tTotal\tMajor Allele\tMinority Allele\tConsensus Count\tMinority Count\t'
+                  'Consensus Frequency\tMinority Frequency\tConsensus Average Quality\tMinority Average Quality\t'
+                  'ConfidenceNotMacErr\tPairedUB\tQualityUB\tPhase\n')
+allAllelesHeader = 'Reference_Name\tPosition\tAllele\tCount\tTotal\tFrequency\tAverage_Quality\tConfidenceNotMacErr\tPairedUB\tQualityUB\tAllele_Type\n'
+insertionsHeader = 'Reference_Name\tUpstream_Position\tInsert\tContext\tCalled\tCount\tTotal\tFrequency\tAverage_Quality\tConfidenceNotMacErr\tPairedUB\tQualityUB\n'
+deletionsHeader = 'Reference_Name\tUpstream_Position\tLength\tContext\tCalled\tCount\tTotal\tFrequency\tPairedUB\n'
+
+
+
+
+##############################################################################
+#                                 FUNCTIONS                                  #
+##############################################################################
+
+def makeSequence(rng, segment):
+    '''Random segment where every gene of the annotation (overlapping and spliced ones too) starts with ATG,
+    ends with a stop codon and has no stop codon in between'''
+    sequence = rng.choices(bases, k=segmentLengths[segment])
+    fixed = set()
+    # 0-based positions of each gene, exons joined
+    genes = [[position for start, stop in gene['cds'] for position in range(start, stop)] for gene in annotatedGenes[segment]]
+    for positions in genes:
+        for position, base in zip(positions[:3] + positions[-3:], 'ATG' + rng.choice(stopCodons)):
+            sequence[position] = base
+            fixed.add(position)
+
+    # Mutate the internal stop codons away. A change can make a stop in an overlapping gene, so repeat until there are none
+    for attempt in range(1000):
+        internalStops = [positions[i:i+3] for positions in genes for i in range(3, len(positions) - 3, 3)
+                         if ''.join([sequence[position] for position in positions[i:i+3]]) in stopCodons]
+        if len(internalStops) == 0:
+            return ''.join(sequence)
+        for codon in internalStops:
+            position = rng.choice([position for position in codon if position not in fixed])
+            sequence[position] = rng.choice([base for base in bases if base != sequence[position]])
+
+    raise ValueError('Could not make a ' + segment + ' sequence without internal stop codons')
+
+
+
+def makeVariants(rng, sequence, depth, variantDensity):
+    '''Picks minority variant sites. Returns a dict of position: [minority base, count, total, frequency]'''
+    variants = dict()
+    nVariants = min(len(sequence), int(round(len(sequence) * variantDensity * rng.uniform(0.5, 1.5))))
+    for position in sorted(rng.sample(range(1, len(sequence) + 1), nVariants)):
+        total = max(1, int(rng.gauss(depth, depth * 0.2)))
+        # Most minority variants are rare; a few are at high frequency
+        frequency = min(0.49, 10 ** rng.uniform(-2.5, -0.3))
+        count = max(1, int(total * frequency))
+        minority = rng.choice([base for base in bases if base != sequence[position - 1]])
+        variants[position] = [minority, count, total, count / total]
+    return variants
+
+
+
+def writeConsensus(samplePath, sample, segment, sequence):
+    outfile = open(os.path.join(samplePath, segment + '_consensus.fna'), 'w')
+    outfile.write('>' + sample + '_' + segment + '\n')
+    for i in range(0, len(sequence), 60):
+        outfile.write(sequence[i:i+60] + '\n')
+    outfile.close()
+
+
+
+def writeVariants(tablesPath, record, variants, sequence, rng):
+    lines = [variantsHeader]
+    for position, (minority, count, total, frequency) in variants.items():
+        consensusCount = total - count
+        lines.append('\t'.join([record, str(position), str(total), sequence[position - 1], minority, str(consensusCount), str(count),
+                                '%.6f' % (consensusCount / total), '%.6f' % frequency, '%.2f' % rng.uniform(33, 38),
+                                '%.2f' % rng.uniform(25, 38), '%.6f' % rng.uniform(0.9, 1), '%.6f' % rng.uniform(0, 0.05),
+                                '%.6f' % rng.uniform(0, 0.01), str(rng.randint(1, 3))]) + '\n')
+    outfile = open(os.path.join(tablesPath, record + '-variants.txt'), 'w')
+    outfile.write(''.join(lines))
+    outfile.close()
+
+
+
+def writeAllAlleles(tablesPath, record, variants, sequence, depth, rng):
+    '''One consensus row per position and one minority row per variant site'''
+    lines = [allAllelesHeader]
+    for position in range(1, len(sequence) + 1):
+        if position in variants:
+            minority, count, total, frequency = variants[position]
+        else:
+            minority, count, total, frequency = None, 0, max(1, int(rng.gauss(depth, depth * 0.2))), 0
+        lines.append('\t'.join([record, str(position), sequence[position - 1], str(total - count), str(total),
+                                '%.6f' % ((total - count) / total), '%.2f' % rng.uniform(33, 38), 'NA', 'NA', 'NA', 'Consensus']) + '\n')
+        if minority is not None:
+            lines.append('\t'.join([record, str(position), minority, str(count), str(total), '%.6f' % frequency,
+                                    '%.2f' % rng.uniform(25, 38), '%.6f' % rng.uniform(0.9, 1), '%.6f' % rng.uniform(0, 0.05),
+                                    '%.6f' % rng.uniform(0, 0.01), 'Minority']) + '\n')
+    outfile = open(os.path.join(tablesPath, record + '-allAlleles.txt'), 'w')
+    outfile.write(''.join(lines))
+    outfile.close()
+
+
+
+def writeIndels(tablesPath, record, sequence, depth, indelRate, rng):
+    '''Insertions and deletions with the 5 bases of context on each side, like IRMA writes them'''
+    insertionLines = [insertionsHeader]
+    deletionLines = [deletionsHeader]
+    nIndels = int(round(len(sequence) * indelRate * rng.uniform(0.5, 1.5)))
+    for upstream in sorted(rng.sample(range(6, len(sequence) - 20), min(nIndels, len(sequence) - 26))):
+        total = max(1, int(rng.gauss(depth, depth * 0.2)))
+        count = max(1, int(total * 10 ** rng.uniform(-2.5, -0.5)))
+        called = 'TRUE' if count / total > 0.05 else 'FALSE'
+        if rng.random() < 0.5:
+            insert = ''.join(rng.choices(bases, k=rng.choice([1, 3, 6])))
+            context = sequence[upstream-5:upstream] + insert.lower() + sequence[upstream:upstream+5]
+            insertionLines.append('\t'.join([record, str(upstream), insert, context, called, str(count), str(total), '%.6f' % (count / total),
+                                             '%.2f' % rng.uniform(25, 38), '%.6f' % rng.uniform(0.9, 1), 'NA', 'NA']) + '\n')
+        else:
+            length = rng.choice([1, 3, 9])
+            context = sequence[upstream-5:upstream] + '-' * length + sequence[upstream+length:upstream+length+5]
+            deletionLines.append('\t'.join([record, str(upstream), str(length), context, called, str(count), str(total),
+                                            '%.6f' % (count / total), 'NA']) + '\n')
+
+    for suffix, lines in [('-insertions.txt', insertionLines), ('-deletions.txt', deletionLines)]:
+        outfile = open(os.path.join(tablesPath, record + suffix), 'w')
+        outfile.write(''.join(lines))
+        outfile.close()
+
+
+
+def writeReadCounts(tablesPath, patternCounts, secondaryCounts, rng):
+    primaryReads = sum(patternCounts.values()) * 2
+    secondaryReads = sum(secondaryCounts.values()) * 2
+    lines = ['Record\tReads\tPatterns\tPairsAndWidows\n',
+             '1-initial\t' + str(int((primaryReads + secondaryReads) * 1.2)) + '\tNA\tNA\n',
+             '2-passQC\t' + str(int((primaryReads + secondaryReads) * 1.1)) + '\tNA\tNA\n',
+             '3-match\t' + str(primaryReads + secondaryReads) + '\tNA\tNA\n',
+             '3-nomatch\t' + str(rng.randint(0, 1000)) + '\tNA\tNA\n']
+    for record, patterns in patternCounts.items():
+        lines.append('4-' + record + '\t' + str(patterns * 2) + '\t' + str(patterns) + '\t' + str(patterns * 2) + '\n')
+    for record, patterns in secondaryCounts.items():
+        lines.append('5-' + record + '\t' + str(patterns * 2) + '\t' + str(patterns) + '\t' + str(patterns * 2) + '\n')
+    outfile = open(os.path.join(tablesPath, 'READ_COUNTS.txt'), 'w')
+    outfile.write(''.join(lines))
+    outfile.close()
+
+
+
+def generateSample(runDir, sample, segments, depth, variantDensity, indelRate, secondary, secondaryAssembly, seed):
+    '''Writes one IRMA sample folder: tables/, the consensus of each segment and (maybe) secondary data'''
+    rng = random.Random(seed)
+    samplePath = os.path.join(runDir, sample)
+    tablesPath = os.path.join(samplePath, 'tables')
+    os.makedirs(tablesPath, exist_ok=True)
+
+    patternCounts = dict()
+    for segment in segments:
+        record = 'A_' + segment
+        sequence = makeSequence(rng, segment)
+        variants = makeVariants(rng, sequence, depth, variantDensity)
+
+        writeConsensus(samplePath, sample, segment, sequence)
+        writeVariants(tablesPath, record, variants, sequence, rng)
+        writeAllAlleles(tablesPath, record, variants, sequence, depth, rng)
+        writeIndels(tablesPath, record, sequence, depth, indelRate, rng)
+        patternCounts[record] = int(depth * len(sequence) / 300)
+
+    # IRMA always makes the secondary folder; it is empty when no reads matched other references
+    os.makedirs(os.path.join(samplePath, 'secondary'), exist_ok=True)
+    secondaryCounts = dict()
+    if secondary:
+        for record in rng.sample(secondaryRecords, rng.randint(1, len(secondaryRecords))):
+            secondaryCounts[record] = rng.randint(1, max(1, sum(patternCounts.values()) // 20))
+    if secondaryAssembly:
+        os.makedirs(os.path.join(samplePath, 'secondary_assembly'), exist_ok=True)
+
+    writeReadCounts(tablesPath, patternCounts, secondaryCounts, rng)
+
+
+
+def generateRun(runDir, nSamples, segments=list(segmentLengths), depth=2000, variantDensity=0.01, indelRate=0.002,
+                secondaryFraction=0.2, assemblyFraction=0.05, seed=1):
+    '''Writes nSamples synthetic IRMA sample folders to runDir. The same seed always gives the same run'''
+    rng = random.Random(seed)
+    os.makedirs(runDir, exist_ok=True)
+    sampleNames = []
+    for sampleNo in range(nSamples):
+        sample = 'Sample' + str(sampleNo + 1).zfill(len(str(nSamples)))
+        secondary = rng.random() < secondaryFraction
+        generateSample(runDir, sample, segments, depth, variantDensity, indelRate,
+                       secondary, secondary and rng.random() < assemblyFraction / max(secondaryFraction, 1e-9), rng.getrandbits(32))
+        sampleNames.append(sample)
+    return sampleNames
+
+
+
+
+##############################################################################
+#                                   MAIN                                     #
+##############################################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Make a synthetic IRMA run folder with READ_COUNTS, variants, allAlleles, '
+                                                 'insertions and deletions tables and a consensus per segment.')
+    parser.add_argument('runDir', help='Folder the sample folders are written to')
+    parser.add_argument('-n', '--samples', type=int, default=10, help='Number of samples (default: 10)')
+    parser.add_argument('--segments', nargs='+', default=list(segmentLengths), choices=list(segmentLengths), help='Segments to make (default: all eight)')
+    parser.add_argument('--depth', type=int, default=2000, help='Mean read depth (default: 2000)')
+    parser.add_argument('--variantDensity', type=float, default=0.01, help='Mean fraction of positions with a minority variant (default: 0.01)')
+    parser.add_argument('--indelRate', type=float, default=0.002, help='Mean number of indels per position (default: 0.002)')
+    parser.add_argument('--secondary', type=float, default=0.2, help='Fraction of samples with secondary data (default: 0.2)')
+    parser.add_argument('--secondaryAssembly', type=float, default=0.05, help='Fraction of samples with a secondary assembly (default: 0.05)')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed (default: 1)')
+    args = parser.parse_args()
+
+    if args.secondaryAssembly > args.secondary:
+        print('--secondaryAssembly can not be larger than --secondary, since only samples with secondary data get an assembly')
+        sys.exit(1)
+
+    sampleNames = generateRun(args.runDir, args.samples, args.segments, args.depth, args.variantDensity, args.indelRate,
+                              args.secondary, args.secondaryAssembly, args.seed)
+    print(str(len(sampleNames)) + ' samples written to ' + args.runDir)
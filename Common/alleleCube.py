@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# Cohort allele frequency cube: the allAlleles tables of all samples in memory-mapped .npy arrays
+# indexed by [sample, segment, position, base], so trajectories over days and per-sample slices only
+# read the bytes they need.
+# Usage: python3 alleleCube.py build <run directory> [--samples Day1_1 Day1_2 ...] [-p processes] [-o cube directory]
+#        python3 alleleCube.py trajectory <cube directory> <segment> <position>
+#        python3 alleleCube.py top <cube directory> [-n 20] [--segment HA_H3] [--minDepth 100]
+import sys, os, json, argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import irmaTables, annotationRegistry
+
+
+
+#------------------------------ LAYOUT -------------------------------#
+
+# Base axis of the cube. '-' holds deletions
+cubeBases = 'ACGT-'
+cubeDirName = 'alleleCube'
+
+# frequency (float32) and count (uint32) are [sample, segment, position, base], depth (uint32) is [sample, segment, position].
+# Position p is stored at index p - 1. Positions a segment doesn't have are 0
+cubeArrays = {'frequency': np.float32, 'count': np.uint32, 'depth': np.uint32}
+
+
+
+
+#------------------------------ BUILDING ------------------------------#
+
+def tablePath(runDir, sample, recordPrefix, segment):
+    return os.path.join(runDir, sample, 'tables', recordPrefix + segment + '-allAlleles.txt')
+
+
+
+def segmentLength(runDir, sample, recordPrefix, segment):
+    '''Highest position in an allAlleles table, 0 if the table is missing'''
+    try:
+        alleles = irmaTables.readTable(tablePath(runDir, sample, recordPrefix, segment))
+    except OSError:
+        return 0
+    return int(alleles['Position'].max()) if len(alleles) > 0 else 0
+
+
+
+def fillSample(cubeDir, runDir, sampleNo, sample, segments, recordPrefix):
+    '''Writes the allAlleles tables of one sample into its slice of the cube. Returns the segments that were missing'''
+    arrays = {name: np.load(os.path.join(cubeDir, name + '.npy'), mmap_mode='r+') for name in cubeArrays}
+    baseIndex = np.full(256, -1, dtype=np.int64)
+    for i, base in enumerate(cubeBases):
+        baseIndex[ord(base)] = i
+
+    missing = []
+    for segmentNo, segment in enumerate(segments):
+        try:
+            alleles = irmaTables.readTable(tablePath(runDir, sample, recordPrefix, segment))
+        except OSError:
+            missing.append(segment)
+            continue
+
+        positions = alleles['Position'].astype(np.int64) - 1
+        bases = baseIndex[np.frombuffer(np.ascontiguousarray(alleles['Allele']).astype('S1').tobytes(), dtype=np.uint8)]
+        known = (bases >= 0) & (positions >= 0) & (positions < arrays['depth'].shape[2])
+
+        arrays['frequency'][sampleNo, segmentNo, positions[known], bases[known]] = alleles['Frequency'][known]
+        arrays['count'][sampleNo, segmentNo, positions[known], bases[known]] = np.maximum(alleles['Count'][known], 0)
+        arrays['depth'][sampleNo, segmentNo, positions[known]] = np.maximum(alleles['Total'][known], 0)
+
+    for array in arrays.values():
+        array.flush()
+
+    return missing
+
+
+
+def buildCube(runDir, samples, subtype='H3N2', cubeDir=None, processes=1):
+    '''Converts the allAlleles tables of samples (in the order given) into a cube in cubeDir (default <runDir>/alleleCube)'''
+    annotation = annotationRegistry.loadAnnotation(subtype)
+    segments = annotation['segments']
+    recordPrefix = annotation['recordPrefix']
+    cubeDir = cubeDir if cubeDir is not None else os.path.join(runDir, cubeDirName)
+    os.makedirs(cubeDir, exist_ok=True)
+
+    # First pass finds the length of every segment. The parsed tables are cached by irmaTables, so the second pass is cheap
+    units = [(sample, segment) for sample in samples for segment in segments]
+    if processes == 1:
+        lengths = [segmentLength(runDir, sample, recordPrefix, segment) for sample, segment in units]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            lengths = list(pool.map(segmentLength, [runDir] * len(units), [unit[0] for unit in units],
+                                    [recordPrefix] * len(units), [unit[1] for unit in units], chunksize=16))
+    lengths = np.array(lengths, dtype=np.int64).reshape(len(samples), len(segments)).max(axis=0)
+    maxLength = max(int(lengths.max()), 1) if len(samples) > 0 else 1
+
+    # Empty arrays on disk, filled sample by sample
+    for name, dtype in cubeArrays.items():
+        shape = (len(samples), len(segments), maxLength) + ((len(cubeBases),) if name != 'depth' else ())
+        array = np.lib.format.open_memmap(os.path.join(cubeDir, name + '.npy'), mode='w+', dtype=dtype, shape=shape)
+        del array
+
+    if processes == 1:
+        missing = [fillSample(cubeDir, runDir, sampleNo, sample, segments, recordPrefix) for sampleNo, sample in enumerate(samples)]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            missing = list(pool.map(fillSample, [cubeDir] * len(samples), [runDir] * len(samples), range(len(samples)), samples,
+                                    [segments] * len(samples), [recordPrefix] * len(samples)))
+
+    meta = {'samples': list(samples), 'segments': segments, 'bases': cubeBases, 'lengths': [int(length) for length in lengths],
+            'subtype': subtype, 'missing': {sample: segmentList for sample, segmentList in zip(samples, missing) if len(segmentList) > 0}}
+    outfile = open(os.path.join(cubeDir, 'meta.json'), 'w')
+    json.dump(meta, outfile, indent=1)
+    outfile.close()
+
+    return cubeDir
+
+
+
+
+#------------------------------ QUERYING ------------------------------#
+
+class AlleleCube:
+    '''Read-only view of a built cube. The arrays are memory mapped, so only the parts that are indexed are read from disk'''
+    def __init__(self, cubeDir):
+        infile = open(os.path.join(cubeDir, 'meta.json'), 'r')
+        meta = json.load(infile)
+        infile.close()
+
+        self.samples = meta['samples']
+        self.segments = meta['segments']
+        self.bases = meta['bases']
+        self.lengths = dict(zip(self.segments, meta['lengths']))
+        self.missing = meta['missing']
+        self.frequency = np.load(os.path.join(cubeDir, 'frequency.npy'), mmap_mode='r')
+        self.count = np.load(os.path.join(cubeDir, 'count.npy'), mmap_mode='r')
+        self.depth = np.load(os.path.join(cubeDir, 'depth.npy'), mmap_mode='r')
+
+
+    def sampleIndex(self, samples):
+        if samples is None:
+            return list(range(len(self.samples)))
+        return [self.samples.index(sample) for sample in samples]
+
+
+    def trajectory(self, segment, position, samples=None):
+        '''Frequency of every base at one position over the samples (in cube order or the order given).
+        Returns frequencies [sample, base] and depths [sample]'''
+        rows = self.sampleIndex(samples)
+        segmentNo = self.segments.index(segment)
+        return np.array(self.frequency[rows, segmentNo, position - 1]), np.array(self.depth[rows, segmentNo, position - 1])
+
+
+    def daySlice(self, sample, segment=None):
+        '''Frequencies [segment, position, base] and depths [segment, position] of one sample. Only one segment if given'''
+        sampleNo = self.samples.index(sample)
+        if segment is None:
+            return np.array(self.frequency[sampleNo]), np.array(self.depth[sampleNo])
+        segmentNo = self.segments.index(segment)
+        return np.array(self.frequency[sampleNo, segmentNo, :self.lengths[segment]]), np.array(self.depth[sampleNo, segmentNo, :self.lengths[segment]])
+
+
+    def topChangingSites(self, n=20, segment=None, samples=None, minDepth=100):
+        '''Sites whose base frequency changes most between the samples. Samples with depth below minDepth at a site are left out there.
+        Returns a list of (segment, position, base, lowest frequency, highest frequency) sorted by the change'''
+        rows = self.sampleIndex(samples)
+        segmentNumbers = range(len(self.segments)) if segment is None else [self.segments.index(segment)]
+
+        sites = []
+        for segmentNo in segmentNumbers:
+            length = self.lengths[self.segments[segmentNo]]
+            frequency = np.array(self.frequency[rows, segmentNo, :length])
+            covered = (np.array(self.depth[rows, segmentNo, :length]) >= minDepth)[:, :, None]
+
+            # Sites need at least two samples with enough depth to change
+            highest = np.where(covered, frequency, -np.inf).max(axis=0)
+            lowest = np.where(covered, frequency, np.inf).min(axis=0)
+            change = np.where(covered.sum(axis=0) >= 2, highest - lowest, -np.inf)
+
+            best = np.argsort(change, axis=None)[::-1][:n]
+            for flatIndex in best:
+                position, baseNo = np.unravel_index(flatIndex, change.shape)
+                if np.isfinite(change[position, baseNo]):
+                    sites.append((self.segments[segmentNo], int(position) + 1, self.bases[baseNo],
+                                  float(lowest[position, baseNo]), float(highest[position, baseNo])))
+
+        sites.sort(key=lambda site: site[4] - site[3], reverse=True)
+        return sites[:n]
+
+
+
+
+#------------------------------ MAIN ------------------------------#
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build and query a memory-mapped allele frequency cube of a run.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='Convert the allAlleles tables of a run into a cube')
+    build.add_argument('runDir')
+    build.add_argument('--samples', nargs='+', help='Samples in the order they should have in the cube, e.g. by day (default: all sample folders, sorted)')
+    build.add_argument('--subtype', default='H3N2', choices=annotationRegistry.availableSubtypes())
+    build.add_argument('-o', '--cubeDir', help='Where the cube is written (default: <runDir>/alleleCube)')
+    build.add_argument('-p', '--processes', type=int, default=1, help='0 uses all CPUs (default: 1)')
+
+    trajectory = commands.add_parser('trajectory', help='Base frequencies of one position over all samples')
+    trajectory.add_argument('cubeDir')
+    trajectory.add_argument('segment')
+    trajectory.add_argument('position', type=int)
+
+    top = commands.add_parser('top', help='Sites with the largest frequency change between samples')
+    top.add_argument('cubeDir')
+    top.add_argument('-n', type=int, default=20)
+    top.add_argument('--segment')
+    top.add_argument('--minDepth', type=int, default=100)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        samples = args.samples
+        if samples is None:
+            samples = sorted([entry for entry in os.listdir(args.runDir) if os.path.isdir(os.path.join(args.runDir, entry, 'tables'))])
+        processes = args.processes if args.processes > 0 else os.cpu_count()
+        cubeDir = buildCube(args.runDir, samples, args.subtype, args.cubeDir, processes)
+        print('Cube of ' + str(len(samples)) + ' samples written to ' + cubeDir)
+
+    elif args.command == 'trajectory':
+        cube = AlleleCube(args.cubeDir)
+        frequencies, depths = cube.trajectory(args.segment, args.position)
+        print('Sample\tDepth\t' + '\t'.join(cube.bases))
+        for sample, frequency, depth in zip(cube.samples, frequencies, depths):
+            print(sample + '\t' + str(depth) + '\t' + '\t'.join(['%.4f' % value for value in frequency]))
+
+    else:
+        cube = AlleleCube(args.cubeDir)
+        print('Segment\tPosition\tBase\tLowest\tHighest')
+        for site in cube.topChangingSites(args.n, args.segment, minDepth=args.minDepth):
+            print('\t'.join([site[0], str(site[1]), site[2], '%.4f' % site[3], '%.4f' % site[4]]))
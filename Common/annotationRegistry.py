@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# Gene annotation of each subtype, read from annotations/<subtype>.json
+# Every segment is compiled into an interval index, so the genes hit by a whole array of
+# nucleotide positions (and the CDS offset, codon and frame in each gene) are found in one lookup.
+import os, json
+import numpy as np
+
+
+
+#------------------------------ REGISTRY -------------------------------#
+
+annotationDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'annotations')
+
+# Annotations already loaded in this process
+_loaded = dict()
+
+
+
+
+#------------------------------ FUNCTIONS ------------------------------#
+
+class SegmentIndex:
+    '''Interval index of one segment. For every position it holds the offset into each gene's (spliced) coding sequence'''
+    def __init__(self, segment, genes):
+        self.segment = segment
+        self.genes = [gene['gene'] for gene in genes]
+        self.cds = [[tuple(interval) for interval in gene['cds']] for gene in genes]
+        self.lengths = [sum([stop - start for start, stop in cds]) for cds in self.cds]
+
+        # Row per gene, column per 1-based position. -1 where the position is not in the gene
+        width = max([stop for cds in self.cds for start, stop in cds]) + 1
+        self.cdsOffsets = np.full((len(self.genes), width), -1, dtype=np.int64)
+        for geneNo, cds in enumerate(self.cds):
+            offset = 0
+            for start, stop in cds:
+                self.cdsOffsets[geneNo, start + 1:stop + 1] = np.arange(offset, offset + stop - start)
+                offset += stop - start
+
+
+    def lookup(self, positions):
+        '''Takes 1-based segment positions (array) and returns every hit as arrays of
+        position index, gene number, CDS offset (0-based), codon index and frame. Hits are sorted by gene'''
+        positions = np.asarray(positions, dtype=np.int64)
+        offsets = np.full((len(self.genes), len(positions)), -1, dtype=np.int64)
+        inRange = (positions >= 1) & (positions < self.cdsOffsets.shape[1])
+        offsets[:, inRange] = self.cdsOffsets[:, positions[inRange]]
+
+        geneNumbers, positionIndex = np.nonzero(offsets >= 0)
+        cdsOffsets = offsets[geneNumbers, positionIndex]
+
+        return positionIndex, geneNumbers, cdsOffsets, cdsOffsets // 3, cdsOffsets % 3
+
+
+    def geneSequence(self, geneNo, sequence):
+        '''Cuts the (spliced) coding sequence of a gene out of the segment sequence'''
+        return ''.join([sequence[start:stop] for start, stop in self.cds[geneNo]])
+
+
+
+def availableSubtypes():
+    '''Subtypes that have an annotation file'''
+    return sorted([filename[:-len('.json')] for filename in os.listdir(annotationDir) if filename.endswith('.json')])
+
+
+
+def loadAnnotation(subtype):
+    '''Reads the annotation of a subtype and compiles the segment indexes. Returns a dict with
+    subtype, recordPrefix, segments (in file order), index (SegmentIndex per segment) and missingGenes
+    (proteins of the subtype the file has no coordinates for, as dicts with gene, segment and reason)'''
+    if subtype in _loaded:
+        return _loaded[subtype]
+
+    filename = os.path.join(annotationDir, subtype + '.json')
+    if not os.path.exists(filename):
+        raise ValueError('No annotation for subtype ' + str(subtype) + '. Available: ' + ', '.join(availableSubtypes()))
+    infile = open(filename, 'r')
+    data = json.load(infile)
+    infile.close()
+
+    annotation = {'subtype': data['subtype'],
+                  'recordPrefix': data['recordPrefix'],
+                  'segments': list(data['segments']),
+                  'index': {segment: SegmentIndex(segment, genes) for segment, genes in data['segments'].items()},
+                  'missingGenes': data.get('missingGenes', [])}
+    _loaded[subtype] = annotation
+
+    return annotation
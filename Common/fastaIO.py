@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# FASTA reading and writing without Bio.SeqIO.
+# readFasta memory maps the file and gives (id, sequence bytes) per record, so no SeqRecord is made per entry.
+# readHeaders/readRecords give byte offsets of records and read them back by offset.
+# chunkBoundaries/mapChunks split a file at record starts, so big files (e.g. GISAID exports) can be parsed by several processes.
+# writeIndexedFasta writes multi-record FASTA with a samtools-style .fai index next to it, so single records
+# can be fetched (samtools faidx, pysam.FastaFile, fetchRecord) without reading the whole file.
+import os, mmap
+from concurrent.futures import ProcessPoolExecutor
+
+# Bytes removed from sequence lines
+whitespace = b' \t\r\n'
+
+
+#------------------------------ READING ------------------------------#
+
+def readFasta(filename, upper=True, nFraction=False, start=0, end=None):
+    '''Yields (id, sequence) for every record that starts in the byte range [start, end) of filename.
+    The id is the header up to the first whitespace (as SeqRecord.id) and the sequence is bytes, uppercased if upper.
+    With nFraction the fraction of N in the sequence is yielded as a third value (1.0 for empty sequences)'''
+    infile = open(filename, 'rb')
+    if os.fstat(infile.fileno()).st_size == 0:
+        infile.close()
+        return
+    data = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        end = len(data) if end is None else end
+        position = data.find(b'>', start, end)
+        while position != -1 and position < end:
+            headerEnd = data.find(b'\n', position)
+            headerEnd = len(data) if headerEnd == -1 else headerEnd
+            nextRecord = data.find(b'\n>', headerEnd)
+            nextRecord = len(data) if nextRecord == -1 else nextRecord + 1
+
+            header = data[position + 1:headerEnd].split(None, 1)
+            sequence = data[headerEnd + 1:nextRecord].translate(None, whitespace)
+            if upper:
+                sequence = sequence.upper()
+            name = header[0].decode() if len(header) > 0 else ''
+            if nFraction:
+                yield name, sequence, sequence.count(b'N') / len(sequence) if len(sequence) > 0 else 1.0
+            else:
+                yield name, sequence
+            position = nextRecord
+    finally:
+        data.close()
+        infile.close()
+
+
+
+def readHeaders(filename, start=0, end=None):
+    '''Yields (offset, length, header) for every record that starts in the byte range [start, end), without decoding the sequences.
+    Offset and length are the bytes of the whole record, header is the header line without '>'''
+    infile = open(filename, 'rb')
+    if os.fstat(infile.fileno()).st_size == 0:
+        infile.close()
+        return
+    data = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        end = len(data) if end is None else end
+        position = data.find(b'>', start, end)
+        while position != -1 and position < end:
+            headerEnd = data.find(b'\n', position)
+            headerEnd = len(data) if headerEnd == -1 else headerEnd
+            nextRecord = data.find(b'\n>', headerEnd)
+            nextRecord = len(data) if nextRecord == -1 else nextRecord + 1
+            yield position, nextRecord - position, data[position + 1:headerEnd].rstrip(b'\r').decode()
+            position = nextRecord
+    finally:
+        data.close()
+        infile.close()
+
+
+
+def readRecords(filename, offsets, lengths, upper=True):
+    '''Yields (id, sequence bytes) of the records at the given byte offsets and lengths (from readHeaders), in the order given'''
+    infile = open(filename, 'rb')
+    data = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        for offset, length in zip(offsets, lengths):
+            record = data[int(offset):int(offset) + int(length)]
+            headerEnd = record.find(b'\n')
+            headerEnd = len(record) if headerEnd == -1 else headerEnd
+            header = record[1:headerEnd].split(None, 1)
+            sequence = record[headerEnd + 1:].translate(None, whitespace)
+            yield header[0].decode() if len(header) > 0 else '', sequence.upper() if upper else sequence
+    finally:
+        data.close()
+        infile.close()
+
+
+
+def chunkBoundaries(filename, chunks):
+    '''Splits a FASTA file into about equal byte ranges that begin at record starts. Returns a list of (start, end)'''
+    size = os.path.getsize(filename)
+    if size == 0:
+        return []
+    starts = [0]
+    infile = open(filename, 'rb')
+    data = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+    for i in range(1, chunks):
+        boundary = data.find(b'\n>', size * i // chunks)
+        if boundary != -1 and boundary + 1 > starts[-1]:
+            starts.append(boundary + 1)
+    data.close()
+    infile.close()
+
+    return list(zip(starts, starts[1:] + [size]))
+
+
+
+def mapChunks(function, filename, processes=1, args=(), chunksPerProcess=4):
+    '''Calls function(filename, start, end, *args) on chunks of the file, in parallel if processes > 1.
+    The function would normally loop over readFasta(filename, start=start, end=end). Returns the results in file order'''
+    chunks = chunkBoundaries(filename, max(processes * chunksPerProcess, 1) if processes > 1 else 1)
+    if processes == 1:
+        return [function(filename, start, end, *args) for start, end in chunks]
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(function, [filename] * len(chunks), [chunk[0] for chunk in chunks], [chunk[1] for chunk in chunks],
+                             *[[arg] * len(chunks) for arg in args]))
+
+
+
+
+#------------------------------ WRITING ------------------------------#
+
+def fastaLines(seq, lineWidth=60):
+    '''Splits a sequence into lines of lineWidth characters, each ending with a newline'''
+    return ''.join([seq[i:i+lineWidth] + '\n' for i in range(0, len(seq), lineWidth)])
+
+
+
+def writeIndexedFasta(filename, records, lineWidth=60):
+    '''Writes (header, sequence) records to filename and the index to filename.fai.
+    Index columns are name (header up to the first space), length, offset of the sequence, bases per line and bytes per line'''
+    fasta = []
+    index = []
+    offset = 0
+    for header, seq in records:
+        headerLine = '>' + header + '\n'
+        seqLines = fastaLines(seq, lineWidth)
+        offset += len(headerLine)
+        index.append('\t'.join([header.split(' ')[0], str(len(seq)), str(offset), str(lineWidth), str(lineWidth + 1)]) + '\n')
+        fasta.append(headerLine + seqLines)
+        offset += len(seqLines)
+
+    outfile = open(filename, 'w', newline='\n')
+    outfile.write(''.join(fasta))
+    outfile.close()
+    outfile = open(filename + '.fai', 'w', newline='\n')
+    outfile.write(''.join(index))
+    outfile.close()
+
+
+
+def readFastaIndex(filename):
+    '''Reads filename.fai to a dict of name: (length, offset, bases per line, bytes per line)'''
+    index = dict()
+    infile = open(filename + '.fai', 'r')
+    for line in infile:
+        name, length, offset, lineBases, lineBytes = line.rstrip('\n').split('\t')[:5]
+        index[name] = (int(length), int(offset), int(lineBases), int(lineBytes))
+    infile.close()
+
+    return index
+
+
+
+def fetchRecord(filename, name, index=None):
+    '''Reads one record from an indexed FASTA without reading the rest of the file'''
+    index = index if index is not None else readFastaIndex(filename)
+    length, offset, lineBases, lineBytes = index[name]
+    if length == 0:
+        return ''
+    lineCount = (length - 1) // lineBases
+    infile = open(filename, 'rb')
+    infile.seek(offset)
+    data = infile.read(length + lineCount * (lineBytes - lineBases))
+    infile.close()
+
+    return data.replace(b'\n', b'').replace(b'\r', b'').decode()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# Index of the headers in a GISAID FASTA file: segment, identifier and collection date of every record, with its byte offset.
+# The index is built once (in parallel chunks) and saved as a .npy sidecar in .headerIndex/ next to the FASTA. The sidecar is
+# keyed on file size, modification time, header layout and index format. Date windows, segment filters, exclusion lists and deduplication
+# by identifier are answered from the index, and only the matching records are read from the FASTA.
+# Usage: python3 headerIndex.py build <fasta> [--layout gisaid] [-p processes]
+#        python3 headerIndex.py query <fasta> [--start 2022-08-01] [--end 2023-03-31] [--segments HA NA] [--exclude 2022-11-08 ...] [--unique] [-o out.fa]
+import os, glob, argparse
+import numpy as np
+import fastaIO, npyCache
+
+
+
+#------------------------------ LAYOUTS -------------------------------#
+
+# Where the fields are in the '|' separated header. 'spaces' are characters read as spaces before splitting,
+# and every field is stripped of spaces. A segment of None means the layout has no segment field
+headerLayouts = {
+    # GISAID download as read by find2022sequences.py: ...|segment|identifier|...|date
+    'gisaid': {'separator': '|', 'segment': 1, 'identifier': 2, 'date': -1, 'spaces': ''},
+    # GISAID EpiFlu download as read by divideSegmentsInFasta.py: ...|...|identifier|date|...|subtype|segment number
+    'epiflu': {'separator': '|', 'segment': -1, 'identifier': 2, 'date': 3, 'spaces': ''},
+    # Sweep dynamics cds files as read by sampling.py: fields separated by _|_
+    'sweep': {'separator': '|', 'segment': None, 'identifier': 2, 'date': -1, 'spaces': '_'},
+}
+
+# Precision of a collection date. Partial dates are stored as the first day of the year or month
+noDate, yearPrecision, monthPrecision, dayPrecision = 0, 1, 2, 3
+
+indexDirName = '.headerIndex'
+
+# Raise when the columns of the index or the way headers and dates are parsed change, so old sidecars are not used
+indexFormat = 1
+
+
+
+
+#------------------------------ FUNCTIONS ------------------------------#
+
+def headerFields(header, layout):
+    '''Returns segment, identifier and date string of a header ('' for fields it doesn't have)'''
+    for character in layout['spaces']:
+        header = header.replace(character, ' ')
+    fields = [field.strip() for field in header.split(layout['separator'])]
+    values = []
+    for name in ['segment', 'identifier', 'date']:
+        column = layout[name]
+        values.append(fields[column] if column is not None and -len(fields) <= column < len(fields) else '')
+
+    return values
+
+
+
+def parseDates(dateStrings):
+    '''Parses dates like 2022-11-08, 2022-11 or 2022 in one go. Returns datetime64[D] (NaT where there is no valid date)
+    and the precision of each date (noDate, yearPrecision, monthPrecision or dayPrecision)'''
+    strings = np.asarray(dateStrings, dtype=str)
+    dates = np.full(len(strings), np.datetime64('NaT'), dtype='datetime64[D]')
+    precision = np.zeros(len(strings), dtype=np.int8)
+    dashes = np.char.count(strings, '-') if len(strings) > 0 else np.zeros(0, dtype=np.int64)
+
+    for dashCount, unit, level in [(0, 'Y', yearPrecision), (1, 'M', monthPrecision), (2, 'D', dayPrecision)]:
+        rows = np.nonzero(dashes == dashCount)[0]
+        if len(rows) == 0:
+            continue
+        try:
+            dates[rows] = strings[rows].astype('datetime64[' + unit + ']').astype('datetime64[D]')
+        except ValueError:
+            #At least one of them isn't a date; parse one at a time
+            for row in rows:
+                try:
+                    dates[row] = np.datetime64(strings[row], unit).astype('datetime64[D]')
+                except ValueError:
+                    pass
+        precision[rows] = level
+    precision[np.isnat(dates)] = noDate
+
+    return dates, precision
+
+
+
+def indexChunk(filename, start, end, layoutName):
+    '''Reads the headers of one chunk of the FASTA. Returns offsets, lengths, segments, identifiers and date strings'''
+    layout = headerLayouts[layoutName]
+    columns = [[], [], [], [], []]
+    for offset, length, header in fastaIO.readHeaders(filename, start, end):
+        segment, identifier, date = headerFields(header, layout)
+        for column, value in zip(columns, [offset, length, segment, identifier, date]):
+            column.append(value)
+
+    return columns
+
+
+
+def buildIndex(filename, layoutName='gisaid', processes=1):
+    '''Builds the header index of a FASTA file. Returns a structured array with offset, length, date, precision,
+    segment and identifier, sorted by date (records without a date last) and then by position in the file'''
+    columns = [[], [], [], [], []]
+    for chunk in fastaIO.mapChunks(indexChunk, filename, processes, (layoutName,)):
+        for column, values in zip(columns, chunk):
+            column.extend(values)
+    offsets, lengths, segments, identifiers, dateStrings = columns
+    dates, precision = parseDates(dateStrings)
+
+    dtype = [('offset', 'i8'), ('length', 'i8'), ('date', 'datetime64[D]'), ('precision', 'i1'),
+             ('segment', 'U' + str(max([len(value) for value in segments], default=1) or 1)),
+             ('identifier', 'U' + str(max([len(value) for value in identifiers], default=1) or 1))]
+    index = np.zeros(len(offsets), dtype=dtype)
+    index['offset'] = offsets
+    index['length'] = lengths
+    index['date'] = dates
+    index['precision'] = precision
+    index['segment'] = segments
+    index['identifier'] = identifiers
+
+    dateKey = np.where(np.isnat(dates), np.iinfo(np.int64).max, dates.astype(np.int64))
+    return index[np.lexsort((index['offset'], dateKey))]
+
+
+
+def sidecarPath(filename, layoutName):
+    '''Path of the index belonging to a FASTA file. The name holds size, modification time, layout and a hash of the layout and index format'''
+    formatKey = npyCache.formatHash(indexFormat, headerLayouts[layoutName])
+    return npyCache.sidecarPath(filename, indexDirName, npyCache.fileKey(filename, layoutName + '_' + formatKey))
+
+
+
+def readIndex(filename, layoutName='gisaid', processes=1, useCache=True):
+    '''Returns the header index of a FASTA file. A saved index is memory mapped if it is still valid, otherwise it is built and saved'''
+    if not useCache:
+        return buildIndex(filename, layoutName, processes)
+
+    path = sidecarPath(filename, layoutName)
+    index = npyCache.loadSidecar(path)
+    if index is not None:
+        return index
+
+    # Indexes of older versions of this file (or of the index format) are removed
+    index = buildIndex(filename, layoutName, processes)
+    npyCache.saveSidecar(path, index, glob.escape(os.path.basename(filename)) + '.*_' + layoutName + '*.npy')
+
+    return index
+
+
+
+def query(index, start=None, end=None, segments=None, excludeDates=None, excludeIdentifiers=None, unique=False, minPrecision=dayPrecision):
+    '''Finds the records collected from start to end (both included, 'YYYY-MM-DD'), in the given segments and not on the
+    excluded dates or with the excluded identifiers. Dates less precise than minPrecision are left out.
+    With unique only the first record (in file order) of every identifier is kept. Returns the matching rows in file order'''
+    dates = index['date']
+    first = 0 if start is None else np.searchsorted(dates, np.datetime64(start, 'D'), side='left')
+    last = np.searchsorted(dates, np.datetime64('NaT'), side='left') if end is None else np.searchsorted(dates, np.datetime64(end, 'D'), side='right')
+    rows = np.asarray(index[first:last])
+
+    keep = rows['precision'] >= minPrecision
+    if segments is not None:
+        keep &= np.isin(rows['segment'], list(segments))
+    if excludeDates is not None and len(excludeDates) > 0:
+        keep &= ~np.isin(rows['date'], np.array(list(excludeDates), dtype='datetime64[D]'))
+    if excludeIdentifiers is not None and len(excludeIdentifiers) > 0:
+        keep &= ~np.isin(rows['identifier'], list(excludeIdentifiers))
+    rows = rows[keep]
+    rows = rows[np.argsort(rows['offset'], kind='stable')]
+
+    if unique and len(rows) > 0:
+        firstRows = np.unique(rows['identifier'], return_index=True)[1]
+        rows = rows[np.sort(firstRows)]
+
+    return rows
+
+
+
+def readMatches(filename, rows, upper=True):
+    '''Yields (id, sequence bytes) of the records in rows (from query), reading only those records from the FASTA'''
+    return fastaIO.readRecords(filename, rows['offset'], rows['length'], upper)
+
+
+
+
+#------------------------------ MAIN ------------------------------#
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build or query the header index of a GISAID FASTA file.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='Build (or rebuild) the index')
+    build.add_argument('fasta')
+    build.add_argument('--layout', default='gisaid', choices=list(headerLayouts))
+    build.add_argument('-p', '--processes', type=int, default=1, help='0 uses all CPUs (default: 1)')
+
+    search = commands.add_parser('query', help='Write the records matching a date window and filters')
+    search.add_argument('fasta')
+    search.add_argument('--layout', default='gisaid', choices=list(headerLayouts))
+    search.add_argument('--start', help='First collection date, YYYY-MM-DD')
+    search.add_argument('--end', help='Last collection date, YYYY-MM-DD')
+    search.add_argument('--segments', nargs='+')
+    search.add_argument('--exclude', nargs='+', help='Collection dates to leave out')
+    search.add_argument('--unique', action='store_true', help='Keep only the first record of every identifier')
+    search.add_argument('--partialDates', action='store_true', help='Also match dates without day or month')
+    search.add_argument('-o', '--outfile', help='Write the matching records here (default: only count them)')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        processes = args.processes if args.processes > 0 else os.cpu_count()
+        path = sidecarPath(args.fasta, args.layout)
+        if os.path.exists(path):
+            os.remove(path)
+        index = readIndex(args.fasta, args.layout, processes)
+        print(str(len(index)) + ' records indexed in ' + path)
+
+    else:
+        index = readIndex(args.fasta, args.layout)
+        rows = query(index, args.start, args.end, args.segments, args.exclude, unique=args.unique,
+                     minPrecision=yearPrecision if args.partialDates else dayPrecision)
+        print(str(len(rows)) + ' of ' + str(len(index)) + ' records match')
+        if args.outfile is not None:
+            outfile = open(args.outfile, 'w')
+            for name, sequence in readMatches(args.fasta, rows):
+                outfile.write('>' + name + '\n' + sequence.decode() + '\n')
+            outfile.close()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# Shared reader for the tab separated tables IRMA writes to <sample>/tables/
+# Each table kind is parsed once into a typed NumPy structured array and saved as a .npy sidecar
+# in <sample>/tables/.irmaCache/. The sidecar is keyed on file size, modification time and the table schema, so
+# later runs memory map it instead of re-parsing the text.
+import os, glob
+import numpy as np
+import npyCache
+
+
+
+#------------------------------ TABLE KINDS -------------------------------#
+
+# Columns in the order IRMA writes them. Names are ours, so scripts don't depend on the header text.
+# 'U' columns get their width from the data
+tableSchemas = {
+    'variants': [('Reference_Name', 'U'), ('Position', 'i4'), ('Total', 'i4'), ('Major_Allele', 'U'),
+                 ('Minority_Allele', 'U'), ('Consensus_Count', 'i4'), ('Minority_Count', 'i4'),
+                 ('Consensus_Frequency', 'f8'), ('Minority_Frequency', 'f8'), ('Consensus_Average_Quality', 'f8'),
+                 ('Minority_Average_Quality', 'f8'), ('ConfidenceNotMacErr', 'f8'), ('PairedUB', 'f8'),
+                 ('QualityUB', 'f8'), ('Phase', 'U')],
+
+    'allAlleles': [('Reference_Name', 'U'), ('Position', 'i4'), ('Allele', 'U'), ('Count', 'i4'), ('Total', 'i4'),
+                   ('Frequency', 'f8'), ('Average_Quality', 'f8'), ('ConfidenceNotMacErr', 'f8'), ('PairedUB', 'f8'),
+                   ('QualityUB', 'f8'), ('Allele_Type', 'U')],
+
+    'insertions': [('Reference_Name', 'U'), ('Upstream_Position', 'i4'), ('Insert', 'U'), ('Context', 'U'),
+                   ('Called', 'U'), ('Count', 'i4'), ('Total', 'i4'), ('Frequency', 'f8'), ('Average_Quality', 'f8'),
+                   ('ConfidenceNotMacErr', 'f8'), ('PairedUB', 'f8'), ('QualityUB', 'f8')],
+
+    'deletions': [('Reference_Name', 'U'), ('Upstream_Position', 'i4'), ('Length', 'i4'), ('Context', 'U'),
+                  ('Called', 'U'), ('Count', 'i4'), ('Total', 'i4'), ('Frequency', 'f8'), ('PairedUB', 'f8')],
+
+    'readCounts': [('Record', 'U'), ('Reads', 'i8'), ('Patterns', 'i8'), ('PairsAndWidows', 'i8')],
+}
+
+# Filename endings used to recognise the table kind
+tableSuffixes = {'-variants.txt': 'variants',
+                 '-allAlleles.txt': 'allAlleles',
+                 '-insertions.txt': 'insertions',
+                 '-deletions.txt': 'deletions',
+                 'READ_COUNTS.txt': 'readCounts'}
+
+cacheDirName = '.irmaCache'
+
+# Integer columns can't hold nan, so missing integers (NA or empty) are stored as this
+missingInt = -1
+
+
+
+
+#------------------------------- FUNCTIONS --------------------------------#
+
+def tableKind(filename):
+    '''Returns the table kind of an IRMA table from its filename'''
+    for suffix, kind in tableSuffixes.items():
+        if filename.endswith(suffix):
+            return kind
+    raise ValueError('Unknown IRMA table type: ' + str(filename))
+
+
+
+def cacheKey(filename, kind):
+    '''Size and modification time of a table and a hash of its schema and missingInt, used to tell if the sidecar is still valid'''
+    return npyCache.fileKey(filename, npyCache.formatHash(kind, tableSchemas[kind], missingInt))
+
+
+
+def sidecarPath(filename, key):
+    '''Path of the .npy sidecar belonging to a table'''
+    return npyCache.sidecarPath(filename, cacheDirName, key)
+
+
+
+def _toNumber(value, dtype):
+    '''Converts a table field to a number. Missing values (NA or empty) become missingInt or nan'''
+    if value == '' or value == 'NA':
+        return missingInt if dtype[0] == 'i' else float('nan')
+    if dtype[0] == 'i':
+        return int(value)
+    return float(value)
+
+
+
+def formatField(value, fieldFormat='%s'):
+    '''Formats a number from a table for a text file. Missing values (nan, or missingInt for integers) are written as NA, like IRMA does'''
+    if isinstance(value, (float, np.floating)) and np.isnan(value):
+        return 'NA'
+    if isinstance(value, (int, np.integer)) and value == missingInt:
+        return 'NA'
+    return fieldFormat % value
+
+
+
+def parseTable(filename, kind):
+    '''Parses an IRMA text table into a structured NumPy array with the columns given in tableSchemas'''
+    schema = tableSchemas[kind]
+    columns = [[] for column in schema]
+
+    infile = open(filename, 'r')
+    for line in infile:
+        line = line.rstrip('\n')
+        if line.strip() == '' or line.startswith('Reference_Name') or line.startswith('Record'): #Skip header and empty lines
+            continue
+        splitLine = line.split('\t')
+        if len(splitLine) < len(schema):
+            splitLine += [''] * (len(schema) - len(splitLine))
+
+        for i in range(len(schema)):
+            columns[i].append(splitLine[i])
+    infile.close()
+
+    # Turn each column into its final type
+    dtype = []
+    for (name, kindCode), values in zip(schema, columns):
+        if kindCode == 'U':
+            width = max([len(v) for v in values], default=1)
+            dtype.append((name, 'U' + str(max(width, 1))))
+        else:
+            dtype.append((name, kindCode))
+
+    table = np.zeros(len(columns[0]), dtype=dtype)
+    for (name, kindCode), values in zip(schema, columns):
+        if kindCode == 'U':
+            table[name] = values
+        else:
+            table[name] = [_toNumber(v, kindCode) for v in values]
+
+    return table
+
+
+
+def writeSidecar(filename, key, table):
+    '''Saves the parsed table next to the text file, removing sidecars of older versions of the table'''
+    npyCache.saveSidecar(sidecarPath(filename, key), table, glob.escape(os.path.basename(filename)) + '.*.npy')
+
+
+
+def readTable(filename, kind=None, useCache=True):
+    '''Reads an IRMA table and returns it as a structured NumPy array (one field per column).
+    If a valid sidecar exists it is memory mapped instead of parsing the text file'''
+    if kind is None:
+        kind = tableKind(filename)
+
+    if not useCache:
+        return parseTable(filename, kind)
+
+    key = cacheKey(filename, kind)
+    table = npyCache.loadSidecar(sidecarPath(filename, key))
+    if table is not None:
+        return table
+
+    table = parseTable(filename, kind)
+    writeSidecar(filename, key, table)
+    return table
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# .npy sidecar caches kept next to the text files they are parsed from (used by irmaTables and headerIndex).
+# A sidecar name holds the size and modification time of the source file and a hash of the format it was parsed with,
+# so a changed file or a changed parser never gives an old array. Sidecars are memory mapped when read.
+import os, glob, hashlib
+import numpy as np
+
+
+
+#------------------------------ FUNCTIONS ------------------------------#
+
+def formatHash(*parts):
+    '''Short hash of everything that decides how a file is parsed (schema, layout, missing value conventions, ...)'''
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:10]
+
+
+
+def fileKey(filename, formatKey):
+    '''Size and modification time of a file plus the format hash, used to tell if a sidecar is still valid'''
+    stat = os.stat(filename)
+    return str(stat.st_size) + '_' + str(stat.st_mtime_ns) + '_' + formatKey
+
+
+
+def sidecarPath(filename, cacheDirName, key):
+    '''Path of the .npy sidecar of a file: <directory of file>/<cacheDirName>/<file name>.<key>.npy'''
+    directory, basename = os.path.split(os.path.abspath(filename))
+    return os.path.join(directory, cacheDirName, basename + '.' + key + '.npy')
+
+
+
+def loadSidecar(path):
+    '''Memory maps a sidecar. Returns None if there is none or it is broken'''
+    if not os.path.exists(path):
+        return None
+    try:
+        return np.load(path, mmap_mode='r', allow_pickle=False)
+    except (OSError, ValueError):
+        return None
+
+
+
+def saveSidecar(path, array, oldPattern):
+    '''Saves an array as a sidecar and removes the sidecars matching oldPattern (a glob in the cache folder) first.
+    Fails quietly if the folder is read only'''
+    cacheDir = os.path.dirname(path)
+    try:
+        os.makedirs(cacheDir, exist_ok=True)
+        for oldPath in glob.glob(os.path.join(cacheDir, oldPattern)):
+            os.remove(oldPath)
+
+        # Write to a temporary file first so other processes never see half a sidecar
+        tmpPath = path + '.' + str(os.getpid()) + '.tmp'
+        with open(tmpPath, 'wb') as outfile:
+            np.save(outfile, array, allow_pickle=False)
+        os.replace(tmpPath, path)
+    except OSError:
+        pass
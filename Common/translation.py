@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# Shared codon translation. Sequences are handled as uint8 arrays of ASCII codes and codons are
+# translated through a 65-entry lookup table, so a whole batch of sequences is translated in one NumPy call.
+# Codons with N or any other ambiguous base translate to X. A partial codon at the end is left out.
+import numpy as np
+
+
+
+#------------------------------ TABLES -------------------------------#
+
+translationDict = { 'ATA':'I', 'ATC':'I', 'ATT':'I', 'ATG':'M',
+                    'ACA':'T', 'ACC':'T', 'ACG':'T', 'ACT':'T',
+                    'AAC':'N', 'AAT':'N', 'AAA':'K', 'AAG':'K',
+                    'AGC':'S', 'AGT':'S', 'AGA':'R', 'AGG':'R',
+                    'CTA':'L', 'CTC':'L', 'CTG':'L', 'CTT':'L',
+                    'CCA':'P', 'CCC':'P', 'CCG':'P', 'CCT':'P',
+                    'CAC':'H', 'CAT':'H', 'CAA':'Q', 'CAG':'Q',
+                    'CGA':'R', 'CGC':'R', 'CGG':'R', 'CGT':'R',
+                    'GTA':'V', 'GTC':'V', 'GTG':'V', 'GTT':'V',
+                    'GCA':'A', 'GCC':'A', 'GCG':'A', 'GCT':'A',
+                    'GAC':'D', 'GAT':'D', 'GAA':'E', 'GAG':'E',
+                    'GGA':'G', 'GGC':'G', 'GGG':'G', 'GGT':'G',
+                    'TCA':'S', 'TCC':'S', 'TCG':'S', 'TCT':'S',
+                    'TTC':'F', 'TTT':'F', 'TTA':'L', 'TTG':'L',
+                    'TAC':'Y', 'TAT':'Y', 'TAA':'*', 'TAG':'*',
+                    'TGC':'C', 'TGT':'C', 'TGA':'*', 'TGG':'W' }
+
+# Bases are coded 0-3 (upper or lower case, U counts as T). Everything else is 4
+baseCodes = np.full(256, 4, dtype=np.uint8)
+for code, base in enumerate('ACGT'):
+    baseCodes[ord(base)] = code
+    baseCodes[ord(base.lower())] = code
+baseCodes[ord('U')] = baseCodes[ord('u')] = 3
+
+# Amino acid (ASCII code) of codon a*16 + b*4 + c. The last entry is X for codons with an unknown base
+unknownCodon = 64
+aaTable = np.frombuffer((''.join([translationDict[a + b + c] for a in 'ACGT' for b in 'ACGT' for c in 'ACGT']) + 'X').encode(), dtype=np.uint8)
+
+
+
+
+#------------------------------ FUNCTIONS ------------------------------#
+
+def encode(sequence):
+    '''Returns a sequence (str) as a uint8 array of ASCII codes'''
+    return np.frombuffer(sequence.encode('ascii'), dtype=np.uint8)
+
+
+
+def codonIndex(codons):
+    '''Takes codons as uint8 ASCII codes with the three bases in the last axis and returns their row in aaTable'''
+    codes = baseCodes[codons].astype(np.int16)
+    index = codes[..., 0] * 16 + codes[..., 1] * 4 + codes[..., 2]
+    index[(codes == 4).any(axis=-1)] = unknownCodon
+
+    return index
+
+
+
+def translateCodons(codons):
+    '''Translates codons (uint8 ASCII codes, three bases in the last axis) to amino acids as uint8 ASCII codes'''
+    return aaTable[codonIndex(codons)]
+
+
+
+def translate(sequence):
+    '''Translates one nucleotide sequence (str) to a protein sequence (str)'''
+    bases = encode(sequence)
+    codonCount = len(bases) // 3
+
+    return translateCodons(bases[:codonCount * 3].reshape(codonCount, 3)).tobytes().decode()
+
+
+
+def translateBatch(sequences):
+    '''Translates a list of nucleotide sequences with a single lookup. Returns a list of protein sequences'''
+    codonCounts = np.array([len(sequence) // 3 for sequence in sequences], dtype=np.int64)
+    if len(sequences) == 0:
+        return []
+
+    # One row per sequence, padded with N
+    width = int(codonCounts.max()) * 3
+    matrix = np.full((len(sequences), width), ord('N'), dtype=np.uint8)
+    matrix[np.arange(width) < codonCounts[:, None] * 3] = encode(''.join([sequence[:count * 3] for sequence, count in zip(sequences, codonCounts)]))
+
+    proteins = translateCodons(matrix.reshape(len(sequences), width // 3, 3))
+
+    return [proteins[i, :codonCounts[i]].tobytes().decode() for i in range(len(sequences))]
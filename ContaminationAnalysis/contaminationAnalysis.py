@@ -1,580 +1,846 @@
-#!/usr/bin/env python3
-# Run this program on IRMA output folders to detect potential contamination/coinfection
-import sys, os, glob, math
-
-
-
-
-# DEFINE THRESHOLDS HERE:
-maxVariantPercentage = 0.0028       # Percentage of segment length expected to have variants
-maxFreq = 0.02                      # Variants with frequency higher than this are considered high frequency variants
-maxFreqProp = 0.10                  # Max proportion of high frequency variants out of all variants allowed
-maxSecondarySize = 0.10             # Max size of secondary data compared to primary data
-maxFlags = 2                        # Max number of flags raised before the whole sample is flagged as potentially contaminated
-
-
-
-
-##############################################################################
-#                                INITIALIZE                                  #
-##############################################################################
-
-#root = "C:/Users/julie/OneDrive/Skrivebord/Speciale/Quasispecies/"
-root = os.getcwd()
-
-segmentLengths = {'PB2': 2341, 'PB1': 2341, 'PA': 2233, 'HA_H3': 1778, 'HA_H1':  1778, 'NP': 1565, 'NA_N2': 1413, 'NA_N1': 1413, 'MP': 1027, 'NS': 890}
-
-knownSubtypes = ['H1N1', 'H3N2', 'H1N2']
-
-
-
-
-##############################################################################
-#                                 FUNCTIONS                                  #
-##############################################################################
-def usage():
-    print('\nUsage: python3 contaminationAnalysis.py')
-    print('Your current working directory has to be where the IRMA output folders are (fx. .../run/human)')
-    sys.exit(1)
-
-
-def findDirectories(root):
-    '''Returns a list of all directories found in the root directory'''
-    dirList = []
-    searchList = os.listdir(root)
-    for entry in searchList:
-        path = os.path.join(root, entry)
-        if os.path.isdir(path):
-            dirList.append(entry)
-    return dirList
-
-
-
-def primaryData(samplePath):
-    '''Find primary genus and subtype for sample'''
-    genera = set()
-
-    #Look at the READ_COUNTS file
-    readCountFile = openFile(samplePath + 'tables/READ_COUNTS.txt', 'r')
-    for line in readCountFile:
-        record = line.split('\t')[0]
-        dataGroup = record.split('-')[0]
-        
-        #Find primary data
-        if dataGroup == '4':
-            genus = record.split('_')[0].split('-')[-1]
-            genera.add(genus)
-
-            #Find primary HA and NA subtype
-            segment = '_'.join(record.split('_')[1:])
-            if segment[:2] == 'HA':
-                HAsubtype = segment
-            elif segment[:2] == 'NA':
-                NAsubtype = segment
-    readCountFile.close()
-    
-
-    
-    #One primary genus found 
-    if len(genera) == 1:
-        genus = ''.join(genera)
-        subtype = HAsubtype.split('_')[1] + NAsubtype.split('_')[1]
-        segments = ['PB2', 'PB1', 'PA', HAsubtype, 'NP', NAsubtype, 'MP', 'NS']
-        
-        #Write to sample report
-        sampleReport = openFile(samplePath + sample + '_contaminationReport.txt', 'a')
-        sampleReport.write('Primary data is influenza ' + genus + ' (' + subtype + ')' + '\n')
-        if subtype not in knownSubtypes:
-            sampleReport.write('Warning: ' + subtype + ' is an unknown subtype!\n')
-        sampleReport.write('\n')
-        sampleReport.close()
-
-        return genus, segments
-        
-    
-    #Multiple primary genera found (I don't know if it's possible but I included it anyway)
-    elif len(genera) > 0:
-        print('Warning: Multiple influenza genera found in primary data: ' + ' and '.join(genera) + '\n')
-        print("I don't know how to do the analysis with two primary genera. Exiting program")
-        usage()
-    
-    #No primary genus found; something is wrong
-    else:
-        print('Error: No genus found in primary data for ' + sample)
-        print('Check if something is wrong with READ_COUNTS.txt')
-        print('Exiting program')
-        usage()
-
-
-
-def openFile(filename, action):
-    '''Try to open a file. Action is either "r", "w" or "a" (read, write or append)'''
-    try:
-        return open(filename, str(action))
-    except IOError as error:
-        print('Error opening file: ' + str(error))
-        sys.exit(1) #Maybe it should just throw a warning and continue??
-
-
-
-def initContaminationReport(root):
-    '''Create contamination report file and write header'''
-    contaminationReport = open(root + '/contaminationReport.txt', 'w')
-    contaminationReport.write("{:<10} {:<10} {:^3} {:^10} {:^10} {:^10} {:^10} {:^10}".format('Sample', 'Flagged', '|', '(1)Count', '(2)Freq', '(3)Prop', '(4)Reads', '(5)Assembly') + '\n')
-    contaminationReport.close()
-
-
-
-def initSampleReport(samplePath):
-    '''Create empty sample report file'''
-    sampleReport = open(samplePath + sample + '_contaminationReport.txt', 'w')
-    sampleReport.close()
-
-
-
-def printSample(sample):
-    '''Print name of sample to screen'''
-    nameLength = len(sample)
-    print('\n')
-    print('#' * (nameLength + 20))
-    print('#         ' + sample + '         #')
-    print('#' * (nameLength + 20))
-            
-
-    
-def summarizeSecondary(samplePath, primaryGenus):
-    '''Writes a summary of secondary data to sample report'''
-    readCountFile = openFile(samplePath + 'tables/READ_COUNTS.txt', 'r')
-        
-    # Initialize
-    genusDict = dict()
-    subtypeDict = dict()
-    
-    for line in readCountFile:
-        splitLine = line.split('\t')
-        recordSplit = splitLine[0].split('-')
-        group = recordSplit[0]            
-        
-        # Secondary data (group 5)
-        if group == '5':
-            genus = recordSplit[1].split('_')[0]
-            segment = recordSplit[1].split('_')[1]
-            patternCount = splitLine[2] # Pattern count       
-        
-            # Secondary subtype
-            if genus == primaryGenus:
-                subtype = recordSplit[1].split('_')[-1]
-                subtypeDict[subtype] = patternCount                    
-            
-            # Secondary genus
-            else:
-                if genus in genusDict:
-                    genusDict[genus][segment] = patternCount
-                else:
-                    genusDict[genus] = {segment: patternCount}
-    readCountFile.close()
-    
-    #Subtype read counts
-    sampleReport = openFile(samplePath + sample + '_contaminationReport.txt', 'a')
-    sampleReport.write('-------Subtypes of influenza ' + primaryGenus + '-------\n')
-    if len(subtypeDict) > 0:
-        sampleReport.write('\n')
-        sampleReport.write("{:<8} {:<8}".format('Segment', 'PatternCount') + '\n')
-        for subtype, readCount in subtypeDict.items():
-            sampleReport.write("{:<8} {:<8}".format(subtype, readCount) + '\n') 
-        sampleReport.write('\n\n')
-    else:
-        sampleReport.write('None\n\n')    
-                            
-    #Secondary genera read counts
-    sampleReport.write('-----------Secondary genera----------\n\n')
-    if len(genusDict) > 0:
-        for genus,segmentDict in genusDict.items():
-            if genus != primaryGenus:
-                sampleReport.write("{:<8} {:<8} {:<8}".format('Genus', 'Segment', 'ReadCount') + '\n')
-                for segment, readCount in segmentDict.items():
-                    sampleReport.write("{:<8} {:<8} {:<8}".format(genus, segment, readCount) + '\n')
-        sampleReport.write('\n')
-    else:
-        sampleReport.write('None\n\n')
-    sampleReport.close()
-
-
-
-def isSampleFolder(samplePath):
-    '''Checking if a given folder is IRMA output by seeing if the directories we need exist'''
-    tables = os.path.exists(samplePath + 'tables')
-    secondary = os.path.exists(samplePath + 'secondary')
-
-    #Do the folders exist? If yes, then it is an IRMA sample folder
-    if tables is True and secondary is True:
-        return True
-    else:
-        return False
-
-
-#----Flag functions----#
-#FLAG1
-def variantCount(samplePath, segments):
-    '''Counts how many minority variants are found in each segment of a given sample'''
-    #Find variant files   
-    variantFileList = glob.glob(samplePath + 'tables/' + primaryGenus + '*-variants.txt')
-    
-    if len(variantFileList) > 0:
-        countDict = dict()       
-        for variantFilePath in variantFileList:    
-            segment = '_'.join(variantFilePath.split('/')[-1].split('-')[0].split('_')[1:])
-            
-            #Open variant file
-            variantFile = openFile(variantFilePath, 'r')
-                       
-            # Count number of variants
-            for line in variantFile:
-                if not line.startswith('Reference_Name') and not line.strip() == '': #Skip header and empty lines
-                    
-                    if segment in countDict:
-                        countDict[segment] += 1
-                    else:
-                        countDict[segment] = 1  
-                        
-            # Add segment with count of 0, if there were no variants in file
-            if segment not in countDict:
-                countDict[segment] = 0  
-            variantFile.close()
-            
-        
-    
-    # Check if any segments have too many variants
-    flaggedForCount = []
-    for segment, count in countDict.items():
-        maxCount = math.floor(segmentLengths[segment] * maxVariantPercentage)    #Define how many variants this segment is allowed to have
-        if count > maxCount:
-            flaggedForCount.append(segment)  
-
-    # Write results to sample report 
-    writeCount(samplePath, flaggedForCount, countDict, segments)
-
-    # If at least one segment has too many variants; return True
-    if len(flaggedForCount) > 0:
-        return True, flaggedForCount, countDict
-    else:
-        return False, flaggedForCount, countDict
-    
-    
-#FLAG2
-def variantFrequency(samplePath, flaggedForCount, countDict, segments):
-    '''Finds frequencies of mutations for segments that are flagged as having too many minority variants'''
-    freqDict = dict()
-    for segment in countDict.keys():
-        
-        # Open variant file
-        variantFile = openFile(samplePath + 'tables/' + primaryGenus + '_' + segment + '-variants.txt', 'r')
-        
-        # # Find frequencies of all mutations in all segments
-        for line in variantFile:
-            if not line.startswith('Reference_Name') and not line.strip() == '': #Skip header and empty lines
-                frequency = float(line.split('\t')[8])
-                if segment in freqDict:
-                    freqDict[segment].append(frequency)     
-                else:
-                    freqDict[segment] = [frequency]
-        variantFile.close()
-
-        # How many mutations are above the frequency threshold?
-        flaggedForFreq = set()
-        highFreqCountDict = {}
-        for segment, freqList in freqDict.items():
-            for f in freqList:
-
-                # Count frequencies above threshold
-                if f > maxFreq:
-                    if segment in highFreqCountDict:
-                        highFreqCountDict[segment] += 1
-                    else:
-                        highFreqCountDict[segment] = 1
-
-                    # If this segment was previously flagged for high count of variants; flag for high frequency
-                    if segment in flaggedForCount:
-                        flaggedForFreq.add(segment)
-
-    # Write results to sample report 
-    writeFreq(samplePath, highFreqCountDict, segments)
-    
-    # If any segments were flagged for high frequency; return True
-    if len(flaggedForFreq) > 0:
-        return True, flaggedForFreq, freqDict, highFreqCountDict
-    else:
-        return False, flaggedForFreq, freqDict, highFreqCountDict
-   
-    
-#FLAG3
-def highFreqProportion(samplePath, frequencyDict, highFreqCountDict, flaggedForFreq, segments):  
-    '''Calculates proportion of high frequency variants in segments previously flagged'''
-    propDict = {}
-    for segment, freqList in frequencyDict.items():   
-        # How many variants are in this segment?
-        variantCount = len(freqList)
-         
-        # Does the proportion exceed the threshold? (Only in flagged segments!)
-        if segment in flaggedForFreq:
-            proportion = round(highFreqCountDict[segment] / variantCount, 2)
-            if proportion > maxFreqProp:
-                propDict[segment] = proportion 
-    flaggedForProp = list(propDict.keys())
-
-    # Write results to sample report
-    writeProp(samplePath, propDict, segments)
-
-    # If any segments were flagged for high proportion; return True
-    if len(flaggedForProp) > 0:
-        return True, flaggedForProp, highFreqCountDict, propDict
-    else:
-        return False, flaggedForProp, highFreqCountDict, propDict
-
-
-#FLAG4    
-def secondaryVprimary(samplePath): 
-    '''Calculates how big the secondary data set is compared to the primary data set (secondary read count divided by primary read count)'''  
-    primPatternCount = 0
-    secPatternCount = 0
-
-    # Open read count file
-    readCountFile = open(samplePath + 'tables/READ_COUNTS.txt', 'r')
-    
-    for line in readCountFile:
-        splitLine = line.split('\t')
-        record = splitLine[0]
-        dataGroup = record.split('-')[0]
-        
-        # Sum primary read count
-        if dataGroup == '4':
-            primPatternCount += int(splitLine[2])
-            
-        # Sum secondary read count
-        elif dataGroup == '5':
-            secPatternCount += int(splitLine[2])           
-    readCountFile.close()
-    
-    # How big is the secondary data compared to primary data
-    size = secPatternCount / primPatternCount
-
-    # Write to sample report
-    writeReadCount(samplePath, primPatternCount, secPatternCount, size)
-
-    # If the size of secondary data is bigger than threshold; return True
-    if size > maxSecondarySize:
-        return True
-    else:
-        return False
-
-
-#FLAG5
-def secondaryAssembly(samplePath):
-    '''Checks for the presence of "secondary-assembly" directory'''
-    sampleReport = openFile(samplePath + sample + '_contaminationReport.txt', 'a')
-    sampleReport.write('\n')
-    sampleReport.write('#' * 37 + '\n')
-    sampleReport.write('#          Secondary Data           #\n')
-    sampleReport.write('#' * 37 + '\n\n')
-
-    # Did IRMA make a secondary assembly?
-    if os.path.exists(samplePath + 'secondary_assembly') and os.path.isdir(samplePath + 'secondary_assembly'):
-        sampleReport.write('(5) A secondary assembly was made! This indicates high amount of secondary data!\n\n') 
-        sampleReport.close()
-        summarizeSecondary(samplePath, primaryGenus)
-        return True
-    else:
-        sampleReport.write('(5) No secondary assembly was made\n\n')    
-        sampleReport.close()
-        summarizeSecondary(samplePath, primaryGenus)
-        return False
-
-
-
-#----For writing output----#
-def writeCount(samplePath, flaggedForCount, countDict, segments):
-    sampleReport = openFile(samplePath + sample + '_contaminationReport.txt', 'a')
-    sampleReport.write('\n')
-    sampleReport.write('#' * 37 + '\n')
-    sampleReport.write('#         Minority Variants         #\n')
-    sampleReport.write('#' * 37 + '\n\n')
-    
-    # Write header
-    sampleReport.write("{:<16}".format(''))
-    for s in segments:
-        if s in flaggedForCount:
-            sampleReport.write("{:<8}".format(s + '*'))
-        else:
-            sampleReport.write("{:<8}".format(s))
-    sampleReport.write('\n')
-    
-    #Write count thresholds
-    sampleReport.write("{:<3} {:<12}".format('', 'MaxCount'))
-    for s in segments:
-        maxCount = math.floor(segmentLengths[s] * maxVariantPercentage)
-        sampleReport.write("{:<8}".format(maxCount))
-    sampleReport.write('\n')
-    
-    # Write counts
-    sampleReport.write("{:<3} {:<12}".format('(1)', 'Count'))
-    for s in segments:
-        if s in countDict:
-            sampleReport.write("{:<8}".format(str(countDict[s]))) 
-        else:
-            sampleReport.write("{:<8}".format('NA')) 
-    sampleReport.write('\n')
-    sampleReport.close()
-
-
-
-def writeFreq(samplePath, highFreqCountDict, segments):
-    '''Write count of high frequency variants to sample report'''
-    sampleReport = openFile(samplePath + sample + '_contaminationReport.txt', 'a')
-
-    # Write counts of variants with frequency above maxFreq
-    sampleReport.write('\n')
-    sampleReport.write("{:<3} {:<12}".format('(2)', 'Freq>' + str(maxFreq)))
-    for s in segments:     
-        if s in highFreqCountDict:
-            sampleReport.write("{:<8}".format(highFreqCountDict[s]))
-        else:
-            sampleReport.write("{:<8}".format('0'))  
-    sampleReport.write('\n')
-    sampleReport.close()
-
-
-
-def writeProp(samplePath, propDict, segments):
-    '''Write proportion of high frequency variants to sample report'''
-    sampleReport = openFile(samplePath + sample + '_contaminationReport.txt', 'a')
-    
-    sampleReport.write("{:<3} {:<12}".format('(3)', 'Proportion'))
-    for s in segments:
-        if s in propDict:
-            sampleReport.write("{:<8}".format(propDict[s]))
-        else:
-            sampleReport.write("{:<8}".format('-')) 
-    sampleReport.write('\n')   
-    sampleReport.close()
-
-
-
-def writeReadCount(samplePath, primPatternCount, secPatternCount, size):
-    '''Write summary of read counts in sample and the size of '''   
-    sampleReport = openFile(samplePath + sample + '_contaminationReport.txt', 'a')
-    sampleReport.write('\n\n\n\n')
-    sampleReport.write('#' * 37 + '\n')
-    sampleReport.write('#        Secondary v. primary       #\n')
-    sampleReport.write('#' * 37 + '\n')
-    sampleReport.write('\n')
-
-    # Size of secondary data compared to primary data
-    if size >= 0.01:
-        sampleReport.write('(4) Secondary data is ' + str(round(size * 100, 2)) + '% the size of primary data\n\n')
-    else:
-        sampleReport.write('(4) Secondary data is <1% of the size of primary data\n\n')
-
-    # Total number of read patterns
-    sampleReport.write("{:<10} {:<20}".format('', 'TotalReadPatterns') + '\n')
-    sampleReport.write("{:<10} {:<20}".format('Primary', str(primPatternCount)) + '\n')
-    sampleReport.write("{:<10} {:<20}".format('Secondary', str(secPatternCount)) + '\n\n\n\n')
-    sampleReport.close()
-
-
-
-def writeContaminationReport(root, flagList):
-    '''Writing output to contamination report'''
-    contaminationReport = open(root + '/contaminationReport.txt', 'a')
-
-    # Does this sample have too many flags raised?
-    flagCount = flagList.count(True)
-    if flagCount >= maxFlags:
-        flagged = 'True'
-    else:
-        flagged = 'False'
-
-    # Write results
-    contaminationReport.write("{:<10} {:<10} {:^3} {:^10} {:^10} {:^10} {:^10} {:^10}".format(sample, flagged, '|', flagList[0], flagList[1], flagList[2], flagList[3], flagList[4]) + '\n')
-    contaminationReport.close()
-    
-
-
-
-##############################################################################
-#                                   MAIN                                     #
-##############################################################################
-# Initialize contamination report file
-initContaminationReport(root)
-
-# Go through found directories
-dirList = findDirectories(root)
-for sample in dirList:
-    samplePath = root + '/' + sample + '/'
-
-    # Proceed only if this is a sample folder
-    if isSampleFolder(samplePath) is True: 
-
-        # Initialize
-        flag1 = False
-        flag2 = False
-        flag3 = False
-        flag4 = False
-        flag5 = False
-        printSample(sample)
-        initSampleReport(samplePath)
-        primaryGenus, segments = primaryData(samplePath)
-
-
-
-        #####
-        # 1 # Count minority variants
-        #####
-        print('--------1. Minority variant count--------')
-        flag1, flaggedForCount, countDict = variantCount(samplePath, segments)
-        print('\n')
-        
-        
-        
-        if flag1 is True:
-            #####
-            # 2 # Check frequencies in segments that were flagged as having too many minority frequencies (if any)
-            #####
-            print('--------2. Minority variant frequency--------')
-            flag2, flaggedForFreq, freqDict, highFreqCountDict = variantFrequency(samplePath, flaggedForCount, countDict, segments)
-            print('\n')
-            
-            
-                        
-            if flag2 is True:              
-                #####
-                # 3 # Check proportion of high frequency minority variants (if any)
-                #####
-                print('--------3. High frequency proportion--------')
-                flag3, flaggedForProp, highFreqCountDict, propDict = highFreqProportion(samplePath, freqDict, highFreqCountDict, flaggedForFreq, segments)
-                print('\n')
-                
-
-
-
-        #####
-        # 4 # Calculate size of secondary data compared to primary data
-        #####
-        print('--------4. Secondary data size--------')
-        flag4 = secondaryVprimary(samplePath)
-        print('\n')
-
-
-
-        #####
-        # 5 # Look for presence of 'Secondary_assembly' folder
-        #####
-        print('--------5. Secondary assembly--------')
-        flag5 = secondaryAssembly(samplePath)
-        
-
-        # Write results to contamination report
-        writeContaminationReport(root, [flag1, flag2, flag3, flag4, flag5])
-    
-
-print('\n\nContamination report done!')
-
+#!/usr/bin/env python3
+# Run this program on IRMA output folders to detect potential contamination/coinfection
+import sys, os, glob, math, argparse, io, json, time
+from concurrent.futures import ProcessPoolExecutor
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+import irmaTables
+import numpy as np
+
+
+
+
+# DEFINE THRESHOLDS HERE:
+maxVariantPercentage = 0.0028       # Percentage of segment length expected to have variants
+maxFreq = 0.02                      # Variants with frequency higher than this are considered high frequency variants
+maxFreqProp = 0.10                  # Max proportion of high frequency variants out of all variants allowed
+maxSecondarySize = 0.10             # Max size of secondary data compared to primary data
+maxFlags = 2                        # Max number of flags raised before the whole sample is flagged as potentially contaminated
+
+
+
+
+##############################################################################
+#                                INITIALIZE                                  #
+##############################################################################
+
+#root = "C:/Users/julie/OneDrive/Skrivebord/Speciale/Quasispecies/"
+root = os.getcwd()
+
+segmentLengths = {'PB2': 2341, 'PB1': 2341, 'PA': 2233, 'HA_H3': 1778, 'HA_H1':  1778, 'NP': 1565, 'NA_N2': 1413, 'NA_N1': 1413, 'MP': 1027, 'NS': 890}
+
+knownSubtypes = ['H1N1', 'H3N2', 'H1N2']
+
+manifestName = 'contaminationManifest.json'
+
+contaminationTableColumns = ['Sample', 'Flagged', 'FlagCount', 'Flag1_Count', 'Flag2_Freq', 'Flag3_Prop', 'Flag4_Reads', 'Flag5_Assembly',
+                             'PrimaryGenus', 'Subtype', 'PrimaryPatterns', 'SecondaryPatterns', 'SecondarySize',
+                             'FlaggedForCount', 'FlaggedForFreq', 'FlaggedForProp']
+
+
+
+
+##############################################################################
+#                                 FUNCTIONS                                  #
+##############################################################################
+def usage():
+    print('\nUsage: python3 contaminationAnalysis.py')
+    print('Your current working directory has to be where the IRMA output folders are (fx. .../run/human)')
+    sys.exit(1)
+
+
+class AnalysisError(Exception):
+    '''A sample (or report) that can't be analysed or written. A failing sample doesn't stop the other samples'''
+    pass
+
+
+def findDirectories(root):
+    '''Returns a list of all directories found in the root directory'''
+    dirList = []
+    searchList = os.listdir(root)
+    for entry in searchList:
+        path = os.path.join(root, entry)
+        if os.path.isdir(path):
+            dirList.append(entry)
+    return dirList
+
+
+
+def checkSampleData(data):
+    '''Raises AnalysisError if the flags can't be evaluated for a sample. Used by this script and thresholdSweep.py, so both leave out the same samples'''
+    genera = data.genera
+    sample = data.sample
+
+    #Multiple primary genera found (I don't know if it's possible but I included it anyway)
+    if len(genera) > 1:
+        raise AnalysisError('Multiple influenza genera found in primary data of ' + sample + ': ' + ' and '.join(sorted(genera)) +
+                            ". I don't know how to do the analysis with two primary genera")
+
+    #No primary genus found; something is wrong
+    if len(genera) == 0:
+        raise AnalysisError('No genus found in primary data for ' + sample + '. Check if something is wrong with READ_COUNTS.txt')
+
+    #The subtype is read from the HA and NA records, and flag 1 needs the length of every segment
+    if data.HAsubtype is None or data.NAsubtype is None:
+        raise AnalysisError('No HA and/or NA segment in primary data of ' + sample)
+    unknown = sorted(set([data.HAsubtype, data.NAsubtype] + list(data.countDict)) - set(segmentLengths))
+    if len(unknown) > 0:
+        raise AnalysisError('No segment length known for ' + ', '.join(unknown) + ' in ' + sample + '. Add it to segmentLengths')
+
+    #Flag 4 compares secondary to primary data
+    if data.primPatternCount == 0:
+        raise AnalysisError('No primary read patterns in ' + sample)
+
+
+
+def primaryData(data, sampleReport):
+    '''Find primary genus and subtype for sample (checkSampleData has made sure there is one primary genus)'''
+    HAsubtype = data.HAsubtype
+    NAsubtype = data.NAsubtype
+
+    genus = ''.join(data.genera)
+    subtype = HAsubtype.split('_')[1] + NAsubtype.split('_')[1]
+    segments = ['PB2', 'PB1', 'PA', HAsubtype, 'NP', NAsubtype, 'MP', 'NS']
+
+    #Write to sample report
+    sampleReport.write('Primary data is influenza ' + genus + ' (' + subtype + ')' + '\n')
+    if subtype not in knownSubtypes:
+        sampleReport.write('Warning: ' + subtype + ' is an unknown subtype!\n')
+    sampleReport.write('\n')
+
+    return genus, segments
+
+
+
+def openFile(filename, action):
+    '''Try to open a file. Action is either "r", "w" or "a" (read, write or append)'''
+    try:
+        return open(filename, str(action))
+    except IOError as error:
+        raise AnalysisError('Error opening file: ' + str(error))
+
+
+
+def readVariants(filename):
+    '''Read a -variants.txt table with the shared IRMA table reader'''
+    try:
+        return irmaTables.readTable(filename, 'variants')
+    except IOError as error:
+        raise AnalysisError('Error opening file: ' + str(error))
+
+
+
+#----Sample data----#
+class SampleData:
+    '''Everything the five flags need for one sample. READ_COUNTS.txt and each variant table are read only once'''
+
+    def __init__(self, root, sample):
+        self.sample = sample
+        self.samplePath = root + '/' + sample + '/'
+
+        # Primary data (group 4)
+        self.genera = set()
+        self.HAsubtype = None
+        self.NAsubtype = None
+        self.primPatternCount = 0
+
+        # Secondary data (group 5)
+        self.secPatternCount = 0
+        self.secondaryRecords = []
+        self.subtypeDict = dict()
+        self.genusDict = dict()
+        self.secondaryAssembly = os.path.isdir(self.samplePath + 'secondary_assembly')
+
+        # Minority variants of the primary genus
+        self.countDict = dict()
+        self.freqDict = dict()
+
+        self.readReadCounts()
+        if len(self.genera) == 1:
+            primaryGenus = ''.join(self.genera)
+            self.splitSecondary(primaryGenus)
+            self.readVariantTables(primaryGenus)
+
+
+    def readReadCounts(self):
+        '''Goes through READ_COUNTS.txt once and collects primary and secondary data'''
+        try:
+            readCounts = irmaTables.readTable(self.samplePath + 'tables/READ_COUNTS.txt', 'readCounts')
+        except IOError as error:
+            raise AnalysisError('Error opening file: ' + str(error))
+
+        for record, patternCount in zip(readCounts['Record'].tolist(), readCounts['Patterns'].tolist()):
+            recordSplit = record.split('-')
+            group = recordSplit[0]
+
+            # Primary data (group 4)
+            if group == '4':
+                self.genera.add(record.split('_')[0].split('-')[-1])
+                self.primPatternCount += patternCount
+
+                #Find primary HA and NA subtype
+                segment = '_'.join(record.split('_')[1:])
+                if segment[:2] == 'HA':
+                    self.HAsubtype = segment
+                elif segment[:2] == 'NA':
+                    self.NAsubtype = segment
+
+            # Secondary data (group 5)
+            elif group == '5':
+                self.secPatternCount += patternCount
+                self.secondaryRecords.append([recordSplit[1], patternCount])
+
+
+    def splitSecondary(self, primaryGenus):
+        '''Sorts secondary pattern counts into subtypes of the primary genus and other genera'''
+        for record, patternCount in self.secondaryRecords:
+            genus = record.split('_')[0]
+            segment = record.split('_')[1]
+
+            # Secondary subtype
+            if genus == primaryGenus:
+                subtype = record.split('_')[-1]
+                self.subtypeDict[subtype] = patternCount
+
+            # Secondary genus
+            else:
+                if genus in self.genusDict:
+                    self.genusDict[genus][segment] = patternCount
+                else:
+                    self.genusDict[genus] = {segment: patternCount}
+
+
+    def readVariantTables(self, primaryGenus):
+        '''Reads every variant table of the primary genus once and keeps variant counts and frequencies'''
+        for variantFilePath in glob.glob(self.samplePath + 'tables/' + primaryGenus + '*-variants.txt'):
+            segment = '_'.join(variantFilePath.split('/')[-1].split('-')[0].split('_')[1:])
+            frequencies = np.array(readVariants(variantFilePath)['Minority_Frequency'], dtype=float)
+
+            self.countDict[segment] = len(frequencies)
+            if len(frequencies) > 0:
+                self.freqDict[segment] = frequencies
+
+
+
+def writeAtomic(filename, text):
+    '''Writes text to a temporary file and renames it to filename, so a report is never left half written'''
+    tmpFilename = filename + '.tmp'
+    outfile = openFile(tmpFilename, 'w')
+    outfile.write(text)
+    outfile.close()
+    os.replace(tmpFilename, filename)
+
+
+
+def initSampleReport():
+    '''Sample reports are built in memory and written in one go when the sample is done'''
+    return io.StringIO()
+
+
+
+def printSample(sample):
+    '''Print name of sample to screen'''
+    nameLength = len(sample)
+    print('\n')
+    print('#' * (nameLength + 20))
+    print('#         ' + sample + '         #')
+    print('#' * (nameLength + 20))
+            
+
+    
+def summarizeSecondary(data, sampleReport, primaryGenus):
+    '''Writes a summary of secondary data to sample report'''
+    genusDict = data.genusDict
+    subtypeDict = data.subtypeDict
+    
+    #Subtype read counts
+    sampleReport.write('-------Subtypes of influenza ' + primaryGenus + '-------\n')
+    if len(subtypeDict) > 0:
+        sampleReport.write('\n')
+        sampleReport.write("{:<8} {:<8}".format('Segment', 'PatternCount') + '\n')
+        for subtype, readCount in subtypeDict.items():
+            sampleReport.write("{:<8} {:<8}".format(subtype, readCount) + '\n') 
+        sampleReport.write('\n\n')
+    else:
+        sampleReport.write('None\n\n')    
+                            
+    #Secondary genera read counts
+    sampleReport.write('-----------Secondary genera----------\n\n')
+    if len(genusDict) > 0:
+        for genus,segmentDict in genusDict.items():
+            if genus != primaryGenus:
+                sampleReport.write("{:<8} {:<8} {:<8}".format('Genus', 'Segment', 'ReadCount') + '\n')
+                for segment, readCount in segmentDict.items():
+                    sampleReport.write("{:<8} {:<8} {:<8}".format(genus, segment, readCount) + '\n')
+        sampleReport.write('\n')
+    else:
+        sampleReport.write('None\n\n')
+
+
+
+def isSampleFolder(samplePath):
+    '''Checking if a given folder is IRMA output by seeing if the directories we need exist'''
+    tables = os.path.exists(samplePath + 'tables')
+    secondary = os.path.exists(samplePath + 'secondary')
+
+    #Do the folders exist? If yes, then it is an IRMA sample folder
+    if tables is True and secondary is True:
+        return True
+    else:
+        return False
+
+
+#----Flag functions----#
+#FLAG1
+def variantCount(data, sampleReport, segments):
+    '''Counts how many minority variants are found in each segment of a given sample'''
+    countDict = data.countDict
+    
+    # Check if any segments have too many variants
+    flaggedForCount = []
+    for segment, count in countDict.items():
+        maxCount = math.floor(segmentLengths[segment] * maxVariantPercentage)    #Define how many variants this segment is allowed to have
+        if count > maxCount:
+            flaggedForCount.append(segment)  
+
+    # Write results to sample report 
+    writeCount(sampleReport, flaggedForCount, countDict, segments)
+
+    # If at least one segment has too many variants; return True
+    if len(flaggedForCount) > 0:
+        return True, flaggedForCount, countDict
+    else:
+        return False, flaggedForCount, countDict
+    
+    
+#FLAG2
+def variantFrequency(data, sampleReport, flaggedForCount, countDict, segments):
+    '''Finds frequencies of mutations for segments that are flagged as having too many minority variants'''
+    freqDict = data.freqDict
+
+    # How many mutations are above the frequency threshold?
+    flaggedForFreq = set()
+    highFreqCountDict = {}
+    for segment, freqList in freqDict.items():
+        highFreqCount = int(np.count_nonzero(freqList > maxFreq))
+        if highFreqCount > 0:
+            highFreqCountDict[segment] = highFreqCount
+
+            # If this segment was previously flagged for high count of variants; flag for high frequency
+            if segment in flaggedForCount:
+                flaggedForFreq.add(segment)
+
+    # Write results to sample report 
+    writeFreq(sampleReport, highFreqCountDict, segments)
+    
+    # If any segments were flagged for high frequency; return True
+    if len(flaggedForFreq) > 0:
+        return True, flaggedForFreq, freqDict, highFreqCountDict
+    else:
+        return False, flaggedForFreq, freqDict, highFreqCountDict
+   
+    
+#FLAG3
+def highFreqProportion(data, sampleReport, frequencyDict, highFreqCountDict, flaggedForFreq, segments):  
+    '''Calculates proportion of high frequency variants in segments previously flagged'''
+    propDict = {}
+    for segment, freqList in frequencyDict.items():   
+        # How many variants are in this segment?
+        variantCount = len(freqList)
+         
+        # Does the proportion exceed the threshold? (Only in flagged segments!)
+        if segment in flaggedForFreq:
+            proportion = round(highFreqCountDict[segment] / variantCount, 2)
+            if proportion > maxFreqProp:
+                propDict[segment] = proportion 
+    flaggedForProp = list(propDict.keys())
+
+    # Write results to sample report
+    writeProp(sampleReport, propDict, segments)
+
+    # If any segments were flagged for high proportion; return True
+    if len(flaggedForProp) > 0:
+        return True, flaggedForProp, highFreqCountDict, propDict
+    else:
+        return False, flaggedForProp, highFreqCountDict, propDict
+
+
+#FLAG4    
+def secondaryVprimary(data, sampleReport):
+    '''Calculates how big the secondary data set is compared to the primary data set (secondary read count divided by primary read count)'''  
+    primPatternCount = data.primPatternCount
+    secPatternCount = data.secPatternCount
+    
+    # How big is the secondary data compared to primary data
+    size = secPatternCount / primPatternCount
+
+    # Write to sample report
+    writeReadCount(sampleReport, primPatternCount, secPatternCount, size)
+
+    # If the size of secondary data is bigger than threshold; return True
+    if size > maxSecondarySize:
+        return True
+    else:
+        return False
+
+
+#FLAG5
+def secondaryAssembly(data, sampleReport, primaryGenus):
+    '''Checks for the presence of "secondary-assembly" directory'''
+    sampleReport.write('\n')
+    sampleReport.write('#' * 37 + '\n')
+    sampleReport.write('#          Secondary Data           #\n')
+    sampleReport.write('#' * 37 + '\n\n')
+
+    # Did IRMA make a secondary assembly?
+    if data.secondaryAssembly is True:
+        sampleReport.write('(5) A secondary assembly was made! This indicates high amount of secondary data!\n\n') 
+        summarizeSecondary(data, sampleReport, primaryGenus)
+        return True
+    else:
+        sampleReport.write('(5) No secondary assembly was made\n\n')    
+        summarizeSecondary(data, sampleReport, primaryGenus)
+        return False
+
+
+
+#----For writing output----#
+def writeCount(sampleReport, flaggedForCount, countDict, segments):
+    sampleReport.write('\n')
+    sampleReport.write('#' * 37 + '\n')
+    sampleReport.write('#         Minority Variants         #\n')
+    sampleReport.write('#' * 37 + '\n\n')
+    
+    # Write header
+    sampleReport.write("{:<16}".format(''))
+    for s in segments:
+        if s in flaggedForCount:
+            sampleReport.write("{:<8}".format(s + '*'))
+        else:
+            sampleReport.write("{:<8}".format(s))
+    sampleReport.write('\n')
+    
+    #Write count thresholds
+    sampleReport.write("{:<3} {:<12}".format('', 'MaxCount'))
+    for s in segments:
+        maxCount = math.floor(segmentLengths[s] * maxVariantPercentage)
+        sampleReport.write("{:<8}".format(maxCount))
+    sampleReport.write('\n')
+    
+    # Write counts
+    sampleReport.write("{:<3} {:<12}".format('(1)', 'Count'))
+    for s in segments:
+        if s in countDict:
+            sampleReport.write("{:<8}".format(str(countDict[s]))) 
+        else:
+            sampleReport.write("{:<8}".format('NA')) 
+    sampleReport.write('\n')
+
+
+
+def writeFreq(sampleReport, highFreqCountDict, segments):
+    '''Write count of high frequency variants to sample report'''
+
+    # Write counts of variants with frequency above maxFreq
+    sampleReport.write('\n')
+    sampleReport.write("{:<3} {:<12}".format('(2)', 'Freq>' + str(maxFreq)))
+    for s in segments:     
+        if s in highFreqCountDict:
+            sampleReport.write("{:<8}".format(highFreqCountDict[s]))
+        else:
+            sampleReport.write("{:<8}".format('0'))  
+    sampleReport.write('\n')
+
+
+
+def writeProp(sampleReport, propDict, segments):
+    '''Write proportion of high frequency variants to sample report'''
+    
+    sampleReport.write("{:<3} {:<12}".format('(3)', 'Proportion'))
+    for s in segments:
+        if s in propDict:
+            sampleReport.write("{:<8}".format(propDict[s]))
+        else:
+            sampleReport.write("{:<8}".format('-')) 
+    sampleReport.write('\n')   
+
+
+
+def writeReadCount(sampleReport, primPatternCount, secPatternCount, size):
+    '''Write summary of read counts in sample and the size of '''   
+    sampleReport.write('\n\n\n\n')
+    sampleReport.write('#' * 37 + '\n')
+    sampleReport.write('#        Secondary v. primary       #\n')
+    sampleReport.write('#' * 37 + '\n')
+    sampleReport.write('\n')
+
+    # Size of secondary data compared to primary data
+    if size >= 0.01:
+        sampleReport.write('(4) Secondary data is ' + str(round(size * 100, 2)) + '% the size of primary data\n\n')
+    else:
+        sampleReport.write('(4) Secondary data is <1% of the size of primary data\n\n')
+
+    # Total number of read patterns
+    sampleReport.write("{:<10} {:<20}".format('', 'TotalReadPatterns') + '\n')
+    sampleReport.write("{:<10} {:<20}".format('Primary', str(primPatternCount)) + '\n')
+    sampleReport.write("{:<10} {:<20}".format('Secondary', str(secPatternCount)) + '\n\n\n\n')
+
+
+
+def contaminationReportLine(sample, flagged, flagList):
+    '''One line of the contamination report'''
+    return "{:<10} {:<10} {:^3} {:^10} {:^10} {:^10} {:^10} {:^10}".format(sample, flagged, '|', flagList[0], flagList[1], flagList[2], flagList[3], flagList[4]) + '\n'
+
+
+
+def contaminationTableLine(result):
+    '''One line of contaminationReport.tsv (the machine readable version of the contamination report)'''
+    values = [result['sample'], result['flagged'], result['flagCount']] + [int(flag) for flag in result['flags']]
+    values += [result['primaryGenus'], result['subtype'], result['primaryPatternCount'], result['secondaryPatternCount'], result['secondarySize']]
+    values += [','.join(result['flaggedForCount']), ','.join(result['flaggedForFreq']), ','.join(result['flaggedForProp'])]
+    return '\t'.join([str(value) for value in values]) + '\n'
+
+
+
+def writeContaminationReport(root, results):
+    '''Writes the contamination report (text and tsv) for all samples at once. Failed samples are listed below the text report'''
+    analysed = [result for result in results if not result.get('failed')]
+    failed = [result for result in results if result.get('failed')]
+
+    # Text report
+    report = "{:<10} {:<10} {:^3} {:^10} {:^10} {:^10} {:^10} {:^10}".format('Sample', 'Flagged', '|', '(1)Count', '(2)Freq', '(3)Prop', '(4)Reads', '(5)Assembly') + '\n'
+    for result in analysed:
+        report += contaminationReportLine(result['sample'], str(result['flagged']), result['flags'])
+    if len(failed) > 0:
+        report += '\nCould not analyse:\n'
+        for result in failed:
+            report += result['sample'] + '\t' + result['error'] + '\n'
+    writeAtomic(root + '/contaminationReport.txt', report)
+
+    # Machine readable report
+    table = '\t'.join(contaminationTableColumns) + '\n'
+    for result in analysed:
+        table += contaminationTableLine(result)
+    writeAtomic(root + '/contaminationReport.tsv', table)
+
+    
+
+
+#----Incremental runs----#
+def currentThresholds():
+    '''The thresholds defined in the top of the script'''
+    return {'maxVariantPercentage': maxVariantPercentage, 'maxFreq': maxFreq, 'maxFreqProp': maxFreqProp,
+            'maxSecondarySize': maxSecondarySize, 'maxFlags': maxFlags}
+
+
+
+def sampleFingerprint(samplePath):
+    '''Size and modification time of every input file of a sample, and whether a secondary assembly was made'''
+    fingerprint = []
+    inputFiles = [samplePath + 'tables/READ_COUNTS.txt'] + sorted(glob.glob(samplePath + 'tables/*-variants.txt'))
+    for filename in inputFiles:
+        try:
+            stat = os.stat(filename)
+            fingerprint.append([os.path.basename(filename), stat.st_size, stat.st_mtime_ns])
+        except OSError:
+            fingerprint.append([os.path.basename(filename), None, None])
+    fingerprint.append(['secondary_assembly', os.path.isdir(samplePath + 'secondary_assembly')])
+
+    return fingerprint
+
+
+
+def readManifest(root):
+    '''Reads the manifest from the last run. Returns an empty manifest if there is none (or it is broken)'''
+    try:
+        manifestFile = open(root + '/' + manifestName, 'r')
+        manifest = json.load(manifestFile)
+        manifestFile.close()
+    except (IOError, ValueError):
+        return {'thresholds': None, 'samples': {}}
+
+    return manifest
+
+
+
+def isUnchanged(manifest, root, sample, fingerprint):
+    '''Checks if a sample has the same fingerprint as in the manifest, and its report is still there. Failed samples are always tried again'''
+    if sample not in manifest['samples'] or manifest['samples'][sample]['fingerprint'] != fingerprint:
+        return False
+    if manifest['samples'][sample]['result'].get('failed'):
+        return False
+    return os.path.exists(root + '/' + sample + '/' + sample + '_contaminationReport.txt')
+
+
+
+def runAnalysis(root, sampleList, processes, incremental):
+    '''Analyses the samples and saves a fingerprint of each sample's input in the manifest.
+    If incremental is True, samples that haven't changed since the last run reuse their results from the manifest'''
+    thresholds = currentThresholds()
+    manifest = readManifest(root)
+
+    # Changed thresholds means every sample has to be analysed again
+    if incremental is False or manifest.get('thresholds') != thresholds:
+        manifest = {'thresholds': thresholds, 'samples': {}}
+
+    # Find samples that have changed since last run
+    fingerprints = dict()
+    changed = []
+    for sample in sampleList:
+        fingerprints[sample] = sampleFingerprint(root + '/' + sample + '/')
+        if not isUnchanged(manifest, root, sample, fingerprints[sample]):
+            changed.append(sample)
+    if incremental is True:
+        print(str(len(sampleList) - len(changed)) + ' sample(s) unchanged since last run, ' + str(len(changed)) + ' sample(s) to analyse')
+
+    # Analyse new and changed samples
+    newResults = dict(zip(changed, analyseSamples(root, changed, processes)))
+
+    # Merge with results from last run
+    results = []
+    samples = dict()
+    for sample in sampleList:
+        if sample in newResults:
+            samples[sample] = {'fingerprint': fingerprints[sample], 'result': newResults[sample]}
+        else:
+            samples[sample] = manifest['samples'][sample]
+        results.append(samples[sample]['result'])
+
+    writeManifest(root, thresholds, samples)
+
+    return results
+
+
+
+def writeManifest(root, thresholds, samples):
+    '''Saves fingerprints and results of every sample, so the next run can skip unchanged samples'''
+    writeAtomic(root + '/' + manifestName, json.dumps({'thresholds': thresholds, 'samples': samples}) + '\n')
+
+
+
+#----Watch mode----#
+def isSampleComplete(samplePath):
+    '''IRMA writes the tables when a sample is done. A sample is complete when READ_COUNTS.txt and at least one variant table exist'''
+    if not os.path.exists(samplePath + 'tables/READ_COUNTS.txt'):
+        return False
+    return len(glob.glob(samplePath + 'tables/*-variants.txt')) > 0
+
+
+
+def watchRun(root, processes, interval):
+    '''Keeps polling root for IRMA sample folders and analyses each sample as soon as it is finished.
+    A sample is analysed when it is complete and its files haven't changed since the previous poll, and again
+    whenever its files change later. Stop with Ctrl+C'''
+    thresholds = currentThresholds()
+    manifest = readManifest(root)
+    if manifest.get('thresholds') != thresholds:
+        manifest = {'thresholds': thresholds, 'samples': {}}
+
+    samples = dict()        # Finished samples and their results
+    lastFingerprints = dict()  # Fingerprints of unfinished samples from the previous poll
+
+    print('Watching ' + root + ' for finished IRMA samples every ' + str(interval) + ' seconds (stop with Ctrl+C)')
+    try:
+        while True:
+            ready = []
+            reused = 0
+            for sample in sorted(findDirectories(root)):
+                samplePath = root + '/' + sample + '/'
+                if not isSampleFolder(samplePath) or not isSampleComplete(samplePath):
+                    continue
+
+                # Already analysed. A sample whose files have changed since (e.g. IRMA was run again) is analysed again
+                fingerprint = sampleFingerprint(samplePath)
+                if sample in samples and samples[sample]['fingerprint'] == fingerprint:
+                    continue
+
+                # Analysed in an earlier run
+                if isUnchanged(manifest, root, sample, fingerprint):
+                    samples[sample] = manifest['samples'][sample]
+                    reused += 1
+
+                # IRMA is done writing when nothing changes between two polls
+                elif lastFingerprints.get(sample) == fingerprint:
+                    ready.append(sample)
+                else:
+                    lastFingerprints[sample] = fingerprint
+
+            # Analyse finished samples and update reports
+            if len(ready) > 0 or reused > 0:
+                for sample, result in zip(ready, analyseSamples(root, ready, processes)):
+                    samples[sample] = {'fingerprint': lastFingerprints.pop(sample), 'result': result}
+                    if result.get('failed'):
+                        print('Could not analyse ' + sample + ': ' + result['error'])
+                    elif result['flagged'] is True:
+                        print(sample + ' is flagged as potentially contaminated/coinfected')
+
+                samples = dict(sorted(samples.items()))
+                writeContaminationReport(root, [entry['result'] for entry in samples.values()])
+                writeManifest(root, thresholds, samples)
+                print(str(len(samples)) + ' sample(s) in contamination report')
+
+            time.sleep(interval)
+
+    except KeyboardInterrupt:
+        print('\nStopped watching ' + root)
+
+
+
+#----Running the analysis----#
+def analyseSample(root, sample):
+    '''Runs the five flag checks for one sample, writes the sample reports and returns the results as a dict. Everything is passed as arguments, so samples can be analysed in separate processes'''
+    samplePath = root + '/' + sample + '/'
+
+    # Initialize
+    flag1 = False
+    flag2 = False
+    flag3 = False
+    flag4 = False
+    flag5 = False
+    flaggedForFreq = set()
+    flaggedForProp = []
+    highFreqCountDict = {}
+    propDict = {}
+    printSample(sample)
+    sampleReport = initSampleReport()
+    data = SampleData(root, sample)
+    checkSampleData(data)
+    primaryGenus, segments = primaryData(data, sampleReport)
+
+
+
+    #####
+    # 1 # Count minority variants
+    #####
+    print('--------1. Minority variant count--------')
+    flag1, flaggedForCount, countDict = variantCount(data, sampleReport, segments)
+    print('\n')
+    
+    
+    
+    if flag1 is True:
+        #####
+        # 2 # Check frequencies in segments that were flagged as having too many minority frequencies (if any)
+        #####
+        print('--------2. Minority variant frequency--------')
+        flag2, flaggedForFreq, freqDict, highFreqCountDict = variantFrequency(data, sampleReport, flaggedForCount, countDict, segments)
+        print('\n')
+        
+        
+                    
+        if flag2 is True:              
+            #####
+            # 3 # Check proportion of high frequency minority variants (if any)
+            #####
+            print('--------3. High frequency proportion--------')
+            flag3, flaggedForProp, highFreqCountDict, propDict = highFreqProportion(data, sampleReport, freqDict, highFreqCountDict, flaggedForFreq, segments)
+            print('\n')
+            
+
+
+
+    #####
+    # 4 # Calculate size of secondary data compared to primary data
+    #####
+    print('--------4. Secondary data size--------')
+    flag4 = secondaryVprimary(data, sampleReport)
+    print('\n')
+
+
+
+    #####
+    # 5 # Look for presence of 'Secondary_assembly' folder
+    #####
+    print('--------5. Secondary assembly--------')
+    flag5 = secondaryAssembly(data, sampleReport, primaryGenus)
+
+
+
+    # Collect every value behind the flags
+    flagList = [flag1, flag2, flag3, flag4, flag5]
+    segmentResults = dict()
+    for segment in segments:
+        segmentResults[segment] = {'maxCount': math.floor(segmentLengths[segment] * maxVariantPercentage),
+                                   'count': countDict.get(segment),
+                                   'highFreqCount': highFreqCountDict.get(segment, 0) if flag1 is True else None,
+                                   'proportion': propDict.get(segment)}
+
+    result = {'sample': sample,
+              'flagged': flagList.count(True) >= maxFlags,
+              'flagCount': flagList.count(True),
+              'flags': flagList,
+              'primaryGenus': primaryGenus,
+              'subtype': data.HAsubtype.split('_')[1] + data.NAsubtype.split('_')[1],
+              'segments': segmentResults,
+              'flaggedForCount': sorted(flaggedForCount),
+              'flaggedForFreq': sorted(flaggedForFreq),
+              'flaggedForProp': sorted(flaggedForProp),
+              'primaryPatternCount': data.primPatternCount,
+              'secondaryPatternCount': data.secPatternCount,
+              'secondarySize': data.secPatternCount / data.primPatternCount,
+              'secondaryAssembly': data.secondaryAssembly,
+              'secondarySubtypes': data.subtypeDict,
+              'secondaryGenera': data.genusDict,
+              'thresholds': currentThresholds()}
+
+    # Write sample reports in one go
+    writeAtomic(samplePath + sample + '_contaminationReport.txt', sampleReport.getvalue())
+    writeAtomic(samplePath + sample + '_contaminationReport.json', json.dumps(result, indent=4) + '\n')
+
+    return result
+
+
+
+def tryAnalyseSample(root, sample):
+    '''Runs analyseSample. If the sample can't be analysed, the error is printed and returned as a failed result instead of stopping the run'''
+    try:
+        return analyseSample(root, sample)
+    except Exception as error:
+        message = str(error) if isinstance(error, AnalysisError) else type(error).__name__ + ': ' + str(error)
+        print('Error: could not analyse ' + sample + '. ' + message)
+        return {'sample': sample, 'failed': True, 'error': message}
+
+
+
+def analyseSamples(root, sampleList, processes):
+    '''Analyses every sample, either one at a time or in a pool of worker processes. Results are returned in the same order as sampleList'''
+    if processes == 1:
+        return [tryAnalyseSample(root, sample) for sample in sampleList]
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(tryAnalyseSample, [root] * len(sampleList), sampleList))
+    
+
+
+
+##############################################################################
+#                                   MAIN                                     #
+##############################################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Detect potential contamination/coinfection in IRMA output. Run it from the folder with the IRMA sample folders.')
+    parser.add_argument('-p', '--processes', type=int, default=1, help='Number of samples analysed at the same time. 0 uses all CPUs (default: 1)')
+    parser.add_argument('-i', '--incremental', action='store_true', help='Only analyse samples that are new or have changed since the last run')
+    parser.add_argument('-w', '--watch', action='store_true', help='Keep running and analyse each sample as soon as IRMA has finished it')
+    parser.add_argument('--interval', type=int, default=60, help='Seconds between checks for finished samples in watch mode (default: 60)')
+    args = parser.parse_args()
+    processes = args.processes if args.processes > 0 else os.cpu_count()
+
+    # Watch mode runs until it is stopped
+    if args.watch is True:
+        watchRun(root, processes, args.interval)
+        sys.exit(0)
+
+    # Find sample folders. Sorted, so the report has the same order no matter how many processes are used
+    sampleList = [sample for sample in sorted(findDirectories(root)) if isSampleFolder(root + '/' + sample + '/')]
+
+    # Analyse samples and write results to contamination report
+    try:
+        results = runAnalysis(root, sampleList, processes, args.incremental)
+        writeContaminationReport(root, results)
+    except AnalysisError as error:
+        print('Error: ' + str(error))
+        sys.exit(1)
+
+    failed = [result['sample'] for result in results if result.get('failed')]
+    if len(failed) > 0:
+        print('\n\nCould not analyse ' + str(len(failed)) + ' sample(s): ' + ' '.join(failed))
+    print('\n\nContamination report done!')
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# Evaluates the five contamination flags for a whole grid of thresholds at once, to see how many samples change call at each setting
+# Usage: python3 thresholdSweep.py --maxFreq 0.01 0.02 0.05 --maxFlags 2 3 (run from the folder with the IRMA output folders)
+import sys, os, argparse, itertools
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import contaminationAnalysis
+
+
+
+
+##############################################################################
+#                                INITIALIZE                                  #
+##############################################################################
+
+# Segments are stored in these slots, no matter the subtype (HA_H3 and HA_H1 both go in the HA slot)
+segmentSlots = ['PB2', 'PB1', 'PA', 'HA', 'NP', 'NA', 'MP', 'NS']
+
+sweepColumns = ['maxVariantPercentage', 'maxFreq', 'maxFreqProp', 'maxSecondarySize', 'maxFlags',
+                'Flagged', 'Flipped', 'FlippedToFlagged', 'FlippedToNotFlagged',
+                'Flag1_Count', 'Flag2_Freq', 'Flag3_Prop', 'Flag4_Reads', 'Flag5_Assembly']
+
+
+
+
+##############################################################################
+#                                 FUNCTIONS                                  #
+##############################################################################
+
+#----Loading the cohort----#
+def loadSample(root, sample):
+    '''Reads the flag inputs of one sample. Returns None if contaminationAnalysis.py can't analyse the sample either'''
+    try:
+        data = contaminationAnalysis.SampleData(root, sample)
+        contaminationAnalysis.checkSampleData(data)
+    except contaminationAnalysis.AnalysisError as error:
+        print('Warning: ' + str(error) + '. Skipping ' + sample)
+        return None
+
+    lengths = np.zeros(len(segmentSlots))
+    counts = np.zeros(len(segmentSlots), dtype=np.int64)
+    frequencies = []
+    slots = []
+    for segment, count in data.countDict.items():
+        slot = segmentSlots.index(segment.split('_')[0])
+        lengths[slot] = contaminationAnalysis.segmentLengths[segment]
+        counts[slot] = count
+        if segment in data.freqDict:
+            frequencies.append(data.freqDict[segment])
+            slots.append(np.full(len(data.freqDict[segment]), slot))
+
+    return [sample, lengths, counts, frequencies, slots, data.primPatternCount, data.secPatternCount, data.secondaryAssembly]
+
+
+
+def loadCohort(root, sampleList, processes):
+    '''Reads every sample once and puts the flag inputs of the whole cohort in NumPy arrays'''
+    if processes == 1:
+        loaded = [loadSample(root, sample) for sample in sampleList]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            loaded = list(pool.map(loadSample, [root] * len(sampleList), sampleList, chunksize=16))
+    loaded = [sampleData for sampleData in loaded if sampleData is not None]
+
+    # Frequencies of all variants in one array. variantIndex tells which sample and segment slot they belong to
+    frequencies = []
+    variantIndex = []
+    for sampleNo, sampleData in enumerate(loaded):
+        for segmentFrequencies, slots in zip(sampleData[3], sampleData[4]):
+            frequencies.append(segmentFrequencies)
+            variantIndex.append(sampleNo * len(segmentSlots) + slots)
+
+    cohort = {'samples': [sampleData[0] for sampleData in loaded],
+              'lengths': np.array([sampleData[1] for sampleData in loaded]).reshape(-1, len(segmentSlots)),
+              'counts': np.array([sampleData[2] for sampleData in loaded], dtype=np.int64).reshape(-1, len(segmentSlots)),
+              'frequencies': np.concatenate(frequencies) if len(frequencies) > 0 else np.zeros(0),
+              'variantIndex': np.concatenate(variantIndex) if len(variantIndex) > 0 else np.zeros(0, dtype=np.int64),
+              'primPatterns': np.array([sampleData[5] for sampleData in loaded], dtype=float),
+              'secPatterns': np.array([sampleData[6] for sampleData in loaded], dtype=float),
+              'secondaryAssembly': np.array([sampleData[7] for sampleData in loaded], dtype=bool)}
+
+    return cohort
+
+
+
+#----Evaluating flags----#
+def roundProportions(proportions):
+    '''Rounds to 2 decimals with Python's round, the same way contaminationAnalysis.py rounds the proportion of one segment.
+    Only the distinct proportions are rounded in Python; there are few of them, since they are small count ratios'''
+    values, inverse = np.unique(proportions.ravel(), return_inverse=True)
+    rounded = np.array([round(float(value), 2) for value in values], dtype=float)
+    return rounded[inverse.ravel()].reshape(proportions.shape)
+
+
+
+def evaluateFlags(cohort, variantPercentages, freqs, freqProps, secondarySizes):
+    '''Evaluates the five flags for every combination of thresholds in one go.
+    Returns the number of raised flags with shape [variantPercentage, freq, freqProp, secondarySize, sample] and each flag on its own'''
+    nSamples = len(cohort['samples'])
+    counts = cohort['counts']
+    variantPercentages = np.asarray(variantPercentages, dtype=float)
+    freqs = np.asarray(freqs, dtype=float)
+    freqProps = np.asarray(freqProps, dtype=float)
+    secondarySizes = np.asarray(secondarySizes, dtype=float)
+
+    # Flag1 - Variant count [P, S, segment]
+    maxCounts = np.floor(cohort['lengths'][None] * variantPercentages[:, None, None])
+    flaggedForCount = counts[None] > maxCounts
+    flag1 = flaggedForCount.any(axis=2)
+
+    # Flag2 - Variant frequency [P, F, S, segment]. Only segments flagged for count can be flagged for frequency
+    highFreqCounts = np.stack([np.bincount(cohort['variantIndex'][cohort['frequencies'] > f], minlength=nSamples * len(segmentSlots))
+                               for f in freqs]).reshape(len(freqs), nSamples, len(segmentSlots))
+    flaggedForFreq = flaggedForCount[:, None] & (highFreqCounts[None] > 0)
+    flag2 = flaggedForFreq.any(axis=3)
+
+    # Flag3 - High frequency proportion [P, F, Q, S]. Only segments flagged for frequency can be flagged for proportion.
+    # np.round can differ from Python's round at half-way values, so the same rounding as contaminationAnalysis.py is used
+    with np.errstate(divide='ignore', invalid='ignore'):
+        proportions = roundProportions(highFreqCounts / counts[None])
+    flaggedForProp = flaggedForFreq[:, :, None] & (proportions[None, :, None] > freqProps[None, None, :, None, None])
+    flag3 = flaggedForProp.any(axis=4)
+
+    # Flag4 - Secondary data size [Z, S]. Samples without primary patterns were left out by loadSample
+    flag4 = (cohort['secPatterns'] / cohort['primPatterns'])[None] > secondarySizes[:, None]
+
+    # Flag5 - Secondary assembly [S]
+    flag5 = cohort['secondaryAssembly']
+
+    flagCount = (flag1[:, None, None, None].astype(np.int8) + flag2[:, :, None, None] + flag3[:, :, :, None]
+                 + flag4[None, None, None] + flag5)
+
+    return flagCount, [flag1, flag2, flag3, flag4, flag5]
+
+
+
+def sweep(cohort, grid):
+    '''Evaluates the flags for every combination in grid and compares the calls to the thresholds in contaminationAnalysis.py'''
+    # Call with the current thresholds
+    thresholds = contaminationAnalysis.currentThresholds()
+    baseCount, baseFlags = evaluateFlags(cohort, [thresholds['maxVariantPercentage']], [thresholds['maxFreq']],
+                                         [thresholds['maxFreqProp']], [thresholds['maxSecondarySize']])
+    baseFlagged = baseCount[0, 0, 0, 0] >= thresholds['maxFlags']
+
+    flagCount, flags = evaluateFlags(cohort, grid['maxVariantPercentage'], grid['maxFreq'], grid['maxFreqProp'], grid['maxSecondarySize'])
+
+    rows = []
+    for m, maxFlags in enumerate(grid['maxFlags']):
+        flagged = flagCount >= maxFlags
+        flippedToFlagged = (flagged & ~baseFlagged).sum(axis=-1)
+        flippedToNotFlagged = (~flagged & baseFlagged).sum(axis=-1)
+        nFlagged = flagged.sum(axis=-1)
+
+        for p, f, q, z in itertools.product(*[range(len(grid[name])) for name in sweepColumns[:4]]):
+            rows.append([grid['maxVariantPercentage'][p], grid['maxFreq'][f], grid['maxFreqProp'][q], grid['maxSecondarySize'][z], maxFlags,
+                         int(nFlagged[p, f, q, z]), int(flippedToFlagged[p, f, q, z] + flippedToNotFlagged[p, f, q, z]),
+                         int(flippedToFlagged[p, f, q, z]), int(flippedToNotFlagged[p, f, q, z]),
+                         int(flags[0][p].sum()), int(flags[1][p, f].sum()), int(flags[2][p, f, q].sum()), int(flags[3][z].sum()), int(flags[4].sum())])
+
+    return rows, int(baseFlagged.sum())
+
+
+
+def writeSweep(filename, rows):
+    '''Writes the sensitivity table'''
+    outfile = contaminationAnalysis.openFile(filename, 'w')
+    outfile.write('\t'.join(sweepColumns) + '\n')
+    for row in rows:
+        outfile.write('\t'.join([str(value) for value in row]) + '\n')
+    outfile.close()
+
+
+
+
+##############################################################################
+#                                   MAIN                                     #
+##############################################################################
+if __name__ == '__main__':
+    thresholds = contaminationAnalysis.currentThresholds()
+    parser = argparse.ArgumentParser(description='Evaluate the contamination flags for a grid of thresholds. Every threshold takes one or more values; '
+                                                 'thresholds that are not given keep the value from contaminationAnalysis.py.')
+    parser.add_argument('--maxVariantPercentage', type=float, nargs='+', default=[thresholds['maxVariantPercentage']])
+    parser.add_argument('--maxFreq', type=float, nargs='+', default=[thresholds['maxFreq']])
+    parser.add_argument('--maxFreqProp', type=float, nargs='+', default=[thresholds['maxFreqProp']])
+    parser.add_argument('--maxSecondarySize', type=float, nargs='+', default=[thresholds['maxSecondarySize']])
+    parser.add_argument('--maxFlags', type=int, nargs='+', default=[thresholds['maxFlags']])
+    parser.add_argument('-p', '--processes', type=int, default=1, help='Number of processes used to read the samples. 0 uses all CPUs (default: 1)')
+    parser.add_argument('-o', '--outfile', default='thresholdSweep.tsv', help='Name of the sensitivity table (default: thresholdSweep.tsv)')
+    args = parser.parse_args()
+    processes = args.processes if args.processes > 0 else os.cpu_count()
+
+    root = os.getcwd()
+    sampleList = [sample for sample in sorted(contaminationAnalysis.findDirectories(root)) if contaminationAnalysis.isSampleFolder(root + '/' + sample + '/')]
+    if len(sampleList) == 0:
+        print('No IRMA sample folders found in ' + root)
+        contaminationAnalysis.usage()
+
+    # Read every sample once
+    cohort = loadCohort(root, sampleList, processes)
+    print(str(len(cohort['samples'])) + ' samples and ' + str(len(cohort['frequencies'])) + ' minority variants loaded')
+
+    # Evaluate the whole grid
+    grid = {name: getattr(args, name) for name in sweepColumns[:5]}
+    rows, baseFlagged = sweep(cohort, grid)
+    writeSweep(args.outfile, rows)
+
+    print(str(baseFlagged) + ' samples are flagged with the thresholds in contaminationAnalysis.py')
+    print(str(len(rows)) + ' threshold combinations written to ' + args.outfile)
@@ -1,554 +1,568 @@
-#!/usr/bin/env python3
-# My own version of the mutation finder script
-# Usage H3N2_mutationFinder.py
-import sys, os, glob
-
-
-
-#############################################################################################
-#                                         INITIALIZE                                        #
-#############################################################################################
-
-# Thresholds
-minFrequency = 0.025
-minQuality = 30
-minDepth = 100
-minCount = 15
-
-# Valid input responses
-negativeResponses = ['n', 'N', 'no', 'No']
-positiveResponses = ['y', 'yes', 'Y', 'Yes']
-
-# Other stuff
-segments = ['PB1', 'PB2', 'PA', 'HA_H3', 'NP', 'NA_N2', 'MP', 'NS']
-geneLengths = {'PB1': 2274, 'PB1-2': 273, 'PB2': 2280, 'PA': 2151, 'PA-2': 759, 'HA_H3': 1701, 'NP': 1497, 'NA_N2': 1410, 'MP': 759, 'MP-2': 294, 'NS': 693, 'NS-2': 366}
-
-positionDict = {'PB1':[[0,2274],[94,367]] , 
-                'PB2':[[0,2274]] , 
-                'PA':[[0,2151],[0,573],[574,760]] , 
-                'HA_H3':[[0,1701]] , 
-                'NP':[[0,1497]] , 
-                'NA_N2':[[0,1410]] , 
-                'MP':[[0,759],[0,26,714,982]] , 
-                'NS': [[0, 693],[0,30,502,838]]}
-
-translationDict = { 'ATA':'I', 'ATC':'I', 'ATT':'I', 'ATG':'M',
-                    'ACA':'T', 'ACC':'T', 'ACG':'T', 'ACT':'T',
-                    'AAC':'N', 'AAT':'N', 'AAA':'K', 'AAG':'K',
-                    'AGC':'S', 'AGT':'S', 'AGA':'R', 'AGG':'R',
-                    'CTA':'L', 'CTC':'L', 'CTG':'L', 'CTT':'L',
-                    'CCA':'P', 'CCC':'P', 'CCG':'P', 'CCT':'P',
-                    'CAC':'H', 'CAT':'H', 'CAA':'Q', 'CAG':'Q',
-                    'CGA':'R', 'CGC':'R', 'CGG':'R', 'CGT':'R',
-                    'GTA':'V', 'GTC':'V', 'GTG':'V', 'GTT':'V',
-                    'GCA':'A', 'GCC':'A', 'GCG':'A', 'GCT':'A',
-                    'GAC':'D', 'GAT':'D', 'GAA':'E', 'GAG':'E',
-                    'GGA':'G', 'GGC':'G', 'GGG':'G', 'GGT':'G',
-                    'TCA':'S', 'TCC':'S', 'TCG':'S', 'TCT':'S',
-                    'TTC':'F', 'TTT':'F', 'TTA':'L', 'TTG':'L',
-                    'TAC':'Y', 'TAT':'Y', 'TAA':'*', 'TAG':'*',
-                    'TGC':'C', 'TGT':'C', 'TGA':'*', 'TGG':'W' }
-
-
-
-
-#############################################################################################
-#                                           FUNCTIONS                                       #
-#############################################################################################
-
-def usage():
-    print('\nUsage: python3 H3N2_mutationFinder.py OPTIONAL: <sample name>')
-    print('Accepted responses to input request:')
-    print('Negative: n, N, no, No')
-    print('Positive: y, Y, yes, yes')
-
-    print('\nExiting program')
-    sys.exit(1)
-
-
-
-def findSamples():
-    '''Searches root directory for IRMA output directories and returns a list of sample directory names'''
-    sampleList = []
-    pathList = []
-    rootDir = os.getcwd()
-
-    # Find everything in this folder
-    print('Searcing ' + str(rootDir) + ' for sample directories')
-    searchList = os.listdir(".")
-
-    # Find the entries that are existing directories
-    for entry in searchList:
-        path = os.path.join(rootDir, entry)
-        if os.path.isdir(path):
-            pathList.append(path)
-            sampleList.append(entry)
-
-    # No directories found
-    if len(pathList) == 0:
-        print('No sample folders found. Exiting program.')
-        sys.exit(1)
-
-    #Confirm these are the samples the user wants
-    confirmed = False
-    while confirmed is False:
-        sampleList, confirmed = confirmSampleList(sampleList, confirmed)
-
-    return sampleList
-
-
-
-def confirmSampleList(sampleList, confirmed):
-    '''Takes a list of samples and gives the user the option to remove samples before confirming'''
-     # Print directories found
-    print(str(len(sampleList)) + ' samples were found:')
-    sampleNo = 0
-    for sample in sampleList:
-        sampleNo += 1
-        print(str(sampleNo) + '\t' + sample)
-
-    # Get user input
-    proceed = input('Do you wish to proceed with these sample directories? (y/n): ')
-    
-    # Make no changes and proceed with these samples
-    if proceed in positiveResponses:
-        confirmed = True
-
-    # Samples are not as user wants them
-    elif proceed in negativeResponses:
-        # Ask whether to remove directories
-        remove = input('Do you wish to remove one or more of the directories? (y/n): ')       
-        if remove in positiveResponses:
-            unwanted = input('Please enter the directory name(s) you wish to remove (if more than one directory, separate by space): ')
-            sampleList = removeDirectories(sampleList, unwanted.split(' '))
-        elif remove in negativeResponses:
-            print('Exiting program')
-            sys.exit(0)
-        else:
-            print('ERROR: Input not recognized. Please see usage output for valid input responses:')
-            usage()
-
-    # Invalid response given
-    else:
-        print('ERROR: Input not recognized. Please see usage output for valid input responses:')
-        usage()
-
-    return sampleList, confirmed
-
-
-    
-def removeDirectories(sampleList, unwantedList):
-    '''Takes a list of sample directory names and a list of the names to be removed'''
-    updatedSampleList = [x for x in sampleList if x not in unwantedList]
-    
-    return updatedSampleList
-
-
-
-def readVariantData(dataLine):
-    '''Takes a line from -variants.txt and returns the needed variables'''
-    dataList = dataLine.split('\t')
-    position = int(dataList[1])
-    depth = int(dataList[2])
-    consensusBase = str(dataList[3])
-    minorityBase = str(dataList[4])
-    count = int(dataList[6])
-    frequency = float(dataList[8])
-    quality = float(dataList[10])
-
-    return position, depth, consensusBase, minorityBase, count, frequency, quality
-
-
-
-def validateVariant(dataLine):
-    '''Takes a line of variant data and compares to thresholds defined in top of script'''
-    position, depth, consensusBase, minorityBase, count, frequency, quality = readVariantData(dataLine)
-
-    # Check if data passes thresholds:
-    if quality >= minQuality and depth >= minDepth and frequency >= minFrequency and count >= minCount:
-        return 'PASS'
-    else:
-        return 'FAIL'
-
-
-
-def checkConsensusLength(segment, sequence, warning_list):
-    '''Check if length of majority consensus matches "official" length'''
-    diff = len(sequence) - geneLengths[segment]   
-    if diff < 0:
-        warning_list.append('Majority sequence is ' + str(abs(diff)) + ' bases shorter than reference')
-    elif diff > 0:
-        warning_list.append('Majority sequence is ' + str(abs(diff)) + ' bases longer than reference')  
-
-    return warning_list
-
-
-
-def makeConsensus(sample, segment, warningList):
-    '''Reads consensus sequence to string'''
-    # Open consensus file
-    try:
-        consensusFile = open(sample + '/' + segment + '_consensus.fna', 'r')
-    except OSError as error:
-        print('File {:s} failed to open'.format(error.filename))
-        sys.exit(1)
-
-    #Read whole consensus to string
-    consensusSeq = ''
-    for line in consensusFile:
-        if not line.startswith('>'):
-            consensusSeq += line[:-1]
-    consensusFile.close()
-
-    return consensusSeq, warningList
-
-
-
-def mutationInGene(genePositions, minorityPosition):
-    '''Checks if mutation is in the gene'''
-
-    if len(genePositions) == 2:
-        if minorityPosition > genePositions[0] and minorityPosition <= genePositions[1]:
-            return True
-        else:
-            return False
-    
-    elif len(genePositions) == 4:
-        if (minorityPosition > genePositions[0] and minorityPosition <= genePositions[1]) or (minorityPosition > genePositions[2] and minorityPosition <= genePositions[3]):
-            return True
-        else:
-            return False
-
-    #Invalid number of gene positions
-    else:
-        print('ERROR: Invalid number of gene positions')
-        print('Exiting program')
-        sys.exit(1)
-
-
-
-def compareLength(consensusSequence, minoritySequence):
-    '''Check if majority and minority sequences have same length. I not, program will will stop as something must be wrong with the code'''
-    if len(consensusSequence) != len(minoritySequence):
-        print('ERROR: Majority and minority sequences do not have the same length')
-        print('Major (' + str(len(consensusSequence)) + '):')
-        print(consensusSequence)
-        print('Minor (' + str(len(minoritySequence)) + '):')
-        print(minoritySequence)
-        print('Exiting program')
-        sys.exit(1)
-
-
-
-def checkLength(geneName, sequence, warningList):
-    '''Check if length of majority consensus matches "official" length'''
-    diff = len(sequence) - geneLengths[geneName]   
-    if diff < 0:
-        warningList.append('Majority gene sequence is ' + str(abs(diff)) + ' bases too short')
-    elif diff > 0:
-        warningList.append('Majority gene sequence is ' + str(abs(diff)) + ' bases too long')  
-
-    return warningList
-
-
-
-def translateSequence(sequence):
-    '''Translate the spliced genes to amino acid to make sure it looks alright'''
-    proteinSeq = ''
-    for i in range(0, len(sequence), 3):
-        codon = sequence[i:i+3]
-        if len(codon) == 3:
-            try:
-                aa = translationDict[codon]
-            except:
-                aa = 'X'
-        proteinSeq += aa
-
-    return proteinSeq
-
-
-
-def checkStartCodon(sequence, warningList):
-    '''Check if majority consensus starts with ATG'''
-    if not sequence.startswith('ATG'):
-        warningList.append('Consensus sequence starts with ' + sequence[:3] + ' instead of ATG')
-
-    return warningList
-
-
-
-def checkStopCodon(proteinSeq, warningList):
-    '''Check if protein sequence ends with a stop codon'''
-    if proteinSeq[-1] != '*':
-        warningList.append('Gene does not end in stop codon. Check if protein sequence looks valid:' + '\n' + proteinSeq) 
-
-    return warningList
-
-
-
-def findAA(position, consensus):
-    '''Takes the position of a variant site (int) and a consensus sequence (str) and returns the amino acid for the corresponding codon'''
-    #Find starting position of the codon which the minority variant belongs to
-    modulo = position%3
-    if modulo == 0: #If pos is the 3rd base in a codon
-        codon_start = position - 2
-    elif modulo == 1: #If pos is 1st base in a codon
-        codon_start = position
-    elif modulo == 2: #If pos i 2nd base in a codon
-        codon_start = position - 1
-
-    codon = consensus[codon_start - 1 : codon_start + 2]
-    #print('Codon: ' + codon)
-   
-    if 'N' in codon:
-        return codon, 'X'
-    else:
-        aa = translationDict[codon]
-        return codon, aa
-
-
-
-def insertVariant(consensusSequence, variantData):
-    '''Inserts variant into consensus sequence to create minority sequence'''
-    dataList = readVariantData(variantData)
-    position = dataList[0]
-    base = dataList[3]
-    minoritySequence = consensusSeq[:position-1] + base + consensusSeq[position:]
-
-    return minoritySequence
-
-
-
-#MAYBE NOT NEEDED
-def spliceGene(sequence, genePositions):
-    splicedSequence = sequence[genePositions[0]:genePositions[1]] + sequence[genePositions[2]:genePositions[3]]
-
-    return splicedSequence
-
-
-
-def updateVariantPosition(position, genePositions):
-    '''Updates position of variant if placed in the second part of spliced gene'''
-
-    #If gene is spliced and variant is placed in second part of spliced gene
-    if len(genePositions) == 4 and genePositions[2] < position <= genePositions[3]: 
-        position = position - (genePositions[2] - genePositions[1])
-    #If gene is not spliced, but startposition is not 0
-    elif len(genePositions) == 2 and genePositions[0] != 0:
-        position = position - genePositions[0] + 1
-
-    return position
-
-
-
-def errorCheckSequences(geneName, minorityGene, consensusGene, warningList):
-    '''Checks the majority and minority genes for issues'''
-    #Make sure that minority and consensus sequence have the same length
-    compareLength(consensusGene, minorityGene)
-
-    #Check that the gene has the length it is supposed to have
-    warningList = checkLength(geneName, consensusGene, warningList)
-
-    #Start codon
-    warningList = checkStartCodon(consensusGene, warningList)
-
-    #Stop codon
-    proteinGene = translateSequence(minorityGene)
-    warningList = checkStopCodon(proteinGene, warningList)
-
-    return warningList
-
-
-
-def printWarnings(warning_list):
-    '''Print warnings found for segment'''
-    print(str(len(warning_list)) + ' warning(s)')
-    for warning in warning_list:
-        print(warning)
-    print('\n\n')
-
-
-
-def printSample(sample):
-    head = '#     ' + str(sample) + '     #'
-    line = '#' * len(head)
-    print(line)
-    print(head)
-    print(line)
-
-
-
-def printGene(segment, geneNumber):
-    print('\n------------------------------------')
-    if geneNumber == 1:   
-        print('               ' + segment)
-    elif geneNumber == 2:
-        print('              ' + segment + ' prot2')
-
-
-
-def getGene(sequence, genePositions):
-    #Unspliced gene
-    if len(genePositions) == 2:
-        gene = sequence[genePositions[0]:genePositions[1]]
-    #Spliced gene       
-    elif len(genePositions) == 4:
-        gene = sequence[genePositions[0]:genePositions[1]] + sequence[genePositions[2]:genePositions[3]]   
-
-    return gene
-
-
-
-def initializeOutfile(sample, segment, geneNumber):
-    filename = None
-    if geneNumber == 1:
-        filename = str(sample) + '/mutations/' + str(sample) + '_mutations_' + str(segment) + '.txt'
-    else:
-        filename = str(sample) + '/mutations/' + str(sample) + '_mutations_' + str(segment) + '_prot2.txt'
-
-    outfile = open(filename, 'w')
-    outfile.write('\t'.join(["Sample", "Segment", "Position", "MajorCodon", "MajorAA", "MinorCodon", "MinorAA", "Mutation", '\n']))
-    outfile.close()
-
-    return filename
-
-
-
-def writeToOutfile(filename, variantData, segment, sample, majorCodon, majorAA, minorCodon, minorAA):
-    position = readVariantData(variantData)[0]
-    outfile = open(filename, 'a')
-    outfile.write(sample + '\t' + segment + '\t' + str(position) + '\t' + majorCodon + '\t' + majorAA + '\t' + minorCodon + '\t' + minorAA + '\t')
-
-    if majorAA == minorAA:
-        outfile.write('Synonymous\n')
-    else:
-        outfile.write('Non-synonymous\n')
-    outfile.close()
-
-
-
-
-
-
-
-
-
-
-
-
-#############################################################################################
-#                                              MAIN                                         #
-#############################################################################################
-
-
-# No specific sample given; search for sample directories
-if len(sys.argv) == 1:
-    samples = findSamples()
-# One specific sample given
-elif len(sys.argv) == 2:
-    samples = [str(sys.argv[1])]
-# Error, print usage and exit
-else:
-    usage()
-
-
-
-# SAMPLE
-for sample in samples:   
-    printSample(sample)
-
-    #Make minority directory if it doesn't already exist
-    mutDirExist = os.path.exists('./' + sample + '/mutations')
-    if not mutDirExist:
-        os.makedirs('./' + sample + '/mutations')
-
-
-    # SEGMENT
-    for segment in segments:
-
-        # Open variant file
-        try:
-            variantFile = open(sample + '/tables/A_' + segment + '-variants.txt', 'r')
-        except OSError as error:
-            print('File {:s} failed to open'.format(error.filename))
-            continue
-
-        #Check if there are any variants in this segment
-        variantEntries = []
-        for line in variantFile:
-            if not line.startswith('Reference_Name'):
-                variantEntries.append(line)
-        variantFile.close()
-        if len(variantEntries) > 0:
-
-
-            # GENES IN SEGMENT
-            geneNumber = 0
-            for genePosition in positionDict[segment]:
-                warningList = []
-                geneNumber += 1
-                printGene(segment, geneNumber)
-
-                # Read consensus to string
-                consensusSeq, warningList = makeConsensus(sample, segment, warningList)
-  
-
-                # VARIANTS IN SEGMENT
-                variantFound = False
-                for variantData in variantEntries:
-                    position = int(variantData.split('\t')[1]) 
-                    #print('Variant position: ' + str(position))
-
-                    # Check that the mutation is within this gene and passes threholds
-                    if mutationInGene(genePosition, position) is True and validateVariant(variantData) == 'PASS':
-
-                        #If this is the first variant found in this gene, initialize the outfile
-                        if variantFound is False:
-                            filename = initializeOutfile(sample, segment, geneNumber)
-                            variantFound = True
-
-                        #Insert the mutation 
-                        minoritySeq = insertVariant(consensusSeq, variantData)
-                        #print('Length of full sequenses: ' + str(len(consensusSeq)) + ' v. ' + str(len(minoritySeq)))
-                    
-                        # Update position of variant site
-                        position = updateVariantPosition(position, genePosition)
-
-                        # Extract the gene from the created sequences
-                        majorityGene = getGene(consensusSeq, genePosition)
-                        minorityGene = getGene(minoritySeq, genePosition)
-
-                        #Name of gene
-                        if geneNumber == 1:
-                            geneName = segment
-                        elif geneNumber == 2:
-                            geneName = segment + '-2'
-
-                        # Check the genes for errors
-                        warningList = errorCheckSequences(geneName, minorityGene, majorityGene, warningList)
-                        
-                        # Find codon and amino acid for consensus and minority sequence
-                        majCodon, majAA = findAA(position, majorityGene)
-                        minCodon, minAA = findAA(position, minorityGene)
-
-                        #Write to outfile
-                        writeToOutfile(filename, variantData, segment, sample, majCodon, majAA, minCodon, minAA)
-                        
-                printWarnings(warningList)
-    
-                        
-                
-
-                    
-
-
-
-
-
-
-
-
-
-        
-        
-
+#!/usr/bin/env python3
+# My own version of the mutation finder script
+# Usage H3N2_mutationFinder.py [sample name] [--subtype H3N2|H1N1|B] [--cohort <mutations.parquet or .arrow>]
+#       H3N2_mutationFinder.py --manifest <samples.txt> | --glob '<pattern>' [-p processes] [--report <units.tsv>] (batch mode, no prompts)
+import sys, os, glob, argparse, io, time, contextlib
+from concurrent.futures import ProcessPoolExecutor
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Common'))
+import irmaTables, annotationRegistry, translation
+import numpy as np
+
+
+#############################################################################################
+#                                         INITIALIZE                                        #
+#############################################################################################
+
+# Thresholds
+minFrequency = 0.025
+minQuality = 30
+minDepth = 100
+minCount = 15
+
+# Valid input responses
+negativeResponses = ['n', 'N', 'no', 'No']
+positiveResponses = ['y', 'yes', 'Y', 'Yes']
+
+# Columns of the mutation tables, and the types used in the optional cohort file
+mutationColumns = ["Sample", "Segment", "Position", "MajorCodon", "MajorAA", "MinorCodon", "MinorAA", "Mutation"]
+cohortColumns = [('Sample', 'string'), ('Segment', 'string'), ('Gene', 'string'), ('Position', 'int32'), ('Depth', 'int32'),
+                 ('Count', 'int32'), ('Frequency', 'float64'), ('Quality', 'float64'), ('MajorCodon', 'string'), ('MajorAA', 'string'),
+                 ('MinorCodon', 'string'), ('MinorAA', 'string'), ('Synonymous', 'bool')]
+
+# Genes are read from Common/annotations/<subtype>.json
+defaultSubtype = 'H3N2'
+
+
+
+
+#############################################################################################
+#                                           FUNCTIONS                                       #
+#############################################################################################
+
+def usage():
+    print('\nUsage: python3 H3N2_mutationFinder.py OPTIONAL: <sample name> --cohort <mutations.parquet or mutations.arrow>')
+    print('--cohort also writes the mutations of all samples to one Parquet or Arrow IPC file (needs pyarrow)')
+    print('Batch mode (no questions asked): --manifest <file with one sample per line> or --glob <sample directory pattern>, -p <processes>')
+    print('Accepted responses to input request:')
+    print('Negative: n, N, no, No')
+    print('Positive: y, Y, yes, yes')
+
+    print('\nExiting program')
+    sys.exit(1)
+
+
+
+def findSamples():
+    '''Searches root directory for IRMA output directories and returns a list of sample directory names'''
+    sampleList = []
+    pathList = []
+    rootDir = os.getcwd()
+
+    # Find everything in this folder
+    print('Searcing ' + str(rootDir) + ' for sample directories')
+    searchList = os.listdir(".")
+
+    # Find the entries that are existing directories
+    for entry in searchList:
+        path = os.path.join(rootDir, entry)
+        if os.path.isdir(path):
+            pathList.append(path)
+            sampleList.append(entry)
+
+    # No directories found
+    if len(pathList) == 0:
+        print('No sample folders found. Exiting program.')
+        sys.exit(1)
+
+    #Confirm these are the samples the user wants
+    confirmed = False
+    while confirmed is False:
+        sampleList, confirmed = confirmSampleList(sampleList, confirmed)
+
+    return sampleList
+
+
+
+def confirmSampleList(sampleList, confirmed):
+    '''Takes a list of samples and gives the user the option to remove samples before confirming'''
+     # Print directories found
+    print(str(len(sampleList)) + ' samples were found:')
+    sampleNo = 0
+    for sample in sampleList:
+        sampleNo += 1
+        print(str(sampleNo) + '\t' + sample)
+
+    # Get user input
+    proceed = input('Do you wish to proceed with these sample directories? (y/n): ')
+    
+    # Make no changes and proceed with these samples
+    if proceed in positiveResponses:
+        confirmed = True
+
+    # Samples are not as user wants them
+    elif proceed in negativeResponses:
+        # Ask whether to remove directories
+        remove = input('Do you wish to remove one or more of the directories? (y/n): ')       
+        if remove in positiveResponses:
+            unwanted = input('Please enter the directory name(s) you wish to remove (if more than one directory, separate by space): ')
+            sampleList = removeDirectories(sampleList, unwanted.split(' '))
+        elif remove in negativeResponses:
+            print('Exiting program')
+            sys.exit(0)
+        else:
+            print('ERROR: Input not recognized. Please see usage output for valid input responses:')
+            usage()
+
+    # Invalid response given
+    else:
+        print('ERROR: Input not recognized. Please see usage output for valid input responses:')
+        usage()
+
+    return sampleList, confirmed
+
+
+    
+def removeDirectories(sampleList, unwantedList):
+    '''Takes a list of sample directory names and a list of the names to be removed'''
+    updatedSampleList = [x for x in sampleList if x not in unwantedList]
+    
+    return updatedSampleList
+
+
+
+def validateVariants(variantEntries):
+    '''Compares every variant of a -variants.txt table to the thresholds defined in top of script. Returns True for the ones that pass'''
+    return ((variantEntries['Minority_Average_Quality'] >= minQuality) & (variantEntries['Total'] >= minDepth)
+            & (variantEntries['Minority_Frequency'] >= minFrequency) & (variantEntries['Minority_Count'] >= minCount))
+
+
+
+def makeConsensus(sample, segment, warningList):
+    '''Reads consensus sequence to string'''
+    # Open consensus file
+    try:
+        consensusFile = open(os.path.join(sample, segment + '_consensus.fna'), 'r')
+    except OSError as error:
+        print('File {:s} failed to open'.format(error.filename))
+        sys.exit(1)
+
+    #Read whole consensus to string
+    consensusSeq = ''
+    for line in consensusFile:
+        if not line.startswith('>'):
+            consensusSeq += line[:-1]
+    consensusFile.close()
+
+    return consensusSeq, warningList
+
+
+
+def checkLength(geneLength, sequence, warningList):
+    '''Check if length of majority consensus matches "official" length'''
+    diff = len(sequence) - geneLength   
+    if diff < 0:
+        warningList.append('Majority gene sequence is ' + str(abs(diff)) + ' bases too short')
+    elif diff > 0:
+        warningList.append('Majority gene sequence is ' + str(abs(diff)) + ' bases too long')  
+
+    return warningList
+
+
+
+def checkStartCodon(sequence, warningList):
+    '''Check if majority consensus starts with ATG'''
+    if not sequence.startswith('ATG'):
+        warningList.append('Consensus sequence starts with ' + sequence[:3] + ' instead of ATG')
+
+    return warningList
+
+
+
+def checkStopCodon(proteinSeq, warningList):
+    '''Check if protein sequence ends with a stop codon'''
+    if proteinSeq[-1] != '*':
+        warningList.append('Gene does not end in stop codon. Check if protein sequence looks valid:' + '\n' + proteinSeq) 
+
+    return warningList
+
+
+
+def annotateVariants(consensusGene, cdsOffsets, frames, minorityBases, warningList):
+    '''Finds the major and minor codon and amino acid of every variant in a gene in one go.
+    Only the codon a variant sits in is looked at, the minor codon is the major codon with the minority base put in'''
+    # Two N's at the end, so a codon running over the end of the gene becomes X
+    geneBases = np.frombuffer(consensusGene.encode() + b'NN', dtype=np.uint8)
+
+    # Codon of each variant and where in that codon the minority base goes
+    codonStarts = cdsOffsets - frames
+    majorCodons = geneBases[codonStarts[:, None] + np.arange(3)]
+    minorCodons = majorCodons.copy()
+    minorCodons[np.arange(len(frames)), frames] = minorityBases
+
+    majorAAs = translation.translateCodons(majorCodons).view('S1').astype(str)
+    minorAAs = translation.translateCodons(minorCodons).view('S1').astype(str)
+
+    # A variant in the last codon can remove the stop codon
+    lastCodon = (len(consensusGene) // 3 - 1) * 3
+    for i in np.flatnonzero((codonStarts == lastCodon) & (majorAAs == '*') & (minorAAs != '*')):
+        warningList.append('Minority variant at CDS position ' + str(cdsOffsets[i] + 1) + ' removes the stop codon')
+
+    majorCodons = np.ascontiguousarray(majorCodons).view('S3').ravel().astype(str)
+    minorCodons = np.ascontiguousarray(minorCodons).view('S3').ravel().astype(str)
+
+    return majorCodons, majorAAs, minorCodons, minorAAs, warningList
+
+
+
+#MAYBE NOT NEEDED
+def spliceGene(sequence, genePositions):
+    splicedSequence = sequence[genePositions[0]:genePositions[1]] + sequence[genePositions[2]:genePositions[3]]
+
+    return splicedSequence
+
+
+
+def errorCheckGene(geneLength, consensusGene, warningList):
+    '''Checks the majority gene for issues. Done once per gene; variants that change the stop codon are caught in annotateVariants'''
+    #Check that the gene has the length it is supposed to have
+    warningList = checkLength(geneLength, consensusGene, warningList)
+
+    #Start codon
+    warningList = checkStartCodon(consensusGene, warningList)
+
+    #Stop codon
+    proteinGene = translation.translate(consensusGene)
+    warningList = checkStopCodon(proteinGene, warningList)
+
+    return warningList
+
+
+
+def printWarnings(warning_list):
+    '''Print warnings found for segment'''
+    print(str(len(warning_list)) + ' warning(s)')
+    for warning in warning_list:
+        print(warning)
+    print('\n\n')
+
+
+
+def printSample(sample):
+    head = '#     ' + str(sample) + '     #'
+    line = '#' * len(head)
+    print(line)
+    print(head)
+    print(line)
+
+
+
+def printGene(segment, geneName):
+    print('\n------------------------------------')
+    print('               ' + segment + ' ' + geneName)
+
+
+
+def sampleName(sample):
+    '''Name of a sample given as a folder path (e.g. from --glob or --manifest)'''
+    return os.path.basename(os.path.normpath(str(sample)))
+
+
+
+def mutationFilename(sample, segment, geneNumber):
+    '''Mutation table of a gene. sample is the sample folder; only its name is used in the filename'''
+    if geneNumber == 1:
+        return os.path.join(str(sample), 'mutations', sampleName(sample) + '_mutations_' + str(segment) + '.txt')
+    else:
+        return os.path.join(str(sample), 'mutations', sampleName(sample) + '_mutations_' + str(segment) + '_prot' + str(geneNumber) + '.txt')
+
+
+
+def writeMutations(filename, sample, segment, positions, majorCodons, majorAAs, minorCodons, minorAAs):
+    '''Writes the mutation table of one gene in a single write'''
+    lines = ['\t'.join(mutationColumns + ['\n'])]
+    for position, majorCodon, majorAA, minorCodon, minorAA in zip(positions, majorCodons, majorAAs, minorCodons, minorAAs):
+        mutation = 'Synonymous' if majorAA == minorAA else 'Non-synonymous'
+        lines.append('\t'.join([sample, segment, str(position), majorCodon, majorAA, minorCodon, minorAA, mutation]) + '\n')
+
+    outfile = open(filename, 'w')
+    outfile.write(''.join(lines))
+    outfile.close()
+
+
+
+def addToCohort(cohort, sample, segment, geneName, variants, majorCodons, majorAAs, minorCodons, minorAAs):
+    '''Adds the mutations of one gene to the cohort columns'''
+    cohort['Sample'].extend([sample] * len(variants))
+    cohort['Segment'].extend([segment] * len(variants))
+    cohort['Gene'].extend([geneName] * len(variants))
+    cohort['Position'].append(variants['Position'])
+    cohort['Depth'].append(variants['Total'])
+    cohort['Count'].append(variants['Minority_Count'])
+    cohort['Frequency'].append(variants['Minority_Frequency'])
+    cohort['Quality'].append(variants['Minority_Average_Quality'])
+    cohort['MajorCodon'].extend(majorCodons)
+    cohort['MajorAA'].extend(majorAAs)
+    cohort['MinorCodon'].extend(minorCodons)
+    cohort['MinorAA'].extend(minorAAs)
+    cohort['Synonymous'].append(np.asarray(majorAAs) == np.asarray(minorAAs))
+
+
+
+def writeCohort(filename, cohort):
+    '''Writes the mutations of all samples to one Parquet file, or an Arrow IPC file if the name ends with .arrow/.feather'''
+    import pyarrow as pa
+    arrays = []
+    for name, columnType in cohortColumns:
+        values = cohort[name]
+        if columnType == 'string':
+            arrays.append(pa.array([str(value) for value in values], type=pa.string()).dictionary_encode())
+        else:
+            values = np.concatenate(values) if len(values) > 0 else np.zeros(0)
+            arrays.append(pa.array(values.astype(columnType)))
+    table = pa.Table.from_arrays(arrays, names=[name for name, columnType in cohortColumns])
+
+    if filename.endswith('.arrow') or filename.endswith('.feather'):
+        import pyarrow.feather as feather
+        feather.write_feather(table, filename)
+    else:
+        import pyarrow.parquet as pq
+        pq.write_table(table, filename)
+
+
+
+def analyseSegment(sample, segment, cohort, subtype=defaultSubtype):
+    '''Finds and annotates the mutations in every gene of one segment of a sample. Mutations are added to cohort unless it is None'''
+    annotation = annotationRegistry.loadAnnotation(subtype)
+    segmentIndex = annotation['index'][segment]
+
+    # Open variant file
+    try:
+        variantEntries = irmaTables.readTable(os.path.join(sample, 'tables', annotation['recordPrefix'] + segment + '-variants.txt'))
+    except OSError as error:
+        print('File {:s} failed to open'.format(error.filename))
+        return
+
+    #Check if there are any variants in this segment
+    if len(variantEntries) > 0:
+
+        # Read consensus to string
+        consensusSeq, warningList = makeConsensus(sample, segment, [])
+
+        # Variants that pass the thresholds, and every gene they hit
+        variantEntries = variantEntries[validateVariants(variantEntries)]
+        minorityBases = variantEntries['Minority_Allele'].astype('S1').view(np.uint8)
+        variantIndex, geneNumbers, cdsOffsets, codons, frames = segmentIndex.lookup(variantEntries['Position'])
+
+
+        # GENES IN SEGMENT
+        for geneNo, geneName in enumerate(segmentIndex.genes):
+            warningList = []
+            printGene(segment, geneName)
+
+            # VARIANTS IN GENE
+            hits = geneNumbers == geneNo
+            selected = variantIndex[hits]
+            if len(selected) > 0:
+                # Extract the gene and check it for errors
+                majorityGene = segmentIndex.geneSequence(geneNo, consensusSeq)
+                warningList = errorCheckGene(segmentIndex.lengths[geneNo], majorityGene, warningList)
+
+                # Find codon and amino acid for consensus and minority sequence of every variant
+                majCodons, majAAs, minCodons, minAAs, warningList = annotateVariants(majorityGene, cdsOffsets[hits], frames[hits],
+                                                                                     minorityBases[selected], warningList)
+
+                #Write to outfile
+                writeMutations(mutationFilename(sample, segment, geneNo + 1), sampleName(sample), segment, variantEntries['Position'][selected],
+                               majCodons, majAAs, minCodons, minAAs)
+                if cohort is not None:
+                    addToCohort(cohort, sampleName(sample), segment, geneName, variantEntries[selected], majCodons, majAAs, minCodons, minAAs)
+                    
+            printWarnings(warningList)
+
+
+
+def makeMutationDir(sample):
+    #Make mutations directory if it doesn't already exist
+    os.makedirs(os.path.join(sample, 'mutations'), exist_ok=True)
+
+
+
+def readManifest(filename):
+    '''Reads a sample manifest: one sample directory per line. Empty lines and lines starting with # are skipped'''
+    infile = open(filename, 'r')
+    samples = [line.strip() for line in infile if line.strip() != '' and not line.startswith('#')]
+    infile.close()
+
+    return samples
+
+
+
+def newCohort():
+    return {name: [] for name, columnType in cohortColumns}
+
+
+
+def mergeCohort(cohort, part):
+    for name in cohort:
+        cohort[name].extend(part[name])
+
+
+
+def runUnit(sample, segment, collectCohort, subtype):
+    '''Runs one (sample, segment) unit in batch mode. Printed output, run time and errors are returned instead of shown'''
+    part = newCohort() if collectCohort else None
+    log = io.StringIO()
+    start = time.perf_counter()
+    status, error = 'OK', ''
+    try:
+        with contextlib.redirect_stdout(log):
+            analyseSegment(sample, segment, part, subtype)
+    except SystemExit:
+        #The script exits after printing what went wrong
+        printed = [line for line in log.getvalue().split('\n') if line.strip() != '']
+        status, error = 'FAILED', printed[-1] if len(printed) > 0 else 'Exited'
+    except Exception as exception:
+        status, error = 'FAILED', type(exception).__name__ + ': ' + str(exception)
+
+    return {'sample': sample, 'segment': segment, 'seconds': time.perf_counter() - start, 'status': status,
+            'error': error, 'log': log.getvalue(), 'cohort': part}
+
+
+
+def runBatch(samples, processes, collectCohort, subtype):
+    '''Runs every (sample, segment) unit, either one at a time or in a pool of worker processes. Results come back in sample/segment order'''
+    segments = annotationRegistry.loadAnnotation(subtype)['segments']
+    units = [(sample, segment) for sample in samples for segment in segments]
+    if processes == 1:
+        return [runUnit(sample, segment, collectCohort, subtype) for sample, segment in units]
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(runUnit, [unit[0] for unit in units], [unit[1] for unit in units],
+                             [collectCohort] * len(units), [subtype] * len(units)))
+
+
+
+def printBatchReport(results, reportFile):
+    '''Prints the time used per unit and lists the failed units. The unit table is also written to reportFile if given'''
+    failed = [result for result in results if result['status'] != 'OK']
+    totalTime = sum([result['seconds'] for result in results])
+
+    print('\n------------------------------------')
+    print(str(len(results)) + ' units (sample, segment) run, ' + str(len(failed)) + ' failed. ' + str(round(totalTime, 2)) + ' s in total')
+    slowest = sorted(results, key=lambda result: result['seconds'], reverse=True)[:5]
+    print('Slowest units:')
+    for result in slowest:
+        print(result['sample'] + '\t' + result['segment'] + '\t' + str(round(result['seconds'], 3)) + ' s')
+    if len(failed) > 0:
+        print('Failed units:')
+        for result in failed:
+            print(result['sample'] + '\t' + result['segment'] + '\t' + result['error'])
+
+    if reportFile is not None:
+        outfile = open(reportFile, 'w')
+        outfile.write('Sample\tSegment\tSeconds\tStatus\tError\n')
+        for result in results:
+            outfile.write('\t'.join([result['sample'], result['segment'], str(round(result['seconds'], 4)), result['status'], result['error']]) + '\n')
+        outfile.close()
+        print('Unit report written to ' + reportFile)
+
+
+
+
+
+
+
+
+
+
+
+#############################################################################################
+#                                              MAIN                                         #
+#############################################################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Find and annotate minority variants in H3N2 IRMA output. Run it from the folder with the sample folders. '
+                                                 'Without a sample, manifest or glob you are asked to confirm the sample folders found.')
+    parser.add_argument('sample', nargs='?', help='Analyse only this sample')
+    parser.add_argument('--subtype', default=defaultSubtype, choices=annotationRegistry.availableSubtypes(),
+                        help='Gene annotation used, from Common/annotations (default: ' + defaultSubtype + ')')
+    parser.add_argument('--cohort', help='Also write the mutations of all samples to this Parquet (.parquet) or Arrow IPC (.arrow) file. Needs pyarrow')
+    parser.add_argument('--manifest', help='Batch mode: file with one sample folder per line')
+    parser.add_argument('--glob', help="Batch mode: pattern matching the sample folders, e.g. 'Day*'")
+    parser.add_argument('-p', '--processes', type=int, default=1, help='Batch mode: number of (sample, segment) units run at the same time. 0 uses all CPUs (default: 1)')
+    parser.add_argument('--report', help='Batch mode: write the time and status of every unit to this file')
+    args = parser.parse_args()
+    processes = args.processes if args.processes > 0 else os.cpu_count()
+    batchMode = args.manifest is not None or args.glob is not None
+    annotation = annotationRegistry.loadAnnotation(args.subtype)
+    segments = annotation['segments']
+
+    # Proteins the annotation has no coordinates for get no mutations at all, so say so
+    for missing in annotation['missingGenes']:
+        print('Warning: the ' + args.subtype + ' annotation has no ' + missing['gene'] + ' (' + missing['segment'] + ' segment; ' +
+              missing['reason'] + '). No mutations are reported for ' + missing['gene'])
+
+    # Optional cohort file with the mutations of every sample
+    cohort = None
+    if args.cohort is not None:
+        try:
+            import pyarrow
+        except ImportError:
+            print('ERROR: --cohort needs pyarrow (pip install pyarrow)')
+            sys.exit(1)
+        cohort = newCohort()
+
+    # Batch mode; samples from a manifest or a glob
+    if batchMode:
+        if args.sample is not None or (args.manifest is not None and args.glob is not None):
+            print('ERROR: Give either a sample, a manifest or a glob')
+            usage()
+        if args.manifest is not None:
+            samples = readManifest(args.manifest)
+        else:
+            samples = sorted([path.rstrip('/') for path in glob.glob(args.glob) if os.path.isdir(path)])
+        missing = [sample for sample in samples if not os.path.isdir(sample)]
+        if len(samples) == 0 or len(missing) > 0:
+            print('ERROR: No sample folders found' if len(samples) == 0 else 'ERROR: Sample folder(s) not found: ' + ' '.join(missing))
+            sys.exit(1)
+    # No specific sample given; search for sample directories
+    elif args.sample is None:
+        samples = findSamples()
+    # One specific sample given
+    else:
+        samples = [str(args.sample)]
+
+
+    if batchMode:
+        for sample in samples:
+            makeMutationDir(sample)
+        print('Running ' + str(len(samples) * len(segments)) + ' units from ' + str(len(samples)) + ' samples in ' + str(processes) + ' process(es)')
+        results = runBatch(samples, processes, cohort is not None, args.subtype)
+
+        # Output in the same order as a serial run
+        lastSample = None
+        for result in results:
+            if result['sample'] != lastSample:
+                printSample(result['sample'])
+                lastSample = result['sample']
+            print(result['log'], end='')
+            if cohort is not None and result['status'] == 'OK':
+                mergeCohort(cohort, result['cohort'])
+        printBatchReport(results, args.report)
+
+    else:
+        # SAMPLE
+        for sample in samples:   
+            printSample(sample)
+            makeMutationDir(sample)
+
+            # SEGMENT
+            for segment in segments:
+                analyseSegment(sample, segment, cohort, args.subtype)
+
+
+    if cohort is not None:
+        writeCohort(args.cohort, cohort)
+        print('Mutations of all samples written to ' + args.cohort)
+
+    if batchMode and any([result['status'] != 'OK' for result in results]):
+        sys.exit(1)
@@ -1,86 +1,123 @@
-# !/usr/bin/env python3
-# Usage: python3 allSamplesToDataFrame.py
-
-# Makes a combined table of all -variants.txt and -allAlleles.txt
-import os, sys
-
-
-#Initialize
-samples = ['Day1_1', 'Day1_2', 'Day3', 'Day8', 'Day14', 'Day17', 'Day21']
-segments = ['PB2', 'PB1', 'PA', 'HA_H3', 'NP', 'NA_N2', 'MP', 'NS']
-
-
-#Get a dict of just the segment and positions for significant variants 
-variantDict = dict()
-#labelDict = dict()
-for sample in samples:
-    path = '/srv/data/VOF/INF/JUKJ/Quasi/run/human/' + sample + '/tables/'
-    for segment in segments:
-        #Open variant file
-        try:
-            variantFile = open(path + 'A_' + segment + '-variants.txt', 'r')
-        except:
-            print('No variants file found for ' + segment + ' in ' + sample)
-            continue
-
-        #Find significant minor variants
-        for line in variantFile:
-            if not line.startswith('Reference_Name'): #Skip header
-                splitLine = line.split('\t')               
-                depth = splitLine[2]
-                frequency = splitLine[8]
-                
-                if int(depth) >= 100 and float(frequency) >= 0.025:
-                    position = splitLine[1]
-                    if segment in variantDict:
-                        variantDict[segment].append(position)
-                    else:
-                        variantDict[segment] = [position]
-
-                    #majorBase = splitLine[3]
-                    #minorBase = splitLine[4]
-                    #label = majorBase + str(position) + minorBase
-                    #if position in labelDict:
-                    #    labelDict[position].append(label)
-                    #else:
-                    #    labelDict[position] = [label]
-        variantFile.close()
-
-
-
-#Initialize output file
-outfile = open('variantsWithMajor.txt', 'w')
-outfile.write('Sample\tSegment\tPosition\tBase\tCount\tDepth\tFrequency\tAverage_Quality\tConfidenceNotMacErr\tPairedUB\tQualityUB\tAlleletype\n')
-
-
-#Read allAlleles file and get data all data for these sites
-for sample in samples:
-    path = '/srv/data/VOF/INF/JUKJ/Quasi/run/human/' + sample + '/tables/'
-    for segment in segments:
-        try:
-            allAllelesFile = open(path + 'A_' + segment + '-allAlleles.txt', 'r')
-        except:
-            print('No allAlleles file found for ' + segment + ' in ' + sample)
-            continue
-
-        for line in allAllelesFile:
-            if not line.startswith('Reference_Name'): #Skip header
-                splitLine = line.split('\t')   
-                position = splitLine[1]
-
-                #Check if this is a position of interest
-                if segment in variantDict and position in variantDict[segment]:
-                    alleleType = splitLine[-1][:-1]
-
-                    #If it's the major allele, then we definitely want it
-                    if alleleType == 'Consensus':
-                        outfile.write(sample + '\t' + line)
-                    
-                    #If it's a minor allele, then we need to check the depth and frequency
-                    elif alleleType == 'Minority':
-                        depth = int(splitLine[4])
-                        frequency = float(splitLine[5])
-                        if depth >= 100 and frequency >= 0.025:
-                            outfile.write(sample + '\t' + line)
-        allAllelesFile.close()
-outfile.close()
+# !/usr/bin/env python3
+# Usage: python3 allSamplesToDataFrame.py [run directory]
+
+# Makes a combined table of all -variants.txt and -allAlleles.txt
+# For every position with a significant minority variant in any sample, the consensus allele and the
+# significant minority alleles of all samples are written in long format to variantsWithMajor.txt
+# (and variantsWithMajor.parquet if pyarrow is installed)
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Common'))
+import irmaTables
+import numpy as np
+
+
+#Initialize
+minDepth = 100
+minFrequency = 0.025
+runDir = '/srv/data/VOF/INF/JUKJ/Quasi/run/human/'
+samples = ['Day1_1', 'Day1_2', 'Day3', 'Day8', 'Day14', 'Day17', 'Day21']
+#Another run directory can be given as argument; then every folder in it is used as a sample
+if len(sys.argv) == 2:
+    runDir = os.path.join(sys.argv[1], '')
+    samples = sorted([entry for entry in os.listdir(runDir) if os.path.isdir(runDir + entry)])
+segments = ['PB2', 'PB1', 'PA', 'HA_H3', 'NP', 'NA_N2', 'MP', 'NS']
+
+#Columns of the output table and their types
+outputColumns = [('Sample', 'string'), ('Segment', 'string'), ('Position', 'int32'), ('Base', 'string'), ('Count', 'int32'),
+                 ('Depth', 'int32'), ('Frequency', 'float64'), ('Average_Quality', 'float64'), ('ConfidenceNotMacErr', 'float64'),
+                 ('PairedUB', 'float64'), ('QualityUB', 'float64'), ('Alleletype', 'string')]
+
+
+#Functions
+def formatValue(value, columnType):
+    '''Formats a value for the TSV. Missing values (nan, or irmaTables.missingInt in integer columns) are written as NA'''
+    if columnType == 'float64':
+        return irmaTables.formatField(float(value), '%r')
+    if columnType == 'int32':
+        return irmaTables.formatField(int(value), '%d')
+    return str(value)
+
+
+#Get the positions with significant variants in any sample, as one sorted index per segment
+positionIndex = dict()
+for sample in samples:
+    path = runDir + sample + '/tables/'
+    for segment in segments:
+        #Open variant file
+        try:
+            variants = irmaTables.readTable(path + 'A_' + segment + '-variants.txt')
+        except:
+            print('No variants file found for ' + segment + ' in ' + sample)
+            continue
+
+        #Find significant minor variants
+        significant = (variants['Total'] >= minDepth) & (variants['Minority_Frequency'] >= minFrequency)
+        positionIndex.setdefault(segment, []).append(variants['Position'][significant])
+
+positionIndex = {segment: np.unique(np.concatenate(positions)) for segment, positions in positionIndex.items()}
+
+
+
+#Read allAlleles file and get data all data for these sites
+tables = []
+labels = []
+for sample in samples:
+    path = runDir + sample + '/tables/'
+    for segment in segments:
+        try:
+            alleles = irmaTables.readTable(path + 'A_' + segment + '-allAlleles.txt')
+        except:
+            print('No allAlleles file found for ' + segment + ' in ' + sample)
+            continue
+        if segment not in positionIndex:
+            continue
+
+        #Position of interest: the major allele we definitely want, minor alleles need enough depth and frequency
+        ofInterest = np.isin(alleles['Position'], positionIndex[segment], assume_unique=False)
+        major = alleles['Allele_Type'] == 'Consensus'
+        minor = (alleles['Allele_Type'] == 'Minority') & (alleles['Total'] >= minDepth) & (alleles['Frequency'] >= minFrequency)
+        selected = alleles[ofInterest & (major | minor)]
+
+        tables.append(selected)
+        labels.append((sample, segment, len(selected)))
+
+
+#Long format columns
+columns = {'Sample': [], 'Segment': []}
+for sample, segment, count in labels:
+    columns['Sample'].extend([sample] * count)
+    columns['Segment'].extend([segment] * count)
+for name, source in [('Position', 'Position'), ('Base', 'Allele'), ('Count', 'Count'), ('Depth', 'Total'), ('Frequency', 'Frequency'),
+                     ('Average_Quality', 'Average_Quality'), ('ConfidenceNotMacErr', 'ConfidenceNotMacErr'), ('PairedUB', 'PairedUB'),
+                     ('QualityUB', 'QualityUB'), ('Alleletype', 'Allele_Type')]:
+    columns[name] = np.concatenate([table[source] for table in tables]) if len(tables) > 0 else np.zeros(0)
+
+
+#Write TSV
+lines = ['\t'.join([name for name, columnType in outputColumns]) + '\n']
+for row in zip(*[columns[name] for name, columnType in outputColumns]):
+    lines.append('\t'.join([formatValue(value, columnType) for value, (name, columnType) in zip(row, outputColumns)]) + '\n')
+outfile = open('variantsWithMajor.txt', 'w')
+outfile.write(''.join(lines))
+outfile.close()
+
+
+#Write Parquet with the same columns
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    print('pyarrow is not installed; variantsWithMajor.parquet is not written')
+else:
+    arrays = []
+    for name, columnType in outputColumns:
+        if columnType == 'string':
+            arrays.append(pa.array([str(value) for value in columns[name]], type=pa.string()).dictionary_encode())
+        else:
+            #Missing values become nulls
+            values = np.asarray(columns[name]).astype(columnType)
+            missing = np.isnan(values) if columnType == 'float64' else values == irmaTables.missingInt
+            arrays.append(pa.array(values, mask=missing))
+    pq.write_table(pa.Table.from_arrays(arrays, names=[name for name, columnType in outputColumns]), 'variantsWithMajor.parquet')
+
+print(str(len(lines) - 1) + ' alleles written to variantsWithMajor.txt')
@@ -1,128 +1,128 @@
-#!/usr/bin/env python3
-#Make a majority consensus sequence from allAlleles.txt
-import sys, os
-
-
-minDepth = 50
-minQual = 30
-
-
-
-baseDir = '/srv/data/VOF/INF/JUKJ/Quasi/run/human/'
-samples = ['Day1_1', 'Day1_2', 'Day3', 'Day8', 'Day14', 'Day17', 'Day21']
-segments = ['PB1', 'PB2', 'PA', 'HA_H3', 'NP', 'NA_N2', 'MP', 'NS']
-stopCodons = ['TAA', 'TGA', 'TAG']
-
-
-translation = { 'ATA':'I', 'ATC':'I', 'ATT':'I', 'ATG':'M',
-    'ACA':'T', 'ACC':'T', 'ACG':'T', 'ACT':'T',
-    'AAC':'N', 'AAT':'N', 'AAA':'K', 'AAG':'K',
-    'AGC':'S', 'AGT':'S', 'AGA':'R', 'AGG':'R',
-    'CTA':'L', 'CTC':'L', 'CTG':'L', 'CTT':'L',
-    'CCA':'P', 'CCC':'P', 'CCG':'P', 'CCT':'P',
-    'CAC':'H', 'CAT':'H', 'CAA':'Q', 'CAG':'Q',
-    'CGA':'R', 'CGC':'R', 'CGG':'R', 'CGT':'R',
-    'GTA':'V', 'GTC':'V', 'GTG':'V', 'GTT':'V',
-    'GCA':'A', 'GCC':'A', 'GCG':'A', 'GCT':'A',
-    'GAC':'D', 'GAT':'D', 'GAA':'E', 'GAG':'E',
-    'GGA':'G', 'GGC':'G', 'GGG':'G', 'GGT':'G',
-    'TCA':'S', 'TCC':'S', 'TCG':'S', 'TCT':'S',
-    'TTC':'F', 'TTT':'F', 'TTA':'L', 'TTG':'L',
-    'TAC':'Y', 'TAT':'Y', 'TAA':'*', 'TAG':'*',
-    'TGC':'C', 'TGT':'C', 'TGA':'*', 'TGG':'W' }
-
-
-for sample in samples:
-    for segment in segments:
-        filename = 'A_' + segment + '-allAlleles.txt'
-        
-        #Open file
-        try:
-            infile = open(baseDir + sample + '/tables/' + filename, 'r')
-        except:
-            print(filename + ' not found in ' + sample)
-            continue
-        
-        #Read majority alleles into dict
-        alleleDict = dict()
-        for line in infile:
-            splitLine = line.split('\t')
-            alleleType = splitLine[-1][:-1]
-
-            
-            if alleleType == 'Consensus':
-                position = splitLine[1]
-                allele = splitLine[2]
-                depth = splitLine[4]
-                frequency = splitLine[5]
-                quality = splitLine[6]
-                
-                #Quality check
-                if int(depth) >= minDepth and float(quality) >= minQual:
-                    allele = splitLine[2]
-                else:
-                    allele = 'N'
-                
-                #Add to dict
-                if position in alleleDict:
-                    alleleDict[position].append([allele, frequency])
-                else:
-                    alleleDict[position] = [[allele, frequency]]
-                    
-        infile.close()
-
-        
-        
-        #Make consensus sequence
-        seq = ''
-        for position, data in alleleDict.items():
-            if len(data) == 1:
-                seq += data[0][0]
-            else:
-                print('Error: Two consensus bases found for position ' + str(position) + ' in ' + segment + ' ' + sample)
-                print('Exiting program')
-                sys.exit(1)
-            
-            
-        #Length check
-        if len(alleleDict) != len(seq):
-            print('Error: ' + segment + ' in ' + sample + ' has the wrong length. Exiting program.')
-            sys.exit(1)
-            
-            
-        #Start and stop codon check
-        if seq[:3].upper() != 'ATG':
-            print('Warning: Sequence for ' + segment + ' in ' + sample + ' starts with ' + seq[:3].upper() + ' instead of ATG')
-        if seq[-3:].upper() not in stopCodons:
-            print('Warning: Sequence does not end with a stop codon')
-            
-
-
-        #Write nucleotide sequence to file
-        outfile = open(baseDir + sample + '/' + segment + '_consensus.fna', 'w')
-        outfile.write('>' + sample + '_' + segment + '_Consensus\n')
-        for i in range(0, len(seq), 60):
-            outfile.write(seq[i:i+60] + '\n')
-        outfile.close()
-        
-        
-        
-        #Translate to protein
-        seqAA = ''
-        for i in range(0,len(seq),3):
-            codon = seq[i:i+3]
-            if len(codon) == 3:
-                if 'N' in codon:
-                    AA = 'X'
-                else:
-                    AA = translation[codon]
-                seqAA += AA
-        
-        #Write protein sequence to file
-        outfile = open(baseDir + sample + '/' + segment + '_consensus.fa', 'w')
-        outfile.write('>' + sample + '_' + segment + '_Protein_Consensus\n')
-        for i in range(0, len(seqAA), 60):
-            outfile.write(seqAA[i:i+60] + '\n')
-        outfile.close()
-        
-            
+#!/usr/bin/env python3
+#Make a majority consensus sequence from allAlleles.txt
+# Usage: python3 consensusFromAllAlleles.py [run directory] [-p processes] [--samples Day1_1 Day3] [--subtype H3N2]
+import sys, os, argparse
+from concurrent.futures import ProcessPoolExecutor
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Common'))
+import irmaTables, translation, annotationRegistry
+import numpy as np
+
+
+minDepth = 50
+minQual = 30
+
+
+
+baseDir = '/srv/data/VOF/INF/JUKJ/Quasi/run/human/'
+samples = ['Day1_1', 'Day1_2', 'Day3', 'Day8', 'Day14', 'Day17', 'Day21']
+stopCodons = ['TAA', 'TGA', 'TAG']
+
+
+
+
+#---- FUNCTIONS ----#
+def buildConsensus(alleles):
+    '''Takes an allAlleles table and returns the majority consensus as a string.
+    Positions below minDepth or minQual become N. Raises ValueError if a position has two consensus bases'''
+    consensus = alleles[alleles['Allele_Type'] == 'Consensus']
+
+    #Every position must have exactly one consensus base
+    positions, counts = np.unique(consensus['Position'], return_counts=True)
+    if (counts > 1).any():
+        raise ValueError('Two consensus bases found for position ' + str(positions[np.argmax(counts > 1)]))
+
+    #Quality check. Missing depth or quality counts as failed
+    passed = (consensus['Total'] >= minDepth) & (consensus['Average_Quality'] >= minQual)
+
+    #Fill the sequence buffer in table order
+    seq = np.empty(len(consensus), dtype=np.uint8)
+    seq[:] = np.frombuffer(np.ascontiguousarray(consensus['Allele']).astype('S1').tobytes(), dtype=np.uint8)
+    seq[~passed] = ord('N')
+
+    return seq.tobytes().decode()
+
+
+
+def writeFasta(filename, header, seq):
+    lines = ['>' + header + '\n'] + [seq[i:i+60] + '\n' for i in range(0, len(seq), 60)]
+    outfile = open(filename, 'w')
+    outfile.write(''.join(lines))
+    outfile.close()
+
+
+
+def buildSegment(baseDir, sample, segment, recordPrefix):
+    '''Makes the nucleotide and protein consensus of one segment of a sample. Returns the messages to print'''
+    messages = []
+    filename = recordPrefix + segment + '-allAlleles.txt'
+
+    #Open file
+    try:
+        alleles = irmaTables.readTable(baseDir + sample + '/tables/' + filename)
+    except OSError:
+        messages.append(filename + ' not found in ' + sample)
+        return messages
+
+    try:
+        seq = buildConsensus(alleles)
+    except ValueError as error:
+        raise ValueError(str(error) + ' in ' + segment + ' ' + sample)
+
+
+    #Start and stop codon check
+    if seq[:3].upper() != 'ATG':
+        messages.append('Warning: Sequence for ' + segment + ' in ' + sample + ' starts with ' + seq[:3].upper() + ' instead of ATG')
+    if seq[-3:].upper() not in stopCodons:
+        messages.append('Warning: Sequence does not end with a stop codon')
+
+
+    #Write nucleotide and protein sequence to file
+    writeFasta(baseDir + sample + '/' + segment + '_consensus.fna', sample + '_' + segment + '_Consensus', seq)
+    writeFasta(baseDir + sample + '/' + segment + '_consensus.fa', sample + '_' + segment + '_Protein_Consensus', translation.translate(seq))
+
+    return messages
+
+
+
+def buildRun(baseDir, samples, segments, recordPrefix, processes):
+    '''Builds the consensus of every segment of every sample, either one at a time or in a pool of worker processes.
+    Returns the messages of each (sample, segment) in order'''
+    units = [(sample, segment) for sample in samples for segment in segments]
+    if processes == 1:
+        return [buildSegment(baseDir, sample, segment, recordPrefix) for sample, segment in units]
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(buildSegment, [baseDir] * len(units), [unit[0] for unit in units], [unit[1] for unit in units],
+                             [recordPrefix] * len(units), chunksize=8))
+
+
+
+
+#---- MAIN ----#
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Make majority consensus sequences (nucleotide and protein) from the allAlleles tables.')
+    parser.add_argument('runDir', nargs='?', help='Run directory. Every folder in it is used as a sample (default: the thesis run with its samples)')
+    parser.add_argument('--samples', nargs='+', help='Only these samples')
+    parser.add_argument('-p', '--processes', type=int, default=1, help='Number of segments built at the same time. 0 uses all CPUs (default: 1)')
+    parser.add_argument('--subtype', default='H3N2', choices=annotationRegistry.availableSubtypes(), help='Decides the segments (default: H3N2)')
+    args = parser.parse_args()
+    processes = args.processes if args.processes > 0 else os.cpu_count()
+
+    #Another run directory can be given as argument; then every folder in it is used as a sample
+    if args.runDir is not None:
+        baseDir = os.path.join(args.runDir, '')
+        samples = sorted([entry for entry in os.listdir(baseDir) if os.path.isdir(baseDir + entry)])
+    if args.samples is not None:
+        samples = args.samples
+
+    annotation = annotationRegistry.loadAnnotation(args.subtype)
+    try:
+        results = buildRun(baseDir, samples, annotation['segments'], annotation['recordPrefix'], processes)
+    except ValueError as error:
+        print('Error: ' + str(error))
+        print('Exiting program')
+        sys.exit(1)
+
+    for messages in results:
+        for message in messages:
+            print(message)
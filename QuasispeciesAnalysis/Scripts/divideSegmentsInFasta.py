@@ -1,103 +1,161 @@
-#!/usr/bin/env python3
-import sys, os
-from Bio import SeqIO
-
-
-#------------------------------ FUNCTIONS -------------------------------#
-
-def makeHeader(header):
-    # Slit into variables
-    splitHeader = header.split('|')
-    segment = segmentNo[splitHeader[-1]]
-    identifier = splitHeader[2]
-    date = splitHeader[3]
-    subtype = ''.join(splitHeader[5].split('_'))
-    number = identifier.split('/')[2]
-
-    #Make new header in correct format
-    newHeader = '>' + '|'.join([number, segment, identifier, subtype, date])
-    return number, newHeader, segment
-
-
-
-def deduplicate(sequence, header, number, sequenceDict, duplicateDict):
-    if sequence not in sequenceDict:
-        sequenceDict[sequence] = header
-        duplicateDict[sequence] = [number]
-    else:
-        duplicateDict[sequence].append(number)
-    
-    return sequenceDict, duplicateDict
-
-
-
-def writeFasta(filename, sequenceDict):
-    outfile = open(filename, 'w')
-    for sequence, header in sequenceDict.items():
-        outfile.write(header + '\n')
-        outfile.write(sequence + '\n')
-    outfile.close()
-
-
-
-
-
-#--------------------------------- MAIN ---------------------------------#
-
-baseDir = '/srv/data/VOF/INF/JUKJ/Quasi/phylo/data/'
-
-
-#Thresholds
-perN = 50
-
-
-#Initialize
-segmentNo = {'4': 'HA', '6': 'NA'}
-HAsequences = dict()
-HAduplicates = dict()
-NAsequences = dict()
-NAduplicates = dict()
-HAentryCount = 0
-NAentryCount = 0
-removedCount = 0
-
-fastaFile = baseDir + 'gisaid_epiflu_sequence.fasta'
-for seqEntry in SeqIO.parse(fastaFile, "fasta"):
-
-    # Read entry data
-    oldHeader = seqEntry.id
-    sequence = str(seqEntry.seq).upper()
-
-    # Make new header in correct format
-    seqID, newHeader, segment = makeHeader(oldHeader)
-
-
-    
-    # Check if there are too many Ns in the squence
-    if (float(sequence.count("N")) / float(len(sequence)) * 100) <= perN:
-        # It's good to go, save it do dicts
-        if segment == 'HA':
-            HAentryCount += 1
-            HAsequences, HAduplicates = deduplicate(sequence, newHeader, seqID, HAsequences, HAduplicates)
-        elif segment == 'NA':
-            NAentryCount += 1
-            NAsequences, NAduplicates = deduplicate(sequence, newHeader, seqID, NAsequences, NAduplicates)
-    else:
-        removedCount += 1
-    """
-
-"""
-# Print stats
-print(str(removedCount) + ' sequences were removed due to too many Ns\n')
-print('Of the remaining sequences, there were:')
-
-print(str(HAentryCount) + ' HA sequences in total')
-print(str(len(HAsequences)) + ' unique HA sequences')
-
-print(str(NAentryCount) + ' NA sequences in total')
-print(str(len(NAsequences)) + ' unique NA sequences')
-
-
-# Write unique sequences to outfile
-writeFasta(baseDir + 'HA-22-23.fna', HAsequences)
-writeFasta(baseDir + 'NA-22-23.fna', NAsequences)
+#!/usr/bin/env python3
+import sys, os, hashlib, sqlite3
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Common'))
+import fastaIO
+
+
+#------------------------------ FUNCTIONS -------------------------------#
+
+def makeHeader(header):
+    # Slit into variables
+    splitHeader = header.split('|')
+    segment = segmentNo[splitHeader[-1]]
+    identifier = splitHeader[2]
+    date = splitHeader[3]
+    subtype = ''.join(splitHeader[5].split('_'))
+    number = identifier.split('/')[2]
+
+    #Make new header in correct format
+    newHeader = '>' + '|'.join([number, segment, identifier, subtype, date])
+    return number, newHeader, segment
+
+
+
+class DigestStore:
+    '''Remembers which sequences have been seen by a 16 byte digest of the sequence instead of the sequence itself.
+    Digests are kept in a dict until there are more than maxInMemory, then they are moved to an SQLite file (spillFile).
+    The SQLite file is only scratch space, so it is removed by close()'''
+    def __init__(self, spillFile, maxInMemory, commitEvery=100000):
+        self.spillFile = spillFile
+        self.maxInMemory = maxInMemory
+        self.digests = dict()
+        self.commitEvery = commitEvery
+        self.database = None
+        self.count = 0
+        self.uncommitted = 0
+
+
+    def spill(self):
+        if os.path.exists(self.spillFile):
+            os.remove(self.spillFile)
+        self.database = sqlite3.connect(self.spillFile)
+        self.database.execute('CREATE TABLE digests (digest BLOB PRIMARY KEY, number TEXT) WITHOUT ROWID')
+        self.database.executemany('INSERT INTO digests VALUES (?, ?)', self.digests.items())
+        self.database.commit()
+        self.digests = dict()
+
+
+    def add(self, digest, number):
+        '''Adds a digest. Returns the ID of the first sequence with that digest if it was seen before, otherwise None'''
+        if self.database is None:
+            if digest in self.digests:
+                return self.digests[digest]
+            self.digests[digest] = number
+            self.count += 1
+            if self.count > self.maxInMemory:
+                self.spill()
+            return None
+
+        found = self.database.execute('SELECT number FROM digests WHERE digest = ?', (digest,)).fetchone()
+        if found is not None:
+            return found[0]
+        self.database.execute('INSERT INTO digests VALUES (?, ?)', (digest, number))
+        self.count += 1
+        self.uncommitted += 1
+        if self.uncommitted >= self.commitEvery:
+            self.database.commit()
+            self.uncommitted = 0
+        return None
+
+
+    def close(self):
+        if self.database is not None:
+            self.database.commit()
+            self.database.close()
+            self.database = None
+        if os.path.exists(self.spillFile):
+            os.remove(self.spillFile)
+
+
+
+def deduplicate(sequence, header, number, store, fastaOut, duplicatesOut, segment):
+    '''Writes the sequence to the segment fasta the first time it is seen. Later copies are written to the duplicate table'''
+    firstNumber = store.add(hashlib.blake2b(sequence.encode(), digest_size=16).digest(), number)
+    if firstNumber is None:
+        fastaOut.write(header + '\n')
+        fastaOut.write(sequence + '\n')
+    else:
+        duplicatesOut.write(segment + '\t' + firstNumber + '\t' + number + '\n')
+
+
+
+
+
+#--------------------------------- MAIN ---------------------------------#
+
+baseDir = '/srv/data/VOF/INF/JUKJ/Quasi/phylo/data/'
+
+
+#Thresholds
+perN = 50
+
+#Unique sequences kept in memory (as digests) per segment before they are moved to disk. Each takes about 200 bytes
+#with the dict overhead, so 500,000 is around 100 MB per segment
+maxDigestsInMemory = 500000
+
+
+#Initialize
+segmentNo = {'4': 'HA', '6': 'NA'}
+outFiles = {'HA': baseDir + 'HA-22-23.fna', 'NA': baseDir + 'NA-22-23.fna'}
+stores = {segment: DigestStore(filename + '.digests.sqlite', maxDigestsInMemory) for segment, filename in outFiles.items()}
+fastaOut = {segment: open(filename, 'w') for segment, filename in outFiles.items()}
+
+# Side table with every sequence left out as a duplicate and the sequence it is a copy of
+duplicatesOut = open(baseDir + 'duplicates-22-23.tsv', 'w')
+duplicatesOut.write('Segment\tKeptID\tDuplicateID\n')
+HAentryCount = 0
+NAentryCount = 0
+removedCount = 0
+
+fastaFile = baseDir + 'gisaid_epiflu_sequence.fasta'
+# The outfiles are closed and the digest spill files removed even if the run stops with an error
+try:
+    for oldHeader, sequence, nFraction in fastaIO.readFasta(fastaFile, nFraction=True):
+
+        # Read entry data
+        sequence = sequence.decode()
+
+        # Make new header in correct format
+        seqID, newHeader, segment = makeHeader(oldHeader)
+
+
+    
+        # Check if there are too many Ns in the squence
+        if nFraction * 100 <= perN:
+            # It's good to go, write it unless it's a duplicate
+            if segment == 'HA':
+                HAentryCount += 1
+            elif segment == 'NA':
+                NAentryCount += 1
+            deduplicate(sequence, newHeader, seqID, stores[segment], fastaOut[segment], duplicatesOut, segment)
+        else:
+            removedCount += 1
+        """
+
+"""
+finally:
+    for segment in outFiles:
+        fastaOut[segment].close()
+        stores[segment].close()
+    duplicatesOut.close()
+
+# Print stats
+print(str(removedCount) + ' sequences were removed due to too many Ns\n')
+print('Of the remaining sequences, there were:')
+
+print(str(HAentryCount) + ' HA sequences in total')
+print(str(stores['HA'].count) + ' unique HA sequences')
+
+print(str(NAentryCount) + ' NA sequences in total')
+print(str(stores['NA'].count) + ' unique NA sequences')
+
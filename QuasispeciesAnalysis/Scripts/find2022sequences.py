@@ -1,49 +1,50 @@
-#!/usr/bin/env python3
-#Find the gisaid sequences that are from 4 months before and 4 months after the last sample was taken
-#(August 2022 - March 2023)
-import sys, os
-from Bio import SeqIO
-
-
-#Input
-if len(sys.argv) == 2:
-    filename = sys.argv[1]
-elif len(sys.argv) == 1:
-    filename = input('Please write name of fasta file: ')
-else:
-    print("Usage: python3 find2022sequences.py <fasta file>")
-    sys.exit(1)
-
-
-#Initialize
-late2022 = ['08','09','10','11','12']
-early2023 = ['01','02','03']
-patientDates = ['2022-11-08', '2022-11-10', '2022-11-15', '2022-11-21', '2022-11-24', '2022-11-28']
-seenIdentifier = set()
-
-
-outfilename = filename.split('.')[0] + '_filtered.fna'
-outfile = open(outfilename, 'w')
-for seqEntry in SeqIO.parse(filename, "fasta"):
-        header = seqEntry.id
-        splitHeader = header.split('|')
-        date = splitHeader[-1].strip()
-        dateList = date.split('-')
-
-        year, month, day = dateList[0], dateList[1], dateList[2]
-        
-        #Samples from late 2022 and early 2023
-        if (year == '2022' and month in late2022) or (year == '2023' and month in early2023):
-            sequence = str(seqEntry.seq).upper()
-            segment = splitHeader[1]
-            identifier = splitHeader[2]
-            ID = identifier.split('/')[2]
-
-            #Don't include sequences with identifiers already written to outfile
-            if identifier not in seenIdentifier and date not in patientDates:
-                newHeader = '_'.join(['_'.join([year[-2:],month,day]), ID, segment, 'DK'])
-                outfile.write('>' + newHeader + '\n')
-                outfile.write(sequence + '\n')
-                seenIdentifier.add(identifier)
-
-outfile.close()  
+#!/usr/bin/env python3
+#Find the gisaid sequences that are from 4 months before and 4 months after the last sample was taken
+#(August 2022 - March 2023)
+#The headers are read into an index once (Common/headerIndex.py), so other windows don't need another pass over the fasta
+#Usage: python3 find2022sequences.py <fasta file> [--start 2022-08-01] [--end 2023-03-31] [--segments HA NA] [--exclude dates] [-p processes]
+import sys, os, argparse
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Common'))
+import headerIndex
+
+
+#Initialize
+windowStart = '2022-08-01'
+windowEnd = '2023-03-31'
+patientDates = ['2022-11-08', '2022-11-10', '2022-11-15', '2022-11-21', '2022-11-24', '2022-11-28']
+
+
+
+
+#--------------------------------- MAIN ---------------------------------#
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write the GISAID sequences collected in a date window, one per identifier.')
+    parser.add_argument('filename', nargs='?', help='GISAID fasta file (asked for if not given)')
+    parser.add_argument('--start', default=windowStart, help='First collection date (default: ' + windowStart + ')')
+    parser.add_argument('--end', default=windowEnd, help='Last collection date (default: ' + windowEnd + ')')
+    parser.add_argument('--segments', nargs='+', help='Only these segments (default: all)')
+    parser.add_argument('--exclude', nargs='+', default=patientDates, help='Collection dates to leave out (default: the patient sampling dates)')
+    parser.add_argument('-p', '--processes', type=int, default=1, help='Processes used to build the header index. 0 uses all CPUs (default: 1)')
+    args = parser.parse_args()
+    processes = args.processes if args.processes > 0 else os.cpu_count()
+
+    #Input
+    filename = args.filename
+    if filename is None:
+        filename = input('Please write name of fasta file: ')
+
+
+    #Find the matching records in the index. Identifiers already written are left out (first one in the file is kept)
+    index = headerIndex.readIndex(filename, 'gisaid', processes)
+    rows = headerIndex.query(index, args.start, args.end, args.segments, args.exclude, unique=True)
+
+    outfilename = filename.split('.')[0] + '_filtered.fna'
+    outfile = open(outfilename, 'w')
+    for row, (name, sequence) in zip(rows, headerIndex.readMatches(filename, rows)):
+        year, month, day = str(row['date']).split('-')
+        ID = row['identifier'].split('/')[2]
+        newHeader = '_'.join(['_'.join([year[-2:],month,day]), ID, row['segment'], 'DK'])
+        outfile.write('>' + newHeader + '\n')
+        outfile.write(sequence.decode() + '\n')
+
+    outfile.close()
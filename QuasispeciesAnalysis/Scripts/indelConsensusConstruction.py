@@ -1,165 +1,162 @@
-#!/usr/bin/env python3
-import sys, os
-
-# Reconstruct consensus sequences with deletions
-# Usage: indelConsensusConstruction.py <path/to/indelSummary>
-# Call from .../run/human
-
-translationDict = { 'ATA':'I', 'ATC':'I', 'ATT':'I', 'ATG':'M',
-    'ACA':'T', 'ACC':'T', 'ACG':'T', 'ACT':'T',
-    'AAC':'N', 'AAT':'N', 'AAA':'K', 'AAG':'K',
-    'AGC':'S', 'AGT':'S', 'AGA':'R', 'AGG':'R',
-    'CTA':'L', 'CTC':'L', 'CTG':'L', 'CTT':'L',
-    'CCA':'P', 'CCC':'P', 'CCG':'P', 'CCT':'P',
-    'CAC':'H', 'CAT':'H', 'CAA':'Q', 'CAG':'Q',
-    'CGA':'R', 'CGC':'R', 'CGG':'R', 'CGT':'R',
-    'GTA':'V', 'GTC':'V', 'GTG':'V', 'GTT':'V',
-    'GCA':'A', 'GCC':'A', 'GCG':'A', 'GCT':'A',
-    'GAC':'D', 'GAT':'D', 'GAA':'E', 'GAG':'E',
-    'GGA':'G', 'GGC':'G', 'GGG':'G', 'GGT':'G',
-    'TCA':'S', 'TCC':'S', 'TCG':'S', 'TCT':'S',
-    'TTC':'F', 'TTT':'F', 'TTA':'L', 'TTG':'L',
-    'TAC':'Y', 'TAT':'Y', 'TAA':'*', 'TAG':'*',
-    'TGC':'C', 'TGT':'C', 'TGA':'*', 'TGG':'W' }
-
-
-
-
-#------------------------------- FUNCTIONS -----------------------------------#
-def deletionData(entry):
-    '''Takes a deletion entry in list form from indelSummary and saves the data as variables'''
-    sample = str(entry[0])
-    segment = str(entry[1])
-    startPosition = int(entry[3]) + 1 #Position in indelSummary is position before deletion. We add 1 to get the first position of the deletion.
-    delLength = int(entry[4])
-    mutation = str(entry[-1][:-1])
-    
-    return sample, segment, startPosition, delLength, mutation
-
-
-
-def translate(nucleotideSeq):
-    '''Takes a nucleotide sequence and translates to protein sequence'''
-    proteinSeq = ''
-    for i in range(0, len(nucleotideSeq), 3):
-        codon = nucleotideSeq[i:i+3]
-        if len(codon) == 3:
-            try:
-                aa = translationDict[codon]
-            except:
-                aa = 'X'
-        proteinSeq += aa
-    
-    return proteinSeq
-
-
-
-
-
-#---------------------------------- MAIN -------------------------------------#
-
-#Read indelSummary as input
-if len(sys.argv) == 2:
-    indelFilename = sys.argv[1]
-elif len(sys.argv) == 1:
-    indelFilename = input('Please enter name of (or path to) indelSummary file: ')
-else:
-    print('Error: Too many arguments.')
-    print('Usage: indelConsensusConstruction.py <path/to/indelSummary>')
-    sys.exit(1)
-
-
- 
-baseDirectory = '/srv/data/VOF/INF/JUKJ/Quasi/run/human/'
-
-
-#Open indelSummary
-try:
-    indelFile = open(indelFilename, 'r')
-except IOError as error:
-    print('Cant open indelSummary file, reason: ' + str(error))
-    sys.exit(1)
-    
-
-#Go thorugh every indel
-for line in indelFile:
-    if not line.startswith('Sample') and not line.startswith('\n'):
-        splitLine = line.split('\t')
-        
-        indelType = splitLine[2]
-        
-        
-        #INSERTION
-        if indelType == 'ins':
-            print('This script has not yet been set up to handle insertions. Skipping.')
-            continue
-        
-        
-        #DELETION
-        elif indelType == 'del':
-            sample, segment, startPosition, delLength, mutation = deletionData(splitLine)
-            
-            #Open consensus for segment in sample
-            try:
-                consensusFile = open(baseDirectory + sample + '/' + segment + '_consensus.fna', 'r')
-            except:
-                print('ERROR: Consensus file for ' + segment + ' in ' + sample + ' could not be opened or found.')
-                print('Remember to call script from .../human/run')
-                print('Exiting program')
-                sys.exit(1)
-            
-            #Read consensus to string
-            seq = ''
-            for line in consensusFile:
-                if not line.startswith('>'):
-                    seq += line[:-1]
-            consensusFile.close()
-            
-           
-            #Check that the change matches the mutation in indelSummary
-            deletion = '-' * delLength
-            cutOut = seq[startPosition - 6 : startPosition-1] + deletion + seq[startPosition-1 + delLength : startPosition-1 + delLength + 5]
-            if cutOut != mutation:
-                print('ERROR: something went wrong in ' + segment + ' position ' + startPosition + ' in ' + sample) 
-                print(mutation)
-                print(cutOut)
-                print('Skipping')
-                continue
-            
-            #Make the deletion in the consensus
-            updatedConsensus = seq[:startPosition - 1] + seq[startPosition - 1 + delLength:]
-            
-            #Make a length check
-            if len(updatedConsensus) != len(seq) - delLength:
-                print('ERROR: something went wrong when making the deletion in ' + segment + ' position ' + startPosition + ' in ' + sample)
-                print('Expected length of new sequence: ' + str(len(seq) - delLength))
-                print('Actual length of new sequence: ') + str(len(updatedConsensus))
-                print('Skipping')
-                continue
-            
-            #Write to file
-            outfile = open(baseDirectory + '/indelSummary/' + sample + '_' + segment + '_deletion_' + str(startPosition) + '.fna', 'w')
-            outfile.write('>' + sample + '_' + segment + '_pos' + str(startPosition) + '_length:' + str(delLength) + '\n')
-            for i in range(0, len(updatedConsensus), 60):
-                outfile.write(updatedConsensus[i:i+60] + '\n')
-            outfile.close()
-            
-            #Translate to protein
-            proteinConsensus = translate(updatedConsensus)
-            
-            #Write to file
-            outfile = open(baseDirectory + '/indelConsensus/' + sample + '_' + segment + '_deletion_' + str(startPosition) + '.fa', 'w')
-            outfile.write('>' + sample + '_' + segment + '_basePos' + str(startPosition) + '_length:' + str(delLength) + 'b\n')
-            for i in range(0, len(proteinConsensus), 60):
-                outfile.write(proteinConsensus[i:i+60] + '\n')
-            outfile.close()
-            
-            
-            
-        #INVALID TYPE 
-        else:
-            print('Unknown indel type: ' + indelType + '. Skipping.')
-            continue
-        
-indelFile.close()
-    
+#!/usr/bin/env python3
+import sys, os, argparse
+from concurrent.futures import ProcessPoolExecutor
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Common'))
+import translation
+
+# Reconstruct consensus sequences with the deletions and insertions in indelSummary.txt (from indelSummary.py)
+# Every indel gives its own sequence. Indels are grouped per sample and segment, so each consensus is read once,
+# and all sequences of a sample are written to one multi-record FASTA (nucleotide and protein).
+# Usage: indelConsensusConstruction.py <path/to/indelSummary> [--runDir <run directory>] [-p processes]
+# Call from .../run/human
+
+
+#Initialize
+baseDirectory = '/srv/data/VOF/INF/JUKJ/Quasi/run/human/'
+outDirName = 'indelConsensus'
+
+
+
+
+#------------------------------- FUNCTIONS -----------------------------------#
+def indelData(entry):
+    '''Takes an indel entry in list form from indelSummary and saves the data as variables'''
+    sample = str(entry[0])
+    segment = str(entry[1])
+    indelType = str(entry[2])
+    startPosition = int(entry[3]) + 1 #Position in indelSummary is position before the indel. We add 1 to get the first position of the indel.
+    length = int(entry[4])
+    mutation = str(entry[-1]).rstrip('\n')
+    
+    return sample, segment, indelType, startPosition, length, mutation
+
+
+
+def readIndelSummary(indelFilename):
+    '''Reads indelSummary and groups the indels as {sample: {segment: [indels]}}, keeping the order of the file'''
+    try:
+        indelFile = open(indelFilename, 'r')
+    except IOError as error:
+        print('Cant open indelSummary file, reason: ' + str(error))
+        sys.exit(1)
+
+    indels = dict()
+    for line in indelFile:
+        if not line.startswith('Sample\t') and not line.startswith('\n'):
+            indel = indelData(line.split('\t'))
+            if indel[2] not in ['del', 'ins']:
+                print('Unknown indel type: ' + indel[2] + '. Skipping.')
+                continue
+            indels.setdefault(indel[0], dict()).setdefault(indel[1], []).append(indel)
+    indelFile.close()
+
+    return indels
+
+
+
+def readConsensus(filename):
+    '''Reads a consensus fasta to a string'''
+    consensusFile = open(filename, 'r')
+    seq = ''.join([line.strip() for line in consensusFile if not line.startswith('>')])
+    consensusFile.close()
+
+    return seq
+
+
+
+def applyIndel(seq, indelType, startPosition, length, mutation):
+    '''Makes one deletion or insertion in the consensus. Returns the new sequence, or an error message if it doesn't fit the consensus'''
+    if indelType == 'del':
+        #Check that the change matches the mutation in indelSummary
+        cutOut = seq[startPosition - 6 : startPosition-1] + '-' * length + seq[startPosition-1 + length : startPosition-1 + length + 5]
+        if cutOut != mutation:
+            return None, 'does not match the consensus (' + mutation + ' v. ' + cutOut + ')'
+        updatedConsensus = seq[:startPosition - 1] + seq[startPosition - 1 + length:]
+        expectedLength = len(seq) - length
+
+    else:
+        #The insert goes after the upstream position
+        if startPosition - 1 > len(seq) or len(mutation) != length:
+            return None, 'does not fit the consensus'
+        updatedConsensus = seq[:startPosition - 1] + mutation + seq[startPosition - 1:]
+        expectedLength = len(seq) + length
+
+    #Make a length check
+    if len(updatedConsensus) != expectedLength:
+        return None, 'gave length ' + str(len(updatedConsensus)) + ' instead of ' + str(expectedLength)
+
+    return updatedConsensus, None
+
+
+
+def fastaRecord(header, seq):
+    return '>' + header + '\n' + ''.join([seq[i:i+60] + '\n' for i in range(0, len(seq), 60)])
+
+
+
+def constructSample(runDir, sample, segmentIndels):
+    '''Makes the indel sequences of one sample and writes them to <runDir>/indelConsensus/<sample>_indels.fna and .fa.
+    Returns the messages to print'''
+    messages = []
+    headers = []
+    sequences = []
+    for segment, indels in segmentIndels.items():
+        #Read the consensus of the segment once
+        try:
+            seq = readConsensus(runDir + sample + '/' + segment + '_consensus.fna')
+        except OSError:
+            messages.append('ERROR: Consensus file for ' + segment + ' in ' + sample + ' could not be opened or found. Skipping ' + str(len(indels)) + ' indel(s)')
+            continue
+
+        for sample, segment, indelType, startPosition, length, mutation in indels:
+            updatedConsensus, error = applyIndel(seq, indelType, startPosition, length, mutation)
+            name = 'deletion' if indelType == 'del' else 'insertion'
+            if error is not None:
+                messages.append('ERROR: ' + name + ' in ' + segment + ' position ' + str(startPosition) + ' in ' + sample + ' ' + error + '. Skipping')
+                continue
+            headers.append(sample + '_' + segment + '_' + name + '_pos' + str(startPosition) + '_length:' + str(length))
+            sequences.append(updatedConsensus)
+
+    if len(sequences) > 0:
+        proteins = translation.translateBatch(sequences)
+        outPath = runDir + outDirName + '/' + sample + '_indels'
+        for extension, records in [('.fna', sequences), ('.fa', proteins)]:
+            outfile = open(outPath + extension, 'w')
+            outfile.write(''.join([fastaRecord(header, record) for header, record in zip(headers, records)]))
+            outfile.close()
+    messages.append(sample + ': ' + str(len(sequences)) + ' indel sequence(s) written')
+
+    return messages
+
+
+
+
+
+#---------------------------------- MAIN -------------------------------------#
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Make consensus sequences with the deletions and insertions found by indelSummary.py')
+    parser.add_argument('indelSummary', nargs='?', help='indelSummary.txt (asked for if not given)')
+    parser.add_argument('--runDir', default=baseDirectory, help='Run directory with the sample folders (default: ' + baseDirectory + ')')
+    parser.add_argument('-p', '--processes', type=int, default=1, help='Number of samples handled at the same time. 0 uses all CPUs (default: 1)')
+    args = parser.parse_args()
+    processes = args.processes if args.processes > 0 else os.cpu_count()
+    runDir = os.path.join(args.runDir, '')
+
+    #Read indelSummary as input
+    indelFilename = args.indelSummary
+    if indelFilename is None:
+        indelFilename = input('Please enter name of (or path to) indelSummary file: ')
+    indels = readIndelSummary(indelFilename)
+    os.makedirs(runDir + outDirName, exist_ok=True)
+
+    #Go through every sample
+    samples = list(indels)
+    if processes == 1:
+        results = [constructSample(runDir, sample, indels[sample]) for sample in samples]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            results = list(pool.map(constructSample, [runDir] * len(samples), samples, [indels[sample] for sample in samples]))
+
+    for messages in results:
+        for message in messages:
+            print(message)
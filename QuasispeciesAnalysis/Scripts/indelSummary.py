@@ -1,86 +1,87 @@
-#!/usr/bin/env python3
-#Check every indel file and determine which are real
-import sys, os
-
-
-#Initialize
-minDepth = 50
-minQuality = 30
-minFrequency = 0.025
-minCount = 15
-samples = ['Day1_1', 'Day1_2', 'Day3', 'Day8', 'Day14', 'Day17', 'Day21']
-segments = ['PB1', 'PB2', 'PA', 'HA_H3', 'NP', 'NA_N2', 'MP', 'NS']
-
-outfile = open('/srv/data/VOF/INF/JUKJ/Quasi/run/human/indelSummary.txt','w')
-outfile.write('Sample\tSegment\tType\tPosition\tLength\tCount\tDepth\tFrequency\tAverageQuality\tConfidenceNotMacError\tMutation\n')
-
-
-for sample in samples:
-    baseDir = '/srv/data/VOF/INF/JUKJ/Quasi/run/human/' + sample + '/tables/'
-    for segment in segments:
-
-        ##### INSERTIONS #####
-        try:
-            insFile = open(baseDir + 'A_' + segment + '-insertions.txt', 'r')
-        except IOError as error:
-            print('Warning: Cant open file, reason: ', str(error))
-            continue
-        
-        
-        for line in insFile:
-            if not line.startswith('Reference_Name'):
-                splitLine = line.split('\t')
-                
-                #Check if IRMA says its real
-                status = splitLine[2]
-
-                if status == 'TRUE':  
-                    depth = splitLine[6]
-                    frequency = splitLine[7]
-                    quality = splitLine[8]
-                    count = splitLine[5]
-                    
-                    #Do we think it's real?
-                    if int(depth) >= minDepth and float(frequency) >= minFrequency and float(quality) >= minQuality and int(count) >= minCount:
-                        position = splitLine[1]
-                        mutation = splitLine[2]
-                        confidence = splitLine[9]
-                        length = len(mutation)
-                        
-                        outfile.write(sample + '\t' + segment + '\t' + 'ins' + '\t' + position + '\t' + str(length) + '\t' + count + '\t' + depth + '\t' + frequency + '\t' + quality + '\t' + confidence + '\t' + mutation + '\n')
-        insFile.close()
-        
-        
-        ##### DELETIONS #####
-        try:
-            delFile = open(baseDir + 'A_' + segment + '-deletions.txt', 'r')
-        except IOError as error:
-            print('Warning: Cant open file, reason: ', str(error))
-            continue
-
-        for line in delFile:
-            if not line.startswith('Reference_Name'):
-                splitLine = line.split('\t')
-                
-                #Check if IRMA says its real
-                status = splitLine[4]
-                
-                if status == 'TRUE':
-                    depth = splitLine[6]
-                    frequency = splitLine[7]
-                    count = splitLine[5]
-                    
-                    #Do we think it is real?
-                    if int(depth) >= minDepth and float(frequency) >= minFrequency and int(count) >= minCount:
-                        position = splitLine[1]
-                        length = splitLine[2]
-                        mutation = splitLine[3]
-                        
-                        outfile.write(sample + '\t' + segment + '\t' + 'del' + '\t' + position + '\t' + length + '\t' + count + '\t' + depth + '\t' + frequency + '\tNA\tNA\t' + mutation + '\n')
-                        
-
-        delFile.close()   
-
-    outfile.write('\n')    
-outfile.close()
-            
+#!/usr/bin/env python3
+#Check every indel file and determine which are real
+# Usage: python3 indelSummary.py [run directory]
+import sys, os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Common'))
+import irmaTables
+
+
+#Initialize
+minDepth = 50
+minQuality = 30
+minFrequency = 0.025
+minCount = 15
+#Numbers are written with the same number of decimals as in the IRMA tables. Missing values are written as NA
+frequencyFormat = '%.6f'
+qualityFormat = '%.2f'
+runDir = '/srv/data/VOF/INF/JUKJ/Quasi/run/human/'
+samples = ['Day1_1', 'Day1_2', 'Day3', 'Day8', 'Day14', 'Day17', 'Day21']
+segments = ['PB1', 'PB2', 'PA', 'HA_H3', 'NP', 'NA_N2', 'MP', 'NS']
+#Another run directory can be given as argument; then every folder in it is used as a sample
+if len(sys.argv) == 2:
+    runDir = os.path.join(sys.argv[1], '')
+    samples = sorted([entry for entry in os.listdir(runDir) if os.path.isdir(runDir + entry)])
+
+outfile = open(runDir + 'indelSummary.txt','w')
+outfile.write('Sample\tSegment\tType\tPosition\tLength\tCount\tDepth\tFrequency\tAverageQuality\tConfidenceNotMacError\tMutation\n')
+
+
+for sample in samples:
+    baseDir = runDir + sample + '/tables/'
+    for segment in segments:
+
+        ##### INSERTIONS #####
+        try:
+            insertions = irmaTables.readTable(baseDir + 'A_' + segment + '-insertions.txt')
+        except IOError as error:
+            print('Warning: Cant open file, reason: ', str(error))
+            continue
+        
+        
+        for row in insertions:
+            #Check if IRMA says its real
+            status = row['Called']
+
+            if status == 'TRUE':  
+                depth = int(row['Total'])
+                frequency = float(row['Frequency'])
+                quality = float(row['Average_Quality'])
+                count = int(row['Count'])
+                
+                #Do we think it's real?
+                if depth >= minDepth and frequency >= minFrequency and quality >= minQuality and count >= minCount:
+                    position = str(row['Upstream_Position'])
+                    mutation = str(row['Insert'])
+                    confidence = irmaTables.formatField(row['ConfidenceNotMacErr'], frequencyFormat)
+                    length = len(mutation)
+                    
+                    outfile.write(sample + '\t' + segment + '\t' + 'ins' + '\t' + position + '\t' + str(length) + '\t' + str(count) + '\t' + str(depth) + '\t' + irmaTables.formatField(frequency, frequencyFormat) + '\t' + irmaTables.formatField(quality, qualityFormat) + '\t' + confidence + '\t' + mutation + '\n')
+        
+        
+        ##### DELETIONS #####
+        try:
+            deletions = irmaTables.readTable(baseDir + 'A_' + segment + '-deletions.txt')
+        except IOError as error:
+            print('Warning: Cant open file, reason: ', str(error))
+            continue
+
+        for row in deletions:
+            #Check if IRMA says its real
+            status = row['Called']
+            
+            if status == 'TRUE':
+                depth = int(row['Total'])
+                frequency = float(row['Frequency'])
+                count = int(row['Count'])
+                
+                #Do we think it is real?
+                if depth >= minDepth and frequency >= minFrequency and count >= minCount:
+                    position = str(row['Upstream_Position'])
+                    length = str(row['Length'])
+                    mutation = str(row['Context'])
+                    
+                    outfile.write(sample + '\t' + segment + '\t' + 'del' + '\t' + position + '\t' + length + '\t' + str(count) + '\t' + str(depth) + '\t' + irmaTables.formatField(frequency, frequencyFormat) + '\tNA\tNA\t' + mutation + '\n')
+
+    outfile.write('\n')    
+outfile.close()
+            
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# Linkage between the minority variants of each segment, counted from the reads in the IRMA BAM files.
+# Gives the same four metrics IRMA draws in its phasing heat maps (JACCARD, MUTUALD, EXPENRD and NJOINTP),
+# but with our own variant thresholds. Every BAM is streamed once and co-occurrences are counted sparsely: only the
+# pairs of variants that some read covers are kept, so memory grows with the covered pairs and not with n^2.
+# The pairs are saved as <sample>/linkage/A_<segment>_linkage.npz (read them with readLinkage; denseMatrix makes an n x n matrix).
+# Usage: python3 phaseLinkage.py [runDir] [--samples Day1_1 Day1_2 ...] [-p processes] [thresholds, see -h]
+import sys, os, argparse, time
+from concurrent.futures import ProcessPoolExecutor
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Common'))
+import irmaTables, annotationRegistry
+import numpy as np
+import pysam
+
+
+#Initialize (same variant thresholds as phasesToFasta.py)
+depthThreshold = 50
+countThreshold = 15
+freqThreshold = 0.025
+qualThreshold = 30
+
+# Number of pair keys collected before they are added to the counts
+flushSize = 1000000
+
+
+
+
+#------------------------------- FUNCTIONS -----------------------------------#
+def passingVariants(variantFile, minDepth, minCount, minFrequency, minQuality):
+    '''Minority variants of a segment that pass the thresholds, sorted by position.
+    Returns 0-based positions, major alleles and minority alleles'''
+    variants = irmaTables.readTable(variantFile)
+    passing = variants[(variants['Total'] >= minDepth) & (variants['Minority_Count'] >= minCount) &
+                       (variants['Minority_Frequency'] >= minFrequency) & (variants['Minority_Average_Quality'] >= minQuality)]
+    passing = passing[np.argsort(passing['Position'], kind='stable')]
+
+    return passing['Position'].astype(np.int64) - 1, passing['Major_Allele'].astype(str), passing['Minority_Allele'].astype(str)
+
+
+
+def readVariantCalls(read, positions, minorityCodes, minBaseQuality):
+    '''Finds the variant sites a read covers with an aligned base and whether it has the minority allele there.
+    Returns the variant numbers covered and a boolean array marking the minority ones'''
+    first, last = np.searchsorted(positions, [read.reference_start, read.reference_end])
+    if first == last:
+        return None, None
+
+    pairs = np.array(read.get_aligned_pairs(matches_only=True), dtype=np.int64).reshape(-1, 2)
+    if len(pairs) == 0:
+        return None, None
+    sitePositions = positions[first:last]
+    hit = np.searchsorted(pairs[:, 1], sitePositions)
+    hit[hit >= len(pairs)] = 0
+    covered = pairs[hit, 1] == sitePositions
+    if minBaseQuality > 0:
+        qualities = np.asarray(read.query_qualities, dtype=np.int64)
+        covered &= qualities[pairs[hit, 0]] >= minBaseQuality
+
+    variantNumbers = np.arange(first, last)[covered]
+    bases = np.frombuffer(read.query_sequence.encode(), dtype=np.uint8)[pairs[hit[covered], 0]]
+
+    return variantNumbers, bases == minorityCodes[variantNumbers]
+
+
+
+def addCounts(keys, counts, newKeys):
+    '''Adds the occurrences of newKeys to the sparse counts (sorted unique keys and their counts)'''
+    newKeys, newCounts = np.unique(newKeys, return_counts=True)
+    allKeys, inverse = np.unique(np.concatenate([keys, newKeys]), return_inverse=True)
+    allCounts = np.bincount(inverse.ravel(), weights=np.concatenate([counts, newCounts]), minlength=len(allKeys))
+
+    return allKeys, allCounts.astype(np.int64)
+
+
+
+def countCooccurrence(bamFile, contig, positions, minorityAlleles, minBaseQuality):
+    '''Streams the reads of one contig and counts, for every pair of variants (i, j) covered by a read, the reads covering both
+    (jointCoverage), the reads with the minority allele at both (jointMinority) and the reads covering both with the minority
+    allele at i (minorityAt). Pairs are keys i*n + j. Returns the sorted keys of the covered pairs, the three counts of each and
+    the number of reads used'''
+    n = len(positions)
+    minorityCodes = np.frombuffer(''.join(minorityAlleles).encode(), dtype=np.uint8)
+    empty = np.zeros(0, dtype=np.int64)
+    sparse = {'jointCoverage': (empty, empty), 'jointMinority': (empty, empty), 'minorityAt': (empty, empty)}
+    collected = {name: [] for name in sparse}
+    collectedSize = 0
+
+    def flush():
+        for name, keys in collected.items():
+            if len(keys) > 0:
+                sparse[name] = addCounts(*sparse[name], np.concatenate(keys))
+                del keys[:]
+
+    bam = pysam.AlignmentFile(bamFile, 'rb')
+    reads = 0
+    for read in bam.fetch(contig):
+        if read.is_unmapped or read.is_secondary or read.is_supplementary or read.is_duplicate or read.query_sequence is None:
+            continue
+        variantNumbers, isMinority = readVariantCalls(read, positions, minorityCodes, minBaseQuality)
+        if variantNumbers is None or len(variantNumbers) == 0:
+            continue
+        reads += 1
+
+        # Keys i*n + j of every pair of sites in the read (i == j included)
+        keys = (variantNumbers[:, None] * n + variantNumbers[None, :]).ravel()
+        minority = variantNumbers[isMinority]
+        collected['jointCoverage'].append(keys)
+        collected['jointMinority'].append((minority[:, None] * n + minority[None, :]).ravel())
+        collected['minorityAt'].append((minority[:, None] * n + variantNumbers[None, :]).ravel())
+        collectedSize += len(keys)
+        if collectedSize >= flushSize:
+            flush()
+            collectedSize = 0
+    bam.close()
+    flush()
+
+    # Every pair with minority counts is also covered, so all counts can be lined up with the covered pairs
+    pairKeys, jointCoverage = sparse['jointCoverage']
+    counts = [jointCoverage]
+    for name in ['jointMinority', 'minorityAt']:
+        keys, values = sparse[name]
+        aligned = np.zeros(len(pairKeys), dtype=np.int64)
+        aligned[np.searchsorted(pairKeys, keys)] = values
+        counts.append(aligned)
+
+    return pairKeys, counts[0], counts[1], counts[2], reads
+
+
+
+def linkageMetrics(n, pairKeys, jointCoverage, jointMinority, minorityAt):
+    '''Computes the linkage metrics of the covered pairs from the co-occurrence counts. Probabilities are taken over the reads
+    covering both sites. JACCARD = P(i,j) / (P(i) + P(j) - P(i,j)), MUTUALD = P(i,j)^2 / (P(i) P(j)),
+    EXPENRD = P(i,j) / (P(i) P(j)), NJOINTP = P(i,j). Returns one array per metric, in the order of pairKeys'''
+    # The reads covering (i, j) also cover (j, i), so the pair with i and j swapped is always there
+    swapped = np.searchsorted(pairKeys, (pairKeys % n) * n + pairKeys // n)
+    coverage = jointCoverage.astype(float)
+    pJoint = jointMinority / coverage
+    pFirst = minorityAt / coverage
+    pSecond = minorityAt[swapped] / coverage
+    expected = pFirst * pSecond
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        metrics = {'JACCARD': np.where(pFirst + pSecond - pJoint > 0, pJoint / (pFirst + pSecond - pJoint), 0.0),
+                   'MUTUALD': np.where(expected > 0, pJoint ** 2 / expected, 0.0),
+                   'EXPENRD': np.where(expected > 0, pJoint / expected, 0.0),
+                   'NJOINTP': pJoint}
+
+    return {name: values.astype(np.float32) for name, values in metrics.items()}
+
+
+
+def linkageFilename(runDir, sample, recordPrefix, segment):
+    return os.path.join(runDir, sample, 'linkage', recordPrefix + segment + '_linkage.npz')
+
+
+
+def readLinkage(filename):
+    '''Reads a linkage file to a dict of arrays: positions (1-based), majorAlleles and minorityAlleles of the n variants, and
+    for every covered pair its variant numbers (first, second), the counts and the metrics'''
+    data = np.load(filename)
+    return {name: data[name] for name in data.files}
+
+
+
+def denseMatrix(linkage, name):
+    '''Makes an n x n matrix of one count or metric from readLinkage. Pairs no read covers are nan'''
+    n = len(linkage['positions'])
+    matrix = np.full((n, n), np.nan, dtype=np.float32 if linkage[name].dtype.kind == 'f' else np.float64)
+    matrix[linkage['first'], linkage['second']] = linkage[name]
+    return matrix
+
+
+
+def linkageSegment(runDir, sample, segment, recordPrefix, thresholds, minBaseQuality):
+    '''Counts and writes the linkage of one (sample, segment). Returns a status message'''
+    start = time.perf_counter()
+    variantFile = os.path.join(runDir, sample, 'tables', recordPrefix + segment + '-variants.txt')
+    bamFile = os.path.join(runDir, sample, recordPrefix + segment + '.bam')
+    if not os.path.exists(variantFile) or not os.path.exists(bamFile):
+        return sample + '\t' + segment + '\tSKIPPED\tNo variant table or BAM file'
+
+    positions, majorAlleles, minorityAlleles = passingVariants(variantFile, *thresholds)
+    if len(positions) == 0:
+        return sample + '\t' + segment + '\tSKIPPED\tNo passing minority variants'
+
+    try:
+        counts = countCooccurrence(bamFile, recordPrefix + segment, positions, minorityAlleles, minBaseQuality)
+    except (OSError, ValueError) as error:
+        return sample + '\t' + segment + '\tFAILED\t' + str(error)
+    pairKeys, jointCoverage, jointMinority, minorityAt, reads = counts
+    n = len(positions)
+    metrics = linkageMetrics(n, pairKeys, jointCoverage, jointMinority, minorityAt)
+
+    filename = linkageFilename(runDir, sample, recordPrefix, segment)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    np.savez_compressed(filename, positions=positions + 1, majorAlleles=majorAlleles, minorityAlleles=minorityAlleles,
+                        first=(pairKeys // n).astype(np.int32), second=(pairKeys % n).astype(np.int32),
+                        jointCoverage=jointCoverage, jointMinority=jointMinority, minorityAt=minorityAt, **metrics)
+
+    return sample + '\t' + segment + '\tOK\t' + str(n) + ' variants, ' + str(len(pairKeys)) + ' covered pairs, ' + str(reads) + ' reads, ' + str(round(time.perf_counter() - start, 2)) + ' s'
+
+
+
+
+
+#---------------------------------- MAIN -------------------------------------#
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Count linkage between minority variants from the IRMA BAM files and write JACCARD, MUTUALD, EXPENRD and NJOINTP for every covered pair of variants.')
+    parser.add_argument('runDir', nargs='?', default='.', help='Folder with the sample folders (default: current folder)')
+    parser.add_argument('--samples', nargs='+', help='Samples to run (default: every folder with a tables folder)')
+    parser.add_argument('--subtype', default='H3N2', choices=annotationRegistry.availableSubtypes())
+    parser.add_argument('-p', '--processes', type=int, default=1, help='Number of (sample, segment) units run at the same time. 0 uses all CPUs (default: 1)')
+    parser.add_argument('--minDepth', type=int, default=depthThreshold)
+    parser.add_argument('--minCount', type=int, default=countThreshold)
+    parser.add_argument('--minFrequency', type=float, default=freqThreshold)
+    parser.add_argument('--minQuality', type=float, default=qualThreshold, help='Minimum average quality of the minority allele')
+    parser.add_argument('--minBaseQuality', type=int, default=0, help='Only count read bases with at least this quality (default: 0)')
+    args = parser.parse_args()
+    processes = args.processes if args.processes > 0 else os.cpu_count()
+
+    annotation = annotationRegistry.loadAnnotation(args.subtype)
+    samples = args.samples
+    if samples is None:
+        samples = sorted([entry for entry in os.listdir(args.runDir) if os.path.isdir(os.path.join(args.runDir, entry, 'tables'))])
+    if len(samples) == 0:
+        print('No sample folder found. Exiting program.')
+        sys.exit(1)
+
+    thresholds = (args.minDepth, args.minCount, args.minFrequency, args.minQuality)
+    units = [(sample, segment) for sample in samples for segment in annotation['segments']]
+    if processes == 1:
+        results = [linkageSegment(args.runDir, sample, segment, annotation['recordPrefix'], thresholds, args.minBaseQuality) for sample, segment in units]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            results = list(pool.map(linkageSegment, [args.runDir] * len(units), [unit[0] for unit in units], [unit[1] for unit in units],
+                                    [annotation['recordPrefix']] * len(units), [thresholds] * len(units), [args.minBaseQuality] * len(units)))
+
+    print('Sample\tSegment\tStatus\tInfo')
+    for result in results:
+        print(result)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+#Runs the sweep dynamics pipeline scripts of the replicates made by sampling.py --replicates at the same time,
+#never using more than the CPU budget. Every finished replicate is written to <manifest>.state, so an interrupted
+#batch carries on where it stopped when started again. Failed replicates are run again on the next start.
+#The state file starts with a hash of the manifest, so progress of an older manifest (other seed, size or strata) is not reused.
+#Usage: python3 runReplicates.py <prefix_replicates.json> [--cpus 32] [--rerun]
+import sys, os, argparse, json, subprocess, time, hashlib
+
+
+
+#######################################################################################
+#                                      FUNCTIONS                                      #
+#######################################################################################
+
+def manifestHash(manifest):
+    '''Hash of the whole manifest (seed, size, strata and jobs). The state file is only valid for the manifest it was written for'''
+    return hashlib.sha1(json.dumps(manifest, sort_keys=True).encode()).hexdigest()
+
+
+
+def readState(stateFilename, manifestKey):
+    '''Returns the replicates already finished successfully, from the state file. A state file written for another manifest is removed'''
+    finished = set()
+    if os.path.exists(stateFilename):
+        stateFile = open(stateFilename, 'r')
+        if stateFile.readline().rstrip('\n') != '#manifest\t' + manifestKey:
+            stateFile.close()
+            print('The state file belongs to another version of the manifest. Starting over.')
+            os.remove(stateFilename)
+            return finished
+        for line in stateFile:
+            splitLine = line.rstrip('\n').split('\t')
+            if len(splitLine) >= 2 and splitLine[1] == 'OK':
+                finished.add(splitLine[0])
+        stateFile.close()
+
+    return finished
+
+
+
+def writeState(stateFilename, manifestKey, name, status, seconds, exitCode):
+    '''Adds one finished replicate to the state file. The file is flushed right away so nothing is lost if the batch is killed'''
+    newFile = not os.path.exists(stateFilename)
+    stateFile = open(stateFilename, 'a')
+    if newFile:
+        stateFile.write('#manifest\t' + manifestKey + '\n')
+    stateFile.write('\t'.join([name, status, str(round(seconds, 1)), str(exitCode)]) + '\n')
+    stateFile.close()
+
+
+
+def startJob(job, workDir, logDir):
+    '''Starts the pipeline script of one replicate. Output goes to <logDir>/<name>.log'''
+    logFile = open(os.path.join(logDir, job['name'] + '.log'), 'w')
+    process = subprocess.Popen(['bash', job['script']], cwd=workDir, stdout=logFile, stderr=subprocess.STDOUT)
+    logFile.close()
+
+    return process
+
+
+
+def runJobs(jobs, cpus, workDir, logDir, stateFilename, manifestKey):
+    '''Runs the jobs, starting the next one whenever enough of the CPU budget is free. A job needing more than the
+    whole budget is run alone. Returns the names of the failed jobs'''
+    waiting = list(jobs)
+    running = dict()
+    failed = []
+    freeCpus = cpus
+    try:
+        while len(waiting) > 0 or len(running) > 0:
+            #Start every waiting job that fits in the free CPUs (in manifest order)
+            for job in list(waiting):
+                threads = job.get('threads', 1)
+                if threads <= freeCpus or len(running) == 0:
+                    process = startJob(job, workDir, logDir)
+                    running[process.pid] = (job, process, time.perf_counter())
+                    freeCpus -= threads
+                    waiting.remove(job)
+                    print('Started ' + job['name'] + ' (' + str(threads) + ' threads)')
+
+            #Wait for any of them to finish
+            pid, status = os.waitpid(-1, 0)
+            if pid not in running:
+                continue
+            job, process, start = running.pop(pid)
+            process.returncode = os.waitstatus_to_exitcode(status) #Keeps Popen from waiting for it again
+            freeCpus += job.get('threads', 1)
+            seconds = time.perf_counter() - start
+
+            result = 'OK' if process.returncode == 0 else 'FAILED'
+            writeState(stateFilename, manifestKey, job['name'], result, seconds, process.returncode)
+            print(result + '\t' + job['name'] + '\t' + str(round(seconds, 1)) + ' s')
+            if result != 'OK':
+                failed.append(job['name'])
+
+    #Stop the running jobs. They are not in the state file, so they are run again next time
+    except KeyboardInterrupt:
+        for job, process, start in running.values():
+            process.kill()
+            process.wait()
+        print('\nInterrupted. ' + str(len(running)) + ' running replicate(s) stopped; start again to resume.')
+        sys.exit(1)
+
+    return failed
+
+
+
+
+
+#######################################################################################
+#                                         MAIN                                        #
+#######################################################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the sweep dynamics pipelines of the replicates from sampling.py --replicates under a CPU budget.')
+    parser.add_argument('manifest', help='<prefix>_replicates.json written by sampling.py')
+    parser.add_argument('--cpus', type=int, default=0, help='CPUs the replicates may use together. 0 uses all CPUs (default: 0)')
+    parser.add_argument('--rerun', action='store_true', help='Forget earlier progress and run every replicate')
+    args = parser.parse_args()
+    cpus = args.cpus if args.cpus > 0 else os.cpu_count()
+
+    try:
+        manifestFile = open(args.manifest, 'r')
+    except IOError as error:
+        print("Can't read manifest, reason: " + str(error))
+        sys.exit(1)
+    manifest = json.load(manifestFile)
+    manifestFile.close()
+
+    #The pipeline scripts are run from the folder of the manifest, like the single sweep dynamics script
+    workDir = os.path.dirname(os.path.abspath(args.manifest))
+    logDir = os.path.join(workDir, 'replicateLogs')
+    os.makedirs(logDir, exist_ok=True)
+    stateFilename = os.path.abspath(args.manifest) + '.state'
+    if args.rerun and os.path.exists(stateFilename):
+        os.remove(stateFilename)
+
+    manifestKey = manifestHash(manifest)
+    finished = readState(stateFilename, manifestKey)
+    jobs = [job for job in manifest['jobs'] if job['name'] not in finished]
+    print(str(len(manifest['jobs'])) + ' replicates, ' + str(len(manifest['jobs']) - len(jobs)) + ' already done. Running ' + str(len(jobs)) + ' with ' + str(cpus) + ' CPUs')
+
+    failed = runJobs(jobs, cpus, workDir, logDir, stateFilename, manifestKey)
+    if len(failed) > 0:
+        print(str(len(failed)) + ' replicate(s) failed: ' + ' '.join(failed) + '. See ' + logDir)
+        sys.exit(1)
+    print('All replicates done')
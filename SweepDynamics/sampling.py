@@ -1,186 +1,274 @@
-#!/usr/bin/env python3
-#Usage: python3 dataInfo.py <prefix_cds.fa>
-import sys, os, random
-from Bio import SeqIO
-from datetime import date
-
-
-
-#Month numbers belonging to the different seasons:
-Nseasons1 = ['10', '11', '12']
-Nseasons2 = ['01', '02', '03']
-Sseasons = ['04', '05', '06', '07', '08', '09']
-
-
-
-#Input argument
-if len(sys.argv) == 1:
-    filename = input('Please enter a name of a fasta file: ')
-elif len(sys.argv) == 2:
-    filename = sys.argv[1]
-else:
-    print('Usage: dataInfo.py <prefix_cds.fa>')
-    sys.exit(1)
-
-#Open file
-try:
-    infile = open(filename, 'r')
-except IOError as error:
-    print("Can't read file, reason: " + str(error) + "\n")
-    sys.exit(1)
-
-prefix = filename.split('.')[0].split('_')[0]
-
-
-
-
-#######################################################################################
-#                                   DATA GATHERING                                    #
-#######################################################################################
-
-#Make dict with headers belonging to every year
-entryCount = 0
-headerDict = dict()
-sequenceDict = dict()
-for seqEntry in SeqIO.parse(filename, "fasta"):
-    entryCount += 1
-
-    header = ' '.join((seqEntry.id).split('_'))
-    sequence = str(seqEntry.seq).upper()
-
-    d = header.split(' | ')[-1]
-    splitDate = d.split('-')
-    year = splitDate[0]
-    month = splitDate[1]
-    
-    #Sequences from October, Novembre and December belong to the following year
-    if month in ['10', '11', '12']:
-        year = str(int(year) + 1)
-    
-    #Save header with its corresponding year
-    if year in headerDict:
-        headerDict[year].append(header)
-    else:
-        headerDict[year] = [header]
-
-    #Save sequence with its header
-    if header not in sequenceDict:
-        sequenceDict[header] = sequence
-    else:
-        print('Warning! Duplicate header: ' + header)
-infile.close()
-
-
-#Print stats
-print(str(entryCount) + ' sequences in total\n')
-print('Year\t#Sequences')
-for year, list in headerDict.items():
-    print(year + '\t' + str(len(list)))
-print('\n')
-
-
-#Find year with fewest sequences
-minLength = None
-for headerList in headerDict.values():
-    if minLength is None or len(headerList) < minLength:
-        minLength = len(headerList)
-print('Sampling size: ' + str(minLength))
-
-
-
-
-#######################################################################################
-#                                      SAMPLING                                       #
-#######################################################################################
-
-#Extract X number of random headers for each year
-samplingDict = dict()
-for year, headerList in headerDict.items():
-    samplingList = random.choices(headerList, k = minLength)
-    samplingDict[year] = samplingList
-
-
-#Check the correct number of sequences has been extracted for each year
-for year, dict in samplingDict.items():
-    if len(dict) != minLength:
-        print('Warning: ' + year + ' has ' + str(len(dict)) + ' sequences (should be ' + str(minLength) + ')')
-
-
-#Add extracted identifiers to one list while also fixing header format
-sampleHeaders = []
-for list in samplingDict.values():
-    sampleHeaders.extend(list)
-
-
-
-#Open files
-outfileName = prefix + '_sampled_cds.fa'
-try:
-    infile = open(filename, 'r')
-    outfile = open(outfileName, 'w')
-except IOError as error:
-    print("Can't read file, reason: " + str(error) + "\n")
-    sys.exit(1)
-
-
-
-#Write new file with only the sampled sequences
-finalCount = 0
-for year, headerList in samplingDict.items():
-    for header in headerList:
-        finalCount += 1
-        outfile.write('>' + header + '\n')
-        outfile.write(sequenceDict[header] + '\n')
-infile.close()
-outfile.close()
-
-
-
-#######################################################################################
-#                                  FIND ROOT SEQUENCE                                 #
-#######################################################################################
-
-#Find oldest date = root date
-dates = []
-headerDict = {}
-for headerList in samplingDict.values():
-    for header in headerList:
-        d = header.split('|')[-1].strip()
-        splitDate = d.split('-')
-        year, month, day = int(splitDate[0]), int(splitDate[1]), int(splitDate[2])
-        dates.append(date(year, month, day))
-
-        if d in headerDict:
-            headerDict[d].append(header)
-        else:
-            headerDict[d] = [header]
-rootDate = min(dates)
-print('Date of root sequence: ' + str(rootDate))
-
-
-#Root header
-rootHeader = headerDict[str(rootDate)][0]
-print('Root sequence: ' + rootHeader)
-
-
-#######################################################################################
-#                                  WRITE BASH SCRIPT                                  #
-#######################################################################################
-
-identifier = rootHeader.split('|')[2].strip()
-
-bashFilename = prefix + '_sweepDynamics.sh'
-bashFile = open('../' + bashFilename, 'w')
-
-bashFile.write("#!/bin/bash\n")
-bashFile.write("CONDA_PATH=$(conda info | grep -i 'base environment' | awk '{print $4}')\n")
-bashFile.write("source $CONDA_PATH/etc/profile.d/conda.sh\n")
-bashFile.write("\n")
-bashFile.write("#Activate conda environment\n")
-bashFile.write("conda activate jukj_sweepDynamics\n")
-bashFile.write("\n")
-bashFile.write("#Run sweep dynamics without sampling\n")
-bashFile.write('bash ../docker_files/app/SDplotsPipeline/SDplot_pipeline.sh -l true -g false -i ' + prefix + '_sampled -o ' + prefix + '_sampled -r "' + identifier + '" -n 16 -p "png"')
-
-bashFile.close()
-print('Done!')
\ No newline at end of file
+#!/usr/bin/env python3
+#Draws the same number of sequences from every stratum (year by default) of a cds fasta and writes a sweep dynamics script
+#The fasta is read in two passes: the headers are indexed first (Common/headerIndex.py), then only the sampled records are read
+#With --replicates N, N samples (seeds seed, seed+1, ...) are written in the same pass, with a pipeline script each and a manifest for runReplicates.py
+#Usage: python3 sampling.py <prefix_cds.fa> [--strata year|season|region ...] [--size N] [--seed 1] [--replicates N] [--threads 16]
+import sys, os, random, argparse, json
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+import headerIndex
+import numpy as np
+
+
+
+#Month numbers belonging to the different seasons:
+Nseasons1 = ['10', '11', '12']
+Nseasons2 = ['01', '02', '03']
+Sseasons = ['04', '05', '06', '07', '08', '09']
+
+strataChoices = ['year', 'season', 'region']
+
+
+
+
+#######################################################################################
+#                                      FUNCTIONS                                      #
+#######################################################################################
+
+def requiredPrecision(strata):
+    '''Least precise collection date a sequence can have and still be binned. Year and season need the month'''
+    if 'year' in strata or 'season' in strata:
+        return headerIndex.monthPrecision
+    return headerIndex.noDate
+
+
+
+def stratumKeys(rows, strata):
+    '''Stratum of every index row, e.g. '2023' for year, 'N2023' for season or 'Denmark' for region. Several strata are joined with _'''
+    years = rows['date'].astype('datetime64[Y]').astype(np.int64) + 1970
+    months = rows['date'].astype('datetime64[M]').astype(np.int64) % 12 + 1
+    lateNorthern = np.isin(months, [int(month) for month in Nseasons1])
+    earlyNorthern = np.isin(months, [int(month) for month in Nseasons2])
+
+    keys = np.full(len(rows), '', dtype=object)
+    for stratum in strata:
+        if stratum == 'year':
+            #Sequences from October, Novembre and December belong to the following year
+            part = (years + lateNorthern).astype(str)
+        elif stratum == 'season':
+            #Northern season from October to March (named by the year it ends), southern season from April to September
+            part = np.where(lateNorthern | earlyNorthern, 'N', 'S').astype(object) + (years + lateNorthern).astype(str)
+        else:
+            part = np.array([location[1].strip() if len(location) > 1 else 'unknown' for location in np.char.split(rows['identifier'], '/')], dtype=object)
+        keys = np.where(keys == '', part.astype(object), keys + '_' + part.astype(object))
+
+    return keys.astype(str)
+
+
+
+def drawSample(stratumDict, size, seed):
+    '''Draws size rows from every stratum without replacement. Strata are sampled in sorted order so the seed gives the same result every time'''
+    generator = random.Random(seed)
+    samplingDict = dict()
+    for stratum in sorted(stratumDict):
+        samplingDict[stratum] = generator.sample(stratumDict[stratum], k = size)
+
+    return samplingDict
+
+
+
+def findRoot(rows, headers):
+    '''Finds the sampled sequence with the oldest full collection date (the first one if several have that date).
+    rows are the index rows of the headers, in the same order. Returns root date and header'''
+    candidates = np.flatnonzero(rows['precision'] == headerIndex.dayPrecision)
+    if len(candidates) == 0:
+        bestPrecision = int(rows['precision'].max())
+
+        #No dates at all (possible with --strata region); there is nothing to choose the root by
+        if bestPrecision == headerIndex.noDate:
+            print('Warning: no sampled sequence has a collection date. The root is arbitrary: the first sampled sequence is used')
+            return rows['date'][0], headers[0]
+
+        #No full dates; fall back on the most precise dates there are
+        candidates = np.flatnonzero(rows['precision'] == bestPrecision)
+        print('Warning: no sampled sequence has a full collection date. The root is chosen by ' +
+              {headerIndex.yearPrecision: 'year', headerIndex.monthPrecision: 'month'}[bestPrecision] + ' of collection')
+    root = candidates[np.argmin(rows['date'][candidates])]
+
+    return rows['date'][root], headers[root]
+
+
+
+def writeBashScript(filename, name, rootHeader, threads):
+    '''Writes the script running the sweep dynamics pipeline on <name>_cds.fa with the root sequence as reference'''
+    identifier = rootHeader.split('|')[2].strip()
+
+    bashFile = open(filename, 'w')
+    bashFile.write("#!/bin/bash\n")
+    bashFile.write("CONDA_PATH=$(conda info | grep -i 'base environment' | awk '{print $4}')\n")
+    bashFile.write("source $CONDA_PATH/etc/profile.d/conda.sh\n")
+    bashFile.write("\n")
+    bashFile.write("#Activate conda environment\n")
+    bashFile.write("conda activate jukj_sweepDynamics\n")
+    bashFile.write("\n")
+    bashFile.write("#Run sweep dynamics without sampling\n")
+    bashFile.write('bash ../docker_files/app/SDplotsPipeline/SDplot_pipeline.sh -l true -g false -i ' + name + ' -o ' + name + ' -r "' + identifier + '" -n ' + str(threads) + ' -p "png"')
+    bashFile.close()
+
+
+
+
+
+#Input argument
+parser = argparse.ArgumentParser(description='Sample the same number of sequences from every stratum of a cds fasta, without replacement.')
+parser.add_argument('filename', nargs='?', help='<prefix>_cds.fa (asked for if not given)')
+parser.add_argument('--strata', nargs='+', default=['year'], choices=strataChoices, help='What the sequences are grouped by (default: year)')
+parser.add_argument('--size', type=int, help='Sequences drawn per stratum (default: the size of the smallest stratum)')
+parser.add_argument('--seed', type=int, default=1, help='Seed of the random sampling (default: 1)')
+parser.add_argument('--replicates', type=int, default=0, help='Write this many independent samples instead of one (default: 0, one sample)')
+parser.add_argument('--threads', type=int, default=16, help='Threads given to each sweep dynamics pipeline (-n, default: 16)')
+args = parser.parse_args()
+
+filename = args.filename
+if filename is None:
+    filename = input('Please enter a name of a fasta file: ')
+
+#Open file
+if not os.path.isfile(filename):
+    print("Can't read file, reason: " + filename + " doesn't exist\n")
+    sys.exit(1)
+
+prefix = filename.split('.')[0].split('_')[0]
+
+
+
+
+#######################################################################################
+#                                   DATA GATHERING                                    #
+#######################################################################################
+
+#Pass one: index the headers (offset, date, identifier) without keeping any sequences
+index = headerIndex.readIndex(filename, 'sweep')
+entryCount = len(index)
+
+#Dates are already parsed (with their precision) in the index. Sequences whose date is too imprecise for the strata are left out
+precisionCounts = np.bincount(index['precision'], minlength=headerIndex.dayPrecision + 1)
+minPrecision = requiredPrecision(args.strata)
+for precision, description in [(headerIndex.noDate, 'no collection date'), (headerIndex.yearPrecision, 'only a collection year'),
+                               (headerIndex.monthPrecision, 'no collection day')]:
+    if precisionCounts[precision] > 0:
+        leftOut = ' and are left out' if precision < minPrecision else ''
+        print('Warning! ' + str(precisionCounts[precision]) + ' sequence(s) have ' + description + leftOut)
+dated = np.asarray(index[index['precision'] >= minPrecision])
+dated = dated[np.argsort(dated['offset'], kind='stable')]
+identifiers, identifierCounts = np.unique(dated['identifier'], return_counts=True)
+for identifier in identifiers[identifierCounts > 1]:
+    print('Warning! Duplicate identifier: ' + identifier)
+
+
+#Bin the rows (in file order) into strata and count them
+strata, stratumOfRow, stratumCounts = np.unique(stratumKeys(dated, args.strata), return_inverse=True, return_counts=True)
+rowsByStratum = np.split(np.argsort(stratumOfRow, kind='stable'), np.cumsum(stratumCounts)[:-1]) if len(dated) > 0 else []
+stratumDict = {stratum: rowList.tolist() for stratum, rowList in zip(strata, rowsByStratum)}
+
+
+#Print stats
+print(str(entryCount) + ' sequences in total\n')
+print('Stratum\t#Sequences')
+for stratum, rowList in stratumDict.items():
+    print(stratum + '\t' + str(len(rowList)))
+print('\n')
+
+
+#Find stratum with fewest sequences
+if len(stratumDict) == 0:
+    print('No sequences with a collection date found. Exiting program.')
+    sys.exit(1)
+minLength = int(stratumCounts.min())
+if args.size is not None:
+    if args.size > minLength:
+        print('Warning: --size ' + str(args.size) + ' is larger than the smallest stratum (' + str(minLength) + '). Using ' + str(minLength))
+    minLength = min(args.size, minLength)
+print('Sampling size: ' + str(minLength))
+
+
+
+
+#######################################################################################
+#                                      SAMPLING                                       #
+#######################################################################################
+
+#One sample: written in sampling order to <prefix>_sampled_cds.fa
+if args.replicates == 0:
+    #Extract X number of random rows for each stratum, without replacement
+    samplingDict = drawSample(stratumDict, minLength, args.seed)
+
+
+    #Check the correct number of sequences has been extracted for each stratum
+    for stratum, rowList in samplingDict.items():
+        if len(rowList) != minLength:
+            print('Warning: ' + stratum + ' has ' + str(len(rowList)) + ' sequences (should be ' + str(minLength) + ')')
+
+
+    #Add sampled rows to one list
+    sampleRows = dated[[rowNo for rowList in samplingDict.values() for rowNo in rowList]]
+
+
+    #Open files
+    outfileName = prefix + '_sampled_cds.fa'
+    try:
+        outfile = open(outfileName, 'w')
+    except IOError as error:
+        print("Can't read file, reason: " + str(error) + "\n")
+        sys.exit(1)
+
+
+    #Pass two: read only the sampled records and write them in sampling order
+    sampleHeaders = []
+    for seqID, sequence in headerIndex.readMatches(filename, sampleRows):
+        header = ' '.join(seqID.split('_'))
+        sampleHeaders.append(header)
+        outfile.write('>' + header + '\n')
+        outfile.write(sequence.decode() + '\n')
+    outfile.close()
+
+
+    #Find oldest date = root date, and write the pipeline script
+    rootDate, rootHeader = findRoot(sampleRows, sampleHeaders)
+    print('Date of root sequence: ' + str(rootDate))
+    print('Root sequence: ' + rootHeader)
+    writeBashScript('../' + prefix + '_sweepDynamics.sh', prefix + '_sampled', rootHeader, args.threads)
+
+
+
+#Replicates: every sample gets its own seed and <prefix>_rep<N>_sampled_cds.fa. All of them are written in one pass over the fasta
+else:
+    replicateNames = [prefix + '_rep' + str(replicate + 1) for replicate in range(args.replicates)]
+    members = dict()
+    for replicate in range(args.replicates):
+        for rowList in drawSample(stratumDict, minLength, args.seed + replicate).values():
+            for rowNo in rowList:
+                members.setdefault(rowNo, []).append(replicate)
+
+
+    #Pass two: read every sampled record once (in file order) and write it to the replicates it was drawn for
+    rowNumbers = sorted(members, key=lambda rowNo: dated[rowNo]['offset'])
+    outfiles = [open(name + '_sampled_cds.fa', 'w') for name in replicateNames]
+    replicateHeaders = [[] for name in replicateNames]
+    replicateRows = [[] for name in replicateNames]
+    for rowNo, (seqID, sequence) in zip(rowNumbers, headerIndex.readMatches(filename, dated[rowNumbers])):
+        header = ' '.join(seqID.split('_'))
+        record = '>' + header + '\n' + sequence.decode() + '\n'
+        for replicate in members[rowNo]:
+            outfiles[replicate].write(record)
+            replicateHeaders[replicate].append(header)
+            replicateRows[replicate].append(rowNo)
+    for outfile in outfiles:
+        outfile.close()
+
+
+    #Pipeline script for every replicate, and a manifest telling runReplicates.py how to run them
+    jobs = []
+    for name, headers, rowList in zip(replicateNames, replicateHeaders, replicateRows):
+        rootDate, rootHeader = findRoot(dated[rowList], headers)
+        print(name + '\tRoot sequence: ' + rootHeader + ' (' + str(rootDate) + ')')
+        writeBashScript('../' + name + '_sweepDynamics.sh', name + '_sampled', rootHeader, args.threads)
+        jobs.append({'name': name, 'script': name + '_sweepDynamics.sh', 'threads': args.threads})
+
+    manifestFilename = '../' + prefix + '_replicates.json'
+    manifestFile = open(manifestFilename, 'w')
+    json.dump({'seed': args.seed, 'size': minLength, 'strata': args.strata, 'jobs': jobs}, manifestFile, indent=1)
+    manifestFile.close()
+    print(str(args.replicates) + ' replicates written. Run them with:')
+    print('python3 ' + os.path.join(os.path.dirname(os.path.abspath(__file__)), 'runReplicates.py') + ' ' + os.path.abspath(manifestFilename) + ' --cpus <CPU budget>')
+
+print('Done!')